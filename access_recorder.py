@@ -0,0 +1,92 @@
+"""
+Access Recorder
+Okuma endpoint'lerindeki "son erişim" yazımlarını bellekte biriktirip toplu olarak yazar.
+
+Her okuma isteğinde update_one yapmak yerine touch() çağrılır; aynı doküman için
+gelen dokunuşlar tek bir zaman damgasına indirgenir ve birkaç saniyede bir
+tek bulk_write ile flush edilir.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class AccessRecorder:
+    def __init__(self, collection_name: str, field: str = "last_accessed", key: str = "id",
+                 flush_interval: float = 5.0):
+        self.collection_name = collection_name
+        self.field = field
+        self.key = key
+        self.flush_interval = flush_interval
+        self.db = None
+        self._pending: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def touch(self, doc_id: str, when: Optional[datetime] = None):
+        """Dokümana erişimi kaydet (DB'ye yazmaz)"""
+        if not doc_id:
+            return
+        when = when or datetime.utcnow()
+        current = self._pending.get(doc_id)
+        if current is None or when > current:
+            self._pending[doc_id] = when
+
+    def pending(self) -> Dict[str, datetime]:
+        """Henüz flush edilmemiş erişim zamanları"""
+        return dict(self._pending)
+
+    async def flush(self) -> int:
+        """Bekleyen erişimleri tek bulk_write ile yaz, yazılan doküman sayısını döndür"""
+        if self.db is None or not self._pending:
+            return 0
+
+        async with self._flush_lock:
+            batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            # $max: eski/geç gelen flush daha yeni bir zamanı ezmesin
+            operations = [
+                UpdateOne({self.key: doc_id}, {"$max": {self.field: when}})
+                for doc_id, when in batch.items()
+            ]
+            try:
+                await self.db[self.collection_name].bulk_write(operations, ordered=False)
+            except Exception as e:
+                logger.error(f"❌ Access recorder flush failed ({self.collection_name}): {e}")
+                # Yazılamayanları geri koy, bir sonraki turda tekrar denensin
+                for doc_id, when in batch.items():
+                    self.touch(doc_id, when)
+                return 0
+            return len(operations)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self, db):
+        """Periyodik flush görevini mevcut event loop üzerinde başlat"""
+        self.db = db
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Görevi durdur ve kalan erişimleri yaz"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Etkinlik yönetimi sıralaması (organizer=me) için kullanılan son erişim zamanları
+event_access_recorder = AccessRecorder("events")
@@ -8,7 +8,8 @@ from typing import List, Optional
 import logging
 import uuid
 from datetime import datetime
-from auth import get_current_user
+from auth import get_current_user, invalidate_principal
+from unread_counters import discount_deleted_message
 
 # Router oluştur
 admin_router = APIRouter(tags=["admin"])
@@ -284,13 +285,18 @@ async def admin_delete_message(
     global db
     
     # Try personal messages first
-    result = await db.messages.delete_one({"id": message_id})
-    
-    if result.deleted_count == 0:
+    deleted = await db.messages.find_one_and_delete({"id": message_id})
+    if deleted:
+        await discount_deleted_message(db, deleted)
+    else:
         # Try group messages
-        result = await db.group_messages.delete_one({"id": message_id})
+        deleted = await db.group_messages.find_one_and_delete({"id": message_id})
+        if deleted:
+            group = await db.group_chats.find_one({"id": deleted.get("group_id")}, {"id": 1, "member_ids": 1})
+            if group:
+                await discount_deleted_message(db, deleted, group)
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Mesaj bulunamadı")
     
     logging.warning(f"🗑️ Admin {admin_id} deleted message {message_id}")
@@ -388,6 +394,7 @@ async def admin_update_user_status(
         {"id": user_id},
         {"$set": {"status": status, "updated_at": datetime.utcnow().isoformat()}}
     )
+    invalidate_principal(user_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
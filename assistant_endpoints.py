@@ -10,7 +10,7 @@ from pydantic import BaseModel
 import uuid
 import logging
 
-from auth import get_current_user
+from auth import get_current_user, invalidate_principal
 
 logger = logging.getLogger(__name__)
 
@@ -394,6 +394,7 @@ async def accept_invitation(
                     }
                 }
             )
+            invalidate_principal(current_user_id)
         
         # Owner'a bildirim gönder
         notification = {
@@ -614,6 +615,7 @@ async def remove_assistant(
                         "$unset": {"previous_user_type": ""}
                     }
                 )
+                invalidate_principal(assistant["assistant_user_id"])
         
         # Yardımcıya bildirim gönder
         notification = {
@@ -1,9 +1,13 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends, Header, Request
 from fastapi.security import OAuth2PasswordBearer
+from cachetools import TTLCache
 import os
 
 # Placeholder for OAuth - will be implemented with actual keys
@@ -14,12 +18,83 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Principal cache: user_id -> {id, user_type}
+# Her worker process'in kendi cache'i var; profil/rol/askıya alma endpoint'leri
+# invalidate_principal() ile kaydı düşürür, TTL diğer worker'lardaki bayat kayıtları sınırlar.
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_PROJECTION = {"_id": 0, "id": 1, "user_type": 1}
+
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+
+# bcrypt çağrısı ~200ms CPU; async handler'larda event loop'u bloklamaması için
+# sınırlı bir thread pool'da çalıştırılır (bcrypt hash sırasında GIL'i bırakır).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+
+_hash_metrics = {
+    "queued": 0,          # executor'da bekleyen + çalışan iş sayısı
+    "peak_queued": 0,
+    "completed": 0,
+    "total_wait_ms": 0.0,  # kuyrukta bekleme süresi toplamı
+    "total_run_ms": 0.0,   # bcrypt çalışma süresi toplamı
+}
+
+
+async def _run_hash_job(func, *args):
+    submitted = time.perf_counter()
+    started = {}
+
+    def job():
+        started["at"] = time.perf_counter()
+        return func(*args)
+
+    _hash_metrics["queued"] += 1
+    _hash_metrics["peak_queued"] = max(_hash_metrics["peak_queued"], _hash_metrics["queued"])
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, job)
+    finally:
+        finished = time.perf_counter()
+        _hash_metrics["queued"] -= 1
+        _hash_metrics["completed"] += 1
+        start = started.get("at", finished)
+        _hash_metrics["total_wait_ms"] += (start - submitted) * 1000
+        _hash_metrics["total_run_ms"] += (finished - start) * 1000
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password'ün event loop'u bloklamayan versiyonu"""
+    return await _run_hash_job(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash'in event loop'u bloklamayan versiyonu"""
+    return await _run_hash_job(get_password_hash, password)
+
+
+def get_hash_executor_metrics() -> dict:
+    """Hash executor kuyruk derinliği ve ortalama bekleme/çalışma süreleri"""
+    completed = _hash_metrics["completed"]
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "queue_depth": _hash_metrics["queued"],
+        "peak_queue_depth": _hash_metrics["peak_queued"],
+        "completed": completed,
+        "avg_wait_ms": round(_hash_metrics["total_wait_ms"] / completed, 2) if completed else 0.0,
+        "avg_run_ms": round(_hash_metrics["total_run_ms"] / completed, 2) if completed else 0.0,
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -50,20 +125,50 @@ async def get_current_user(token: str = Depends(oauth2_scheme), request: Request
             detail="Kimlik doğrulanamadı"
         )
     
-    # Token'da user_type varsa kullan, yoksa veritabanından al
+    # Token'da user_type varsa kullan, yoksa principal cache / veritabanından al
     user_type = payload.get("user_type")
     
     if not user_type and request and hasattr(request.app.state, 'db'):
-        db = request.app.state.db
-        user = await db.users.find_one({"id": user_id})
-        if user:
-            user_type = user.get("user_type", "player")
+        principal = await load_principal(request.app.state.db, user_id)
+        if principal:
+            user_type = principal.get("user_type") or "player"
     
     return {"id": user_id, "user_type": user_type or "player"}
 
 # Alias for compatibility
 get_current_active_user = get_current_user
 
+
+def _principal_from_user(user: dict) -> dict:
+    return {
+        "id": user.get("id"),
+        "user_type": user.get("user_type", "player"),
+    }
+
+
+async def load_principal(db, user_id: str) -> Optional[dict]:
+    """Kullanıcının kimlik özetini cache'ten döndür, yoksa tek projection sorgusuyla yükle"""
+    principal = _principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+    
+    user = await db.users.find_one({"id": user_id}, PRINCIPAL_PROJECTION)
+    if not user:
+        return None
+    principal = _principal_from_user(user)
+    _principal_cache[user_id] = principal
+    return principal
+
+
+def invalidate_principal(user_id: str):
+    """Kullanıcı dokümanı (rol, yetki, askıya alma, silme) değiştiğinde çağrılır"""
+    _principal_cache.pop(user_id, None)
+
+
+def clear_principal_cache():
+    _principal_cache.clear()
+
+
 async def get_current_user_optional(authorization: Optional[str] = Header(None)):
     """Get current user if authenticated, otherwise return None"""
     if not authorization or not authorization.startswith("Bearer "):
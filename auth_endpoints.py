@@ -9,10 +9,11 @@ import logging
 
 from models import UserCreate, UserLogin, User, VerificationCode, VerifyRequest
 from auth import (
-    get_password_hash, verify_password, create_access_token,
+    get_password_hash_async, verify_password_async, create_access_token,
     get_current_user, decode_token
 )
 from verification_service import VerificationService
+from rating_aggregates import apply_review_rating
 
 logger = logging.getLogger(__name__)
 
@@ -100,7 +101,7 @@ async def register(request: Request):
                 detail="Bu email zaten kayıtlı"
             )
         
-        hashed_password = get_password_hash(password)
+        hashed_password = await get_password_hash_async(password)
         
         user_dict = {
             "id": str(uuid.uuid4()),
@@ -154,9 +155,10 @@ async def register(request: Request):
         await db.reviews.insert_one(welcome_review)
         
         # Update user's rating
+        await apply_review_rating(db, welcome_review)
         await db.users.update_one(
             {"id": user_dict["id"]},
-            {"$set": {"rating": 5.0, "review_count": 1, "average_rating": 5.0}}
+            {"$set": {"rating": 5.0, "average_rating": 5.0}}
         )
         
         access_token = create_access_token(data={"sub": user_dict["id"]})
@@ -192,7 +194,7 @@ async def login(user_data: UserLogin, request: Request):
     ip_address = request.client.host if request.client else None
     
     user = await db.users.find_one({"email": user_data.email})
-    if not user or not verify_password(user_data.password, user["hashed_password"]):
+    if not user or not await verify_password_async(user_data.password, user["hashed_password"]):
         # Başarısız giriş log'u
         if user:
             await log_user_activity(user["id"], "login", "failed", {"method": "email", "reason": "wrong_password"}, ip_address)
@@ -0,0 +1,39 @@
+"""
+Rating Aggregates Backfill
+Kullanıcı dokümanlarındaki rating_sum / review_count / rating_distribution
+alanlarını mevcut değerlendirmelerden hesaplar.
+
+GET /users, /users/{id} ve /coaches ortalamayı artık bu alanlardan okur;
+deploy'dan önce çalıştırılmalıdır. Script idempotent'tir ve sapma onarımı
+için tekrar çalıştırılabilir.
+
+    python backfill_rating_aggregates.py
+"""
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from rating_aggregates import recompute_rating_aggregates
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# MongoDB connection
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+client = AsyncIOMotorClient(MONGO_URL)
+db = client[os.getenv("DB_NAME", "sports_management")]
+
+
+async def main():
+    result = await recompute_rating_aggregates(db)
+    logger.info(f"✅ Backfill completed: {result}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,99 +1,196 @@
 """
 Background Scheduler for Event Reminders
 Checks every minute for matches that need reminders
+
+Job'lar uygulama event loop'unda (AsyncIOScheduler) ve lifespan'in Motor
+client'ı ile çalışır. Her job için üst üste binme engellenir (önceki çalışma
+bitmeden gelen tetik atlanır), süre limiti aşımı loglanır ve job metrikleri
+/health/metrics üzerinden izlenebilir.
 """
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
 from typing import Dict, List
 import logging
 import asyncio
 import os
+import time
 import uuid
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from unread_counters import reconcile_unread_counters
+from user_calendar import repair_user_calendar
+from field_availability import expire_payment_holds, release_reservation
+from match_reminders import sync_upcoming_match_reminders
+from job_lock import run_exclusive
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Kargo takibinde Geliver'e aynı anda yapılacak en fazla sorgu
+CARGO_TRACKING_CONCURRENCY = int(os.getenv("CARGO_TRACKING_CONCURRENCY", "8"))
+
+# Job çalışırken heartbeat ile uzatılan lease süresi (worker çökerse bu süre sonra devralınır)
+JOB_LEASE_TTL = 60
+
 class EventReminderScheduler:
     def __init__(self, db, push_service):
         self.db = db
         self.push_service = push_service
-        self.scheduler = BackgroundScheduler()
-        self._mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-        self._db_name = os.environ.get('DB_NAME', 'match_alert')
-        
-    def _get_fresh_db_connection(self):
-        """Create a fresh MongoDB connection for background tasks"""
-        client = AsyncIOMotorClient(self._mongo_url)
-        return client[self._db_name]
+        self.scheduler = AsyncIOScheduler()
+        self._running: Dict[str, float] = {}
+        self._metrics: Dict[str, dict] = {}
     
-    def _run_async_task(self, coro_func):
-        """Run async function with fresh event loop and db connection"""
+    async def _run_job(self, job_id: str, coro_func, max_runtime: float, interval: float):
+        """
+        Job'u uygulama db'si ile çalıştır: overlap koruması + süre/hata metrikleri.
+        Lease kilidi sayesinde birden fazla worker'da aynı periyotta yalnızca biri çalıştırır.
+        """
+        metrics = self._metrics.setdefault(job_id, {
+            "runs": 0, "failures": 0, "skipped_overlaps": 0, "skipped_other_worker": 0, "overruns": 0,
+            "last_started_at": None, "last_duration_ms": None, "max_duration_ms": 0.0,
+            "last_error": None, "max_runtime_s": max_runtime,
+        })
+        if job_id in self._running:
+            # Önceki çalışma hâlâ sürüyor; aynı job'u paralel başlatma
+            metrics["skipped_overlaps"] += 1
+            running_for = time.monotonic() - self._running[job_id]
+            logger.warning(f"⏭️ Job {job_id} still running ({running_for:.0f}s), skipping this tick")
+            return
+        
+        async def invoke():
+            result = await coro_func(self.db)
+            if isinstance(result, dict):
+                # Job özet döndürüyorsa (ör. kargo takip süreleri) metriklerde göster
+                metrics["last_result"] = result
+        
+        self._running[job_id] = time.monotonic()
+        started_at = datetime.utcnow()
+        ran = True
         try:
-            # Create new event loop for this thread
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # Create fresh db connection
-            fresh_db = self._get_fresh_db_connection()
-            
-            try:
-                # Run the coroutine
-                loop.run_until_complete(coro_func(fresh_db))
-            finally:
-                # Close the loop
-                loop.close()
+            ran = await run_exclusive(
+                self.db, f"scheduler:{job_id}", invoke,
+                ttl=JOB_LEASE_TTL, min_interval=interval * 0.8
+            )
         except Exception as e:
-            logger.error(f"Error in async task: {str(e)}")
+            metrics["failures"] += 1
+            metrics["last_error"] = str(e)
+            logger.error(f"Error in scheduled job {job_id}: {str(e)}")
+        finally:
+            duration = time.monotonic() - self._running.pop(job_id)
+        
+        if not ran:
+            metrics["skipped_other_worker"] += 1
+            return
+        metrics["last_started_at"] = started_at
+        metrics["runs"] += 1
+        metrics["last_duration_ms"] = round(duration * 1000, 1)
+        metrics["max_duration_ms"] = max(metrics["max_duration_ms"], metrics["last_duration_ms"])
+        if duration > max_runtime:
+            metrics["overruns"] += 1
+            logger.warning(f"🐢 Job {job_id} took {duration:.1f}s (limit {max_runtime:.0f}s)")
+    
+    def _add_job(self, coro_func, trigger, job_id: str, name: str, max_runtime: float):
+        self.scheduler.add_job(
+            func=self._run_job,
+            trigger=trigger,
+            args=[job_id, coro_func, max_runtime, trigger.interval.total_seconds()],
+            id=job_id,
+            name=name,
+            replace_existing=True,
+            coalesce=True,
+            # Overlap'i _run_job yönetir (skip metriği için); APScheduler'ın kendi
+            # "max instances reached" uyarısına düşmemesi için limit yüksek tutulur
+            max_instances=2,
+            misfire_grace_time=60
+        )
+    
+    def job_metrics(self) -> Dict[str, dict]:
+        """Job bazlı çalışma metrikleri ve bir sonraki çalışma zamanları"""
+        result = {}
+        for job in self.scheduler.get_jobs():
+            metrics = dict(self._metrics.get(job.id, {}))
+            metrics["name"] = job.name
+            metrics["next_run_at"] = job.next_run_time
+            metrics["running"] = job.id in self._running
+            result[job.id] = metrics
+        return result
         
     def start(self):
-        """Start the background scheduler"""
+        """Start the background scheduler (uygulama event loop'u içinde çağrılmalı)"""
         # Run every hour for event reminders
-        self.scheduler.add_job(
-            func=self._check_event_reminders_sync,
-            trigger=IntervalTrigger(hours=1),
-            id='event_reminder_job',
+        self._add_job(
+            self._check_event_reminders_with_db,
+            IntervalTrigger(hours=1),
+            job_id='event_reminder_job',
             name='Check event reminders every hour',
-            replace_existing=True
+            max_runtime=300
         )
         
-        # Run every minute for match reminders (30 min and 5 min before)
-        self.scheduler.add_job(
-            func=self._check_match_reminders_sync,
-            trigger=IntervalTrigger(minutes=1),
-            id='match_reminder_job',
-            name='Check match reminders every minute',
-            replace_existing=True
+        # Match reminders (30 min and 5 min before) are fired by match_reminder_wheel;
+        # this job re-syncs due reminders for matches in the next 2 hours as a safety net
+        self._add_job(
+            sync_upcoming_match_reminders,
+            IntervalTrigger(minutes=30),
+            job_id='match_reminder_sync_job',
+            name='Sync due match reminders for upcoming matches',
+            max_runtime=120
         )
         
         # Run every 5 minutes for completed reservations/events review reminders
-        self.scheduler.add_job(
-            func=self._check_review_reminders_sync,
-            trigger=IntervalTrigger(minutes=5),
-            id='review_reminder_job',
+        self._add_job(
+            self._check_review_reminders_with_db,
+            IntervalTrigger(minutes=5),
+            job_id='review_reminder_job',
             name='Check for completed reservations/events to send review reminders',
-            replace_existing=True
+            max_runtime=240
         )
         
         # Run every 10 minutes for marketplace auto-approval
-        self.scheduler.add_job(
-            func=self._check_marketplace_auto_approval_sync,
-            trigger=IntervalTrigger(minutes=10),
-            id='marketplace_auto_approval_job',
+        self._add_job(
+            self._check_marketplace_auto_approval_with_db,
+            IntervalTrigger(minutes=10),
+            job_id='marketplace_auto_approval_job',
             name='Auto-approve delivered orders after 1 day',
-            replace_existing=True
+            max_runtime=300
         )
         
         # Run every 6 hours for cargo tracking
-        self.scheduler.add_job(
-            func=self._check_cargo_tracking_sync,
-            trigger=IntervalTrigger(hours=6),
-            id='cargo_tracking_job',
+        self._add_job(
+            self._check_cargo_tracking_with_db,
+            IntervalTrigger(hours=6),
+            job_id='cargo_tracking_job',
             name='Track cargo shipments every 6 hours',
-            replace_existing=True
+            max_runtime=1800
+        )
+        
+        # Run every 6 hours to repair drift in materialized unread counters
+        self._add_job(
+            reconcile_unread_counters,
+            IntervalTrigger(hours=6),
+            job_id='unread_counter_reconcile_job',
+            name='Reconcile user unread message counters',
+            max_runtime=1800
+        )
+        
+        # Run every 6 hours to repair drift in the user_calendar projection
+        self._add_job(
+            repair_user_calendar,
+            IntervalTrigger(hours=6),
+            job_id='user_calendar_repair_job',
+            name='Check and repair user calendar projection',
+            max_runtime=1800
+        )
+        
+        # Run every 5 minutes to free field hours held by abandoned payments
+        self._add_job(
+            expire_payment_holds,
+            IntervalTrigger(minutes=5),
+            job_id='payment_hold_expiry_job',
+            name='Expire unpaid reservation holds',
+            max_runtime=240
         )
         
         self.scheduler.start()
@@ -102,73 +199,36 @@ class EventReminderScheduler:
     
     def stop(self):
         """Stop the background scheduler"""
-        self.scheduler.shutdown()
+        self.scheduler.shutdown(wait=False)
         logger.info("Event reminder scheduler stopped")
     
-    # Sync wrappers for scheduler - use fresh db connection
-    def _check_event_reminders_sync(self):
-        """Sync wrapper for check_event_reminders"""
-        self._run_async_task(self._check_event_reminders_with_db)
-    
-    def _check_match_reminders_sync(self):
-        """Sync wrapper for check_match_reminders"""
-        self._run_async_task(self._check_match_reminders_with_db)
-    
-    def _check_review_reminders_sync(self):
-        """Sync wrapper for check_review_reminders"""
-        self._run_async_task(self._check_review_reminders_with_db)
-    
-    def _check_marketplace_auto_approval_sync(self):
-        """Sync wrapper for marketplace auto-approval"""
-        self._run_async_task(self._check_marketplace_auto_approval_with_db)
-    
-    def _check_cargo_tracking_sync(self):
-        """Sync wrapper for cargo tracking"""
-        self._run_async_task(self._check_cargo_tracking_with_db)
-    
-    async def _check_event_reminders_with_db(self, fresh_db):
-        """Check event reminders with fresh db connection"""
+    async def _check_event_reminders_with_db(self, db):
+        """Check event reminders with the application db"""
         try:
             logger.info("Checking for event and reservation reminders...")
             now = datetime.utcnow()
             
             # Check for events 24 hours away
-            await self._check_24hour_reminders(fresh_db, now)
+            await self._check_24hour_reminders(db, now)
             
             # Check for events 1 hour away
-            await self._check_1hour_reminders(fresh_db, now)
+            await self._check_1hour_reminders(db, now)
             
             logger.info("Event and reservation reminder check completed")
         except Exception as e:
             logger.error(f"Error in check_event_reminders: {str(e)}")
     
-    async def _check_match_reminders_with_db(self, fresh_db):
-        """Check match reminders with fresh db connection"""
-        try:
-            logger.info("🏟️ Checking for match reminders...")
-            now = datetime.utcnow()
-            
-            # Check for 30-minute reminders (players only)
-            await self._check_30min_match_reminders(fresh_db, now)
-            
-            # Check for 5-minute reminders (players and referees)
-            await self._check_5min_match_reminders(fresh_db, now)
-            
-            logger.info("🏟️ Match reminder check completed")
-        except Exception as e:
-            logger.error(f"Error in check_match_reminders: {str(e)}")
-    
-    async def _check_review_reminders_with_db(self, fresh_db):
-        """Check review reminders with fresh db connection"""
+    async def _check_review_reminders_with_db(self, db):
+        """Check review reminders with the application db"""
         try:
             logger.info("📝 Checking for review reminders...")
             now = datetime.utcnow()
             
             # Check for completed reservations that need review reminders
-            await self._check_reservation_review_reminders(fresh_db, now)
+            await self._check_reservation_review_reminders(db, now)
             
             # Check for completed events that need review reminders
-            await self._check_event_review_reminders(fresh_db, now)
+            await self._check_event_review_reminders(db, now)
             
             logger.info("📝 Review reminder check completed")
         except Exception as e:
@@ -254,103 +314,6 @@ class EventReminderScheduler:
         except Exception as e:
             logger.error(f"Error in _check_1hour_reminders: {str(e)}")
     
-    async def _check_30min_match_reminders(self, db, now):
-        """Send reminders to players 30 minutes before match"""
-        try:
-            start_time = now + timedelta(minutes=28)
-            end_time = now + timedelta(minutes=32)
-            
-            matches = await db.event_matches.find({
-                "status": {"$in": ["scheduled", "in_progress"]},
-                "scheduled_time": {
-                    "$gte": start_time,
-                    "$lte": end_time
-                }
-            }).to_list(length=500)
-            
-            for match in matches:
-                existing = await db.notifications.find_one({
-                    "related_id": match.get("id"),
-                    "type": "match_reminder_30min"
-                })
-                
-                if not existing:
-                    # Send to participants
-                    for participant_key in ["participant1_id", "participant2_id"]:
-                        user_id = match.get(participant_key)
-                        if user_id:
-                            notification = {
-                                "id": str(__import__('uuid').uuid4()),
-                                "user_id": user_id,
-                                "type": "match_reminder_30min",
-                                "title": "🏟️ Maç 30 Dakika Sonra",
-                                "message": "Maçınız 30 dakika sonra başlıyor!",
-                                "related_id": match.get("id"),
-                                "read": False,
-                                "created_at": now
-                            }
-                            await db.notifications.insert_one(notification)
-                    
-                    logger.info(f"30min reminder sent for match: {match.get('id')}")
-        except Exception as e:
-            logger.error(f"Error in _check_30min_match_reminders: {str(e)}")
-    
-    async def _check_5min_match_reminders(self, db, now):
-        """Send reminders to players and referees 5 minutes before match"""
-        try:
-            start_time = now + timedelta(minutes=4)
-            end_time = now + timedelta(minutes=6)
-            
-            matches = await db.event_matches.find({
-                "status": {"$in": ["scheduled", "in_progress"]},
-                "scheduled_time": {
-                    "$gte": start_time,
-                    "$lte": end_time
-                }
-            }).to_list(length=500)
-            
-            for match in matches:
-                existing = await db.notifications.find_one({
-                    "related_id": match.get("id"),
-                    "type": "match_reminder_5min"
-                })
-                
-                if not existing:
-                    # Send to participants
-                    for participant_key in ["participant1_id", "participant2_id"]:
-                        user_id = match.get(participant_key)
-                        if user_id:
-                            notification = {
-                                "id": str(__import__('uuid').uuid4()),
-                                "user_id": user_id,
-                                "type": "match_reminder_5min",
-                                "title": "🏟️ Maç 5 Dakika Sonra",
-                                "message": "Maçınız 5 dakika sonra başlıyor!",
-                                "related_id": match.get("id"),
-                                "read": False,
-                                "created_at": now
-                            }
-                            await db.notifications.insert_one(notification)
-                    
-                    # Send to referee if assigned
-                    referee_id = match.get("referee_id")
-                    if referee_id:
-                        notification = {
-                            "id": str(__import__('uuid').uuid4()),
-                            "user_id": referee_id,
-                            "type": "match_reminder_5min_referee",
-                            "title": "🏟️ Hakemlik Göreviniz 5 Dakika Sonra",
-                            "message": "Hakemlik yapacağınız maç 5 dakika sonra başlıyor!",
-                            "related_id": match.get("id"),
-                            "read": False,
-                            "created_at": now
-                        }
-                        await db.notifications.insert_one(notification)
-                    
-                    logger.info(f"5min reminder sent for match: {match.get('id')}")
-        except Exception as e:
-            logger.error(f"Error in _check_5min_match_reminders: {str(e)}")
-    
     async def _check_reservation_review_reminders(self, db, now):
         """Check for completed reservations that need review reminders"""
         try:
@@ -563,10 +526,12 @@ class EventReminderScheduler:
                     
                     # Update reservation status to completed if it was confirmed
                     if reservation.get("status") == "confirmed":
-                        await db.reservations.update_one(
-                            {"id": reservation_id},
+                        completed = await db.reservations.find_one_and_update(
+                            {"id": reservation_id, "status": "confirmed"},
                             {"$set": {"status": "completed"}}
                         )
+                        if completed:
+                            await release_reservation(db, completed)
                         
         except Exception as e:
             logger.error(f"Error in _check_reservation_review_reminders_v2: {str(e)}") 
@@ -1615,7 +1580,7 @@ class EventReminderScheduler:
             logger.error(f"Error in check_order_review_reminders: {str(e)}")
 
 
-    async def _check_marketplace_auto_approval_with_db(self, fresh_db):
+    async def _check_marketplace_auto_approval_with_db(self, db):
         """Auto-approve delivered orders after 1 day"""
         try:
             logger.info("🛒 Checking for orders to auto-approve...")
@@ -1625,7 +1590,7 @@ class EventReminderScheduler:
             # 1. Status is "delivered"
             # 2. auto_approve_deadline has passed
             # 3. Not yet auto-approved
-            orders_to_approve = await fresh_db.marketplace_transactions.find({
+            orders_to_approve = await db.marketplace_transactions.find({
                 "status": "delivered",
                 "auto_approve_deadline": {"$lt": now},
                 "auto_approved": {"$ne": True}
@@ -1645,11 +1610,11 @@ class EventReminderScheduler:
                     listing_id = order.get("listing_id")
                     
                     # Get listing info
-                    listing = await fresh_db.marketplace_listings.find_one({"id": listing_id})
+                    listing = await db.marketplace_listings.find_one({"id": listing_id})
                     listing_title = listing.get("title", "Ürün") if listing else "Ürün"
                     
                     # Update order status
-                    await fresh_db.marketplace_transactions.update_one(
+                    await db.marketplace_transactions.update_one(
                         {"id": order_id},
                         {"$set": {
                             "status": "approved",
@@ -1659,7 +1624,7 @@ class EventReminderScheduler:
                     )
                     
                     # Update listing status
-                    await fresh_db.marketplace_listings.update_one(
+                    await db.marketplace_listings.update_one(
                         {"id": listing_id},
                         {"$set": {"status": "completed"}}
                     )
@@ -1682,7 +1647,7 @@ class EventReminderScheduler:
                         "read": False,
                         "created_at": now
                     }
-                    await fresh_db.notifications.insert_one(buyer_notification)
+                    await db.notifications.insert_one(buyer_notification)
                     
                     # Create notification for seller
                     seller_notification = {
@@ -1701,10 +1666,10 @@ class EventReminderScheduler:
                         "read": False,
                         "created_at": now
                     }
-                    await fresh_db.notifications.insert_one(seller_notification)
+                    await db.notifications.insert_one(seller_notification)
                     
                     # Create notification for admins
-                    admins = await fresh_db.users.find({"user_type": "admin"}).to_list(100)
+                    admins = await db.users.find({"user_type": "admin"}).to_list(100)
                     for admin in admins:
                         admin_notification = {
                             "id": str(uuid.uuid4()),
@@ -1723,7 +1688,7 @@ class EventReminderScheduler:
                             "read": False,
                             "created_at": now
                         }
-                        await fresh_db.notifications.insert_one(admin_notification)
+                        await db.notifications.insert_one(admin_notification)
                     
                     logger.info(f"✅ Order {order_id} auto-approved, notifications sent")
                     
@@ -1739,185 +1704,193 @@ class EventReminderScheduler:
     # CARGO TRACKING (6 saatte bir)
     # ============================================
     
-    async def _check_cargo_tracking_with_db(self, fresh_db):
+    async def _check_cargo_tracking_with_db(self, db):
         """
         6 saatte bir çalışan kargo takip sistemi.
         - Tüm 'shipped' durumundaki işlemleri kontrol et
-        - Geliver API ile kargo durumunu sorgula
-        - Durum değişikliklerinde alıcı ve satıcıya bildirim gönder
+        - Geliver API ile kargo durumunu sınırlı eşzamanlılıkla sorgula
+        - Durum değişikliklerini toplu yaz, alıcı ve satıcıya bildirim gönder
+        Çalışma özeti (süre, API gecikmesi, hata sayısı) job metriklerine yazılır.
         """
         try:
             logger.info("📦 Starting cargo tracking check...")
+            run_started = time.monotonic()
             now = datetime.utcnow()
             
             # 'shipped' veya 'label_created' veya 'in_transit' durumundaki işlemleri bul
-            transactions_to_track = await fresh_db.marketplace_transactions.find({
+            transactions_to_track = await db.marketplace_transactions.find({
                 "status": {"$in": ["shipped", "label_created", "in_transit", "out_for_delivery", "completed"]},
                 "tracking_code": {"$exists": True, "$ne": ""},
                 "shipping_status": {"$nin": ["delivered", "returned", "failed"]}  # Henüz teslim edilmemişler
+            }, {
+                "_id": 0, "id": 1, "tracking_code": 1, "barcode": 1, "shipping_provider": 1,
+                "buyer_id": 1, "seller_id": 1, "listing_id": 1, "shipping_status": 1
             }).to_list(500)
             
             if not transactions_to_track:
                 logger.info("📦 No shipments to track")
-                return
+                return {"shipments": 0}
             
             logger.info(f"📦 Found {len(transactions_to_track)} shipments to track")
             
             # Geliver tracking fonksiyonunu import et
-            from geliver_endpoints import track_shipment_by_code, SHIPPING_STATUS_TEXT
-            
-            status_updates = 0
-            notifications_sent = 0
-            
-            for transaction in transactions_to_track:
-                try:
-                    transaction_id = transaction.get("id")
-                    tracking_code = transaction.get("tracking_code") or transaction.get("barcode")
-                    provider_code = transaction.get("shipping_provider")
-                    buyer_id = transaction.get("buyer_id")
-                    seller_id = transaction.get("seller_id")
-                    listing_id = transaction.get("listing_id")
-                    old_shipping_status = transaction.get("shipping_status", "unknown")
-                    
-                    if not tracking_code:
-                        continue
-                    
-                    # Geliver API'ye sorgula
-                    tracking_result = await track_shipment_by_code(tracking_code, provider_code)
-                    
-                    if not tracking_result.get("success"):
-                        logger.warning(f"📦 Tracking failed for {tracking_code}: {tracking_result.get('error')}")
-                        continue
-                    
-                    new_status = tracking_result.get("status", "unknown")
-                    status_text = tracking_result.get("status_text", "")
-                    
-                    # Durum değişikliği var mı kontrol et
-                    if new_status != old_shipping_status and new_status != "unknown":
-                        logger.info(f"📦 Status change for {tracking_code}: {old_shipping_status} -> {new_status}")
-                        
-                        # Transaction'ı güncelle
-                        update_data = {
-                            "shipping_status": new_status,
-                            "shipping_status_text": status_text,
-                            "last_tracking_check": now,
-                            "updated_at": now
-                        }
-                        
-                        # Eğer teslim edildiyse, status'u da güncelle
-                        if new_status == "delivered":
-                            update_data["status"] = "delivered"
-                            update_data["delivered_at"] = now
-                            # 1 gün sonra otomatik onay için deadline koy
-                            update_data["auto_approve_deadline"] = now + timedelta(days=1)
-                        
-                        await fresh_db.marketplace_transactions.update_one(
-                            {"id": transaction_id},
-                            {"$set": update_data}
-                        )
-                        status_updates += 1
-                        
-                        # Listing bilgisini al
-                        listing = await fresh_db.marketplace_listings.find_one({"id": listing_id})
-                        listing_title = listing.get("title", "Ürün") if listing else "Ürün"
-                        
-                        # Bildirim mesajlarını belirle
-                        notification_title, notification_message = self._get_shipping_notification_message(
-                            new_status, tracking_code, listing_title, provider_code
-                        )
-                        
-                        # Alıcıya bildirim gönder
-                        buyer_notification = {
-                            "id": str(uuid.uuid4()),
-                            "user_id": buyer_id,
-                            "type": f"shipping_status_{new_status}",
-                            "title": notification_title,
-                            "message": notification_message,
-                            "related_id": transaction_id,
-                            "related_type": "marketplace_order",
-                            "data": {
-                                "transaction_id": transaction_id,
-                                "listing_id": listing_id,
-                                "tracking_code": tracking_code,
-                                "shipping_status": new_status,
-                                "shipping_status_text": status_text
-                            },
-                            "read": False,
-                            "created_at": now
-                        }
-                        await fresh_db.notifications.insert_one(buyer_notification)
-                        notifications_sent += 1
-                        
-                        # Satıcıya bildirim gönder
-                        seller_notification = {
-                            "id": str(uuid.uuid4()),
-                            "user_id": seller_id,
-                            "type": f"shipping_status_{new_status}_seller",
-                            "title": notification_title,
-                            "message": notification_message,
-                            "related_id": transaction_id,
-                            "related_type": "marketplace_order",
-                            "data": {
-                                "transaction_id": transaction_id,
-                                "listing_id": listing_id,
-                                "tracking_code": tracking_code,
-                                "shipping_status": new_status,
-                                "shipping_status_text": status_text
-                            },
-                            "read": False,
-                            "created_at": now
-                        }
-                        await fresh_db.notifications.insert_one(seller_notification)
-                        notifications_sent += 1
-                        
-                        # Push notification gönder (eğer push service varsa)
-                        if self.push_service:
-                            try:
-                                # Alıcı push
-                                buyer_push_token = await fresh_db.push_tokens.find_one({"user_id": buyer_id})
-                                if buyer_push_token and buyer_push_token.get("expo_push_token"):
-                                    await self.push_service.send_push_notification(
-                                        push_tokens=[buyer_push_token["expo_push_token"]],
-                                        title=notification_title,
-                                        body=notification_message,
-                                        data={
-                                            "type": f"shipping_{new_status}",
-                                            "transaction_id": transaction_id,
-                                            "tracking_code": tracking_code
-                                        }
-                                    )
-                                
-                                # Satıcı push
-                                seller_push_token = await fresh_db.push_tokens.find_one({"user_id": seller_id})
-                                if seller_push_token and seller_push_token.get("expo_push_token"):
-                                    await self.push_service.send_push_notification(
-                                        push_tokens=[seller_push_token["expo_push_token"]],
-                                        title=notification_title,
-                                        body=notification_message,
-                                        data={
-                                            "type": f"shipping_{new_status}",
-                                            "transaction_id": transaction_id,
-                                            "tracking_code": tracking_code
-                                        }
-                                    )
-                            except Exception as push_err:
-                                logger.error(f"Push notification error: {str(push_err)}")
-                    else:
-                        # Durum değişikliği yok, sadece last_tracking_check güncelle
-                        await fresh_db.marketplace_transactions.update_one(
-                            {"id": transaction_id},
-                            {"$set": {"last_tracking_check": now}}
-                        )
-                    
-                except Exception as e:
-                    logger.error(f"Error tracking shipment {transaction.get('id')}: {str(e)}")
+            from geliver_endpoints import track_shipment_by_code
+            
+            semaphore = asyncio.Semaphore(CARGO_TRACKING_CONCURRENCY)
+            api_durations: List[float] = []
+            
+            async def track(transaction):
+                tracking_code = transaction.get("tracking_code") or transaction.get("barcode")
+                if not tracking_code:
+                    return None
+                async with semaphore:
+                    call_started = time.monotonic()
+                    try:
+                        result = await track_shipment_by_code(tracking_code, transaction.get("shipping_provider"))
+                    except Exception as e:
+                        result = {"success": False, "error": str(e)}
+                    api_durations.append(time.monotonic() - call_started)
+                if not result.get("success"):
+                    logger.warning(f"📦 Tracking failed for {tracking_code}: {result.get('error')}")
+                return result
+            
+            results = await asyncio.gather(*(track(t) for t in transactions_to_track))
+            
+            unchanged_ids = []
+            changes = []
+            failures = 0
+            for transaction, tracking_result in zip(transactions_to_track, results):
+                if tracking_result is None:
                     continue
+                if not tracking_result.get("success"):
+                    failures += 1
+                    continue
+                new_status = tracking_result.get("status", "unknown")
+                old_shipping_status = transaction.get("shipping_status", "unknown")
+                # Durum değişikliği var mı kontrol et
+                if new_status != old_shipping_status and new_status != "unknown":
+                    changes.append((transaction, new_status, tracking_result.get("status_text", "")))
+                else:
+                    unchanged_ids.append(transaction.get("id"))
             
-            logger.info(f"📦 Cargo tracking completed: {status_updates} updates, {notifications_sent} notifications sent")
+            if unchanged_ids:
+                # Durum değişikliği yok, sadece last_tracking_check güncelle (tek sorgu)
+                await db.marketplace_transactions.update_many(
+                    {"id": {"$in": unchanged_ids}},
+                    {"$set": {"last_tracking_check": now}}
+                )
+            
+            notifications_sent = 0
+            if changes:
+                status_writes = []
+                for transaction, new_status, status_text in changes:
+                    logger.info(f"📦 Status change for {transaction.get('tracking_code')}: "
+                                f"{transaction.get('shipping_status', 'unknown')} -> {new_status}")
+                    update_data = {
+                        "shipping_status": new_status,
+                        "shipping_status_text": status_text,
+                        "last_tracking_check": now,
+                        "updated_at": now
+                    }
+                    # Eğer teslim edildiyse, status'u da güncelle
+                    if new_status == "delivered":
+                        update_data["status"] = "delivered"
+                        update_data["delivered_at"] = now
+                        # 1 gün sonra otomatik onay için deadline koy
+                        update_data["auto_approve_deadline"] = now + timedelta(days=1)
+                    status_writes.append(UpdateOne({"id": transaction.get("id")}, {"$set": update_data}))
+                await db.marketplace_transactions.bulk_write(status_writes, ordered=False)
+                
+                notifications_sent = await self._send_shipping_notifications(db, changes, now)
+            
+            summary = {
+                "shipments": len(transactions_to_track),
+                "api_calls": len(api_durations),
+                "failures": failures,
+                "status_updates": len(changes),
+                "notifications_sent": notifications_sent,
+                "concurrency": CARGO_TRACKING_CONCURRENCY,
+                "avg_api_ms": round(sum(api_durations) / len(api_durations) * 1000, 1) if api_durations else None,
+                "max_api_ms": round(max(api_durations) * 1000, 1) if api_durations else None,
+                "duration_ms": round((time.monotonic() - run_started) * 1000, 1),
+            }
+            logger.info(f"📦 Cargo tracking completed: {len(changes)} updates, {notifications_sent} notifications sent "
+                        f"({summary['duration_ms']:.0f} ms, {failures} failures)")
+            return summary
             
         except Exception as e:
             logger.error(f"Error in cargo tracking check: {str(e)}")
     
+    async def _send_shipping_notifications(self, db, changes: list, now: datetime) -> int:
+        """Durum değişen gönderiler için alıcı/satıcı bildirimlerini toplu oluştur ve push gönder"""
+        listing_ids = list({t.get("listing_id") for t, _, _ in changes if t.get("listing_id")})
+        listings = await db.marketplace_listings.find(
+            {"id": {"$in": listing_ids}}, {"_id": 0, "id": 1, "title": 1}
+        ).to_list(None)
+        listing_titles = {l["id"]: l.get("title", "Ürün") for l in listings}
+        
+        notifications = []
+        pushes = []
+        for transaction, new_status, status_text in changes:
+            transaction_id = transaction.get("id")
+            listing_id = transaction.get("listing_id")
+            tracking_code = transaction.get("tracking_code") or transaction.get("barcode")
+            
+            # Bildirim mesajlarını belirle
+            notification_title, notification_message = self._get_shipping_notification_message(
+                new_status, tracking_code, listing_titles.get(listing_id, "Ürün"), transaction.get("shipping_provider")
+            )
+            data = {
+                "transaction_id": transaction_id,
+                "listing_id": listing_id,
+                "tracking_code": tracking_code,
+                "shipping_status": new_status,
+                "shipping_status_text": status_text
+            }
+            # Alıcıya ve satıcıya bildirim
+            for user_id, type_suffix in ((transaction.get("buyer_id"), ""), (transaction.get("seller_id"), "_seller")):
+                notifications.append({
+                    "id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "type": f"shipping_status_{new_status}{type_suffix}",
+                    "title": notification_title,
+                    "message": notification_message,
+                    "related_id": transaction_id,
+                    "related_type": "marketplace_order",
+                    "data": dict(data),
+                    "read": False,
+                    "created_at": now
+                })
+                pushes.append((user_id, notification_title, notification_message, {
+                    "type": f"shipping_{new_status}",
+                    "transaction_id": transaction_id,
+                    "tracking_code": tracking_code
+                }))
+        
+        await db.notifications.insert_many(notifications)
+        
+        # Push notification gönder (eğer push service varsa)
+        if self.push_service:
+            try:
+                user_ids = list({user_id for user_id, *_ in pushes if user_id})
+                token_docs = await db.push_tokens.find(
+                    {"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "expo_push_token": 1}
+                ).to_list(None)
+                tokens = {d["user_id"]: d["expo_push_token"] for d in token_docs if d.get("expo_push_token")}
+                sends = [
+                    self.push_service.send_push_notification(
+                        push_tokens=[tokens[user_id]], title=title, body=body, data=data
+                    )
+                    for user_id, title, body, data in pushes if user_id in tokens
+                ]
+                for result in await asyncio.gather(*sends, return_exceptions=True):
+                    if isinstance(result, Exception):
+                        logger.error(f"Push notification error: {str(result)}")
+            except Exception as push_err:
+                logger.error(f"Push notification error: {str(push_err)}")
+        
+        return len(notifications)
+    
     def _get_shipping_notification_message(self, status: str, tracking_code: str, listing_title: str, provider_code: str = None) -> tuple:
         """Kargo durumuna göre bildirim başlığı ve mesajı oluştur"""
         provider_name = provider_code or "Kargo"
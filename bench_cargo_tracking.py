@@ -0,0 +1,82 @@
+"""
+Cargo Tracking Benchmark
+N gönderiyi eski yöntemle (sırayla, gönderi başına bir Geliver çağrısı ve
+ayrı update_one'lar) ve EventReminderScheduler'ın eşzamanlı kargo takip job'u ile
+fake_geliver_server'a karşı takip eder; süreleri karşılaştırır.
+
+Geçici bir veritabanı oluşturur ve sonunda siler:
+    FAKE_GELIVER_LATENCY_MS=100 MONGO_URL=mongodb://localhost:27017 python bench_cargo_tracking.py [shipments]
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+os.environ.setdefault("GELIVER_API_TOKEN", "fake-token")
+os.environ.setdefault("GELIVER_API_URL", "http://fake-geliver/api/v1")
+os.environ.setdefault("JOB_LOCKS", "off")
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from fake_geliver_server import app as fake_app, state as fake_state
+from geliver_endpoints import configure_geliver_client, close_geliver_client, track_shipment_by_code
+from background_scheduler import EventReminderScheduler
+
+SHIPMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+
+async def seed(db):
+    await db.marketplace_transactions.delete_many({})
+    await db.marketplace_transactions.insert_many([{
+        "id": str(uuid.uuid4()),
+        "status": "shipped",
+        "shipping_status": "pending_pickup",
+        "tracking_code": f"BENCH{i:06d}",
+        "buyer_id": f"buyer-{i % 50}",
+        "seller_id": f"seller-{i % 20}",
+        "listing_id": f"listing-{i % 100}",
+    } for i in range(SHIPMENTS)])
+
+
+async def sequential(db):
+    # Eski davranış: sırayla sorgula, her gönderi için ayrı yazım
+    for t in await db.marketplace_transactions.find({"status": "shipped"}).to_list(SHIPMENTS):
+        result = await track_shipment_by_code(t["tracking_code"])
+        if result.get("success"):
+            await db.marketplace_transactions.update_one(
+                {"id": t["id"]}, {"$set": {"shipping_status": result["status"]}}
+            )
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[f"bench_cargo_{uuid.uuid4().hex[:8]}"]
+    configure_geliver_client(transport=httpx.ASGITransport(app=fake_app))
+    try:
+        await seed(db)
+        started = time.perf_counter()
+        await sequential(db)
+        sequential_ms = (time.perf_counter() - started) * 1000
+        sequential_peak = fake_state["max_in_flight"]
+
+        await seed(db)
+        fake_state["max_in_flight"] = 0
+        scheduler = EventReminderScheduler(db, push_service=None)
+        started = time.perf_counter()
+        summary = await scheduler._check_cargo_tracking_with_db(db)
+        concurrent_ms = (time.perf_counter() - started) * 1000
+
+        print(f"shipments:  {SHIPMENTS}")
+        print(f"sequential: {sequential_ms:8.0f} ms  (max in-flight {sequential_peak})")
+        print(f"concurrent: {concurrent_ms:8.0f} ms  (max in-flight {fake_state['max_in_flight']})")
+        print(f"summary:    {summary}")
+    finally:
+        await close_geliver_client()
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Event List Serialization Benchmark
+Etkinlik listelerinin eski yolu (satır başına Event(**event) + response_model ile
+FastAPI'nin ikinci doğrulaması + jsonable_encoder) ile TypeAdapter hızlı yolunu
+(full ve summary görünüm) karşılaştırır.
+
+Kullanım: python bench_event_serialization.py
+"""
+import copy
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models import Event
+from event_serializers import event_list_response, EVENT_SUMMARY_PROJECTION
+
+ROUNDS = 20
+
+
+def make_event(i: int) -> dict:
+    start = datetime.utcnow() + timedelta(days=i % 30)
+    return {
+        "_id": uuid.uuid4().hex,
+        "id": str(uuid.uuid4()),
+        "title": f"Masa Tenisi Turnuvası {i}",
+        "description": "Açıklama " * 200,
+        "event_type": "tournament",
+        "sport": "Masa Tenisi",
+        "city": "Ankara",
+        "start_date": start,
+        "end_date": start + timedelta(hours=6),
+        "organizer_id": str(uuid.uuid4()),
+        "status": "active",
+        "ticket_info": {"price": 150.0, "total_slots": 64, "available_slots": 12},
+        "images": ["data:image/jpeg;base64," + "A" * 20000 for _ in range(3)],
+        "participants": [str(uuid.uuid4()) for _ in range(40)],
+        "participant_count": 40,
+        "max_participants": 64,
+        "selected_rule": {"sets": 5, "points": 11, "notes": "x" * 2000},
+        "tournament_settings": {"groups": [{"name": f"G{g}", "size": 4} for g in range(16)]},
+        "referees": [{"id": str(uuid.uuid4()), "name": "Hakem"} for _ in range(4)],
+    }
+
+
+def apply_projection(doc: dict) -> dict:
+    """Mongo projection'ın summary görünümde döndüreceği dokümanı taklit et"""
+    projected = {k: v for k, v in doc.items() if EVENT_SUMMARY_PROJECTION.get(k) == 1}
+    projected["images"] = doc.get("images", [])[:1]
+    return projected
+
+
+response_adapter = TypeAdapter(List[Event])
+
+
+def legacy(docs):
+    events = [Event(**{k: v for k, v in d.items() if k != "_id"}) for d in docs]
+    # FastAPI serialize_response: response_model ile tekrar doğrulama + JSON
+    validated = response_adapter.validate_python(events)
+    return json.dumps(jsonable_encoder(response_adapter.dump_python(validated, mode="json"))).encode()
+
+
+def bench(label, func, docs):
+    # Her turda taze kopya: normalize_event_doc dokümanı yerinde değiştirir
+    copies = [copy.deepcopy(docs) for _ in range(ROUNDS)]
+    started = time.perf_counter()
+    size = 0
+    for batch in copies:
+        size = len(func(batch))
+    elapsed = (time.perf_counter() - started) / ROUNDS * 1000
+    print(f"   {label:28s} {elapsed:8.2f} ms/request  {size / 1024:9.1f} KiB")
+
+
+def main():
+    for count in (50, 500):
+        docs = [make_event(i) for i in range(count)]
+        print(f"📦 {count} events")
+        bench("before (Event(**e) x2)", legacy, docs)
+        bench("after  full (TypeAdapter)", lambda b: event_list_response(b).body, docs)
+        bench("after  summary (projection)",
+              lambda b: event_list_response([apply_projection(d) for d in b], summary=True).body, docs)
+
+
+if __name__ == "__main__":
+    main()
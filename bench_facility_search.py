@@ -0,0 +1,148 @@
+"""
+Facility Search Latency Benchmark
+N tesis × M saha (varsayılan 1000 × 5) ve rastgele rezervasyonlarla geçici bir
+veritabanı oluşturur; /facilities/search-available'ın çekirdeği
+search_available_facilities()'i tekrar tekrar çalıştırıp p50/p95 ölçer ve
+tesis tesis available-fields çağırmakla karşılaştırır. p95 bütçeyi aşarsa
+çıkış kodu 1 olur:
+
+    FACILITY_SEARCH_BUDGET_MS=300 MONGO_URL=mongodb://localhost:27017 python bench_facility_search.py [facilities] [fields]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import facility_endpoints
+from db_indexes import INDEX_REGISTRY
+from facility_endpoints import get_available_fields, search_available_facilities
+
+FACILITIES = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+FIELDS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+RUNS = int(os.environ.get("FACILITY_SEARCH_RUNS", "20"))
+BUDGET_MS = float(os.environ.get("FACILITY_SEARCH_BUDGET_MS", "300"))
+
+DATE = (datetime.utcnow() + timedelta(days=3)).strftime("%Y-%m-%d")
+WORKING_HOURS = [
+    {"day": day, "opening_time": "08:00", "closing_time": "23:00", "is_open": True}
+    for day in ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+]
+
+
+async def seed(db):
+    rng = random.Random(42)
+    facilities, fields, reservations = [], [], []
+    for i in range(FACILITIES):
+        facility_id = str(uuid.uuid4())
+        dynamic = i % 3 == 0
+        facilities.append({
+            "id": facility_id,
+            "name": f"Bench Tesis {i:04d}",
+            "city": "İstanbul",
+            "latitude": 41.0 + rng.uniform(-0.2, 0.2),
+            "longitude": 29.0 + rng.uniform(-0.2, 0.2),
+            "sports": [{"sport_name": "Futbol"}],
+            "status": "approved",
+            "is_published": True,
+            "working_hours": WORKING_HOURS,
+            "pricing": {"hourly_rate": 100 + i % 50},
+            "pricing_v2": {
+                "use_dynamic_pricing_v2": dynamic,
+                "base_prices": {"morning": 80, "afternoon": 100, "evening": 150, "night": 120},
+                "same_for_all_fields": False,
+                "field_multipliers": {"1": 1.0, "2": 1.1, "3": 1.2},
+            } if dynamic else {},
+        })
+        for j in range(FIELDS):
+            field_id = str(uuid.uuid4())
+            fields.append({
+                "id": field_id,
+                "facility_id": facility_id,
+                "field_name": f"Saha {j + 1}",
+                "sport_type": "Futbol",
+                "is_active": True,
+                "hourly_rate": None,
+                "created_at": datetime.utcnow() + timedelta(seconds=j),
+            })
+            start = rng.randint(8, 21)
+            reservations.append({
+                "id": str(uuid.uuid4()),
+                "facility_id": facility_id,
+                "field_id": field_id,
+                "date": DATE,
+                "status": rng.choice(["pending", "confirmed", "cancelled"]),
+                "time_slots": [f"{h:02d}:00" for h in range(start, start + rng.randint(1, 2))],
+            })
+    await db.facilities.insert_many(facilities)
+    await db.facility_fields.insert_many(fields)
+    await db.reservations.insert_many(reservations)
+    return [f["id"] for f in facilities]
+
+
+async def create_indexes(db):
+    for module in ("facilities", "reservations", "field_availability"):
+        for spec in INDEX_REGISTRY.get(module, []):
+            await db[spec["collection"]].create_index(spec["keys"])
+
+
+async def timed(runs, func):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = await func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples, result
+
+
+def report(name, samples):
+    p95 = sorted(samples)[max(int(len(samples) * 0.95) - 1, 0)]
+    print(f"{name:28s} p50 {statistics.median(samples):8.1f} ms   p95 {p95:8.1f} ms")
+    return p95
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[f"bench_search_{uuid.uuid4().hex[:8]}"]
+    facility_endpoints.db = db
+    try:
+        facility_ids = await seed(db)
+        await create_indexes(db)
+
+        async def by_city():
+            return await search_available_facilities(db, DATE, "19:00", "21:00", sport="futbol", city="İstanbul", limit=200)
+
+        async def by_location():
+            return await search_available_facilities(db, DATE, "19:00", "21:00", lat=41.0, lng=29.0, radius_km=15, limit=200)
+
+        async def facility_by_facility():
+            return [await get_available_fields(fid, DATE, "19:00", "21:00") for fid in facility_ids]
+
+        # İlk çağrı günlük maske cache'ini ısıtır (okuma doküman oluşturmaz)
+        await by_city()
+
+        print(f"facilities: {FACILITIES} × {FIELDS} fields, date {DATE}")
+        city_samples, city_result = await timed(RUNS, by_city)
+        geo_samples, geo_result = await timed(RUNS, by_location)
+        loop_samples, _ = await timed(1, facility_by_facility)
+        city_p95 = report(f"search city ({len(city_result)})", city_samples)
+        geo_p95 = report(f"search 15km ({len(geo_result)})", geo_samples)
+        report("available-fields loop", loop_samples)
+
+        worst = max(city_p95, geo_p95)
+        if worst > BUDGET_MS:
+            print(f"❌ p95 {worst:.1f} ms > budget {BUDGET_MS:.0f} ms")
+            sys.exit(1)
+        print(f"✅ p95 {worst:.1f} ms <= budget {BUDGET_MS:.0f} ms")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
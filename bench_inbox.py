@@ -0,0 +1,87 @@
+"""
+Inbox Benchmark
+1000 konuşmalı bir kullanıcı için eski conversations-with-unread akışı
+(3 count_documents + aggregation + gönderen başına users.find_one) ile
+tek aggregation + $in kullanan load_inbox'ı karşılaştırır.
+
+Geçici bir veritabanı oluşturur ve sonunda siler:
+    MONGO_URL=mongodb://localhost:27017 python bench_inbox.py [conversations]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from message_endpoints import load_inbox
+
+CONVERSATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+MESSAGES_PER_CONVERSATION = 10
+ME = "bench-user"
+
+
+async def seed(db):
+    peers = [str(uuid.uuid4()) for _ in range(CONVERSATIONS)]
+    await db.users.insert_many([{"id": p, "full_name": f"Peer {i}"} for i, p in enumerate(peers)])
+    now = datetime.utcnow()
+    messages = []
+    for peer in peers:
+        for i in range(MESSAGES_PER_CONVERSATION):
+            incoming = random.random() < 0.5
+            messages.append({
+                "id": str(uuid.uuid4()),
+                "sender_id": peer if incoming else ME,
+                "receiver_id": ME if incoming else peer,
+                "content": "merhaba",
+                "is_read": not (incoming and random.random() < 0.3),
+                "sent_at": now - timedelta(minutes=random.randint(0, 100000)),
+            })
+    await db.messages.insert_many(messages)
+    await db.messages.create_index([("receiver_id", 1), ("is_read", 1), ("sender_id", 1)])
+    await db.messages.create_index([("sender_id", 1), ("receiver_id", 1), ("sent_at", -1)])
+    await db.users.create_index([("id", 1)], unique=True)
+
+
+async def legacy(db):
+    """Eski endpoint'in sorgu deseni"""
+    queries = 0
+    await db.users.find_one({"id": ME}); queries += 1
+    await db.messages.count_documents({}); queries += 1
+    await db.messages.count_documents({"$or": [{"sender_id": ME}, {"receiver_id": ME}]}); queries += 1
+    await db.messages.count_documents({"receiver_id": ME, "is_read": False}); queries += 1
+    rows = await db.messages.aggregate([
+        {"$match": {"receiver_id": ME, "is_read": False}},
+        {"$group": {"_id": "$sender_id", "unread_count": {"$sum": 1}}}
+    ]).to_list(None); queries += 1
+    for row in rows:
+        await db.users.find_one({"id": row["_id"]}); queries += 1
+    return queries
+
+
+async def inbox(db):
+    await load_inbox(db, ME, limit=CONVERSATIONS)
+    return 2
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[f"bench_inbox_{uuid.uuid4().hex[:8]}"]
+    try:
+        await seed(db)
+        print(f"💬 {CONVERSATIONS} conversations x {MESSAGES_PER_CONVERSATION} messages")
+        for label, func in (("before (per-sender loop)", legacy), ("after  (load_inbox)", inbox)):
+            started = time.perf_counter()
+            queries = await func(db)
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"   {label:26s} {elapsed:9.1f} ms  {queries:5d} queries")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Password Hashing Benchmark
+Login burst'ünü simüle eder: eşzamanlı 50 login'de senkron bcrypt ile
+executor tabanlı async bcrypt arasındaki throughput ve event loop gecikmesini karşılaştırır.
+
+Kullanım: python bench_password_hashing.py [concurrency]
+"""
+import asyncio
+import sys
+import time
+
+from auth import (
+    get_password_hash, verify_password, verify_password_async,
+    get_hash_executor_metrics, PASSWORD_HASH_WORKERS
+)
+
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+PASSWORD = "benchmark-password"
+
+
+async def _measure(login_func):
+    """login_func'u CONCURRENCY kez eşzamanlı çalıştır, süre ve maksimum loop gecikmesini ölç"""
+    hashed = get_password_hash(PASSWORD)
+    max_lag = 0.0
+    running = True
+
+    async def heartbeat():
+        # Diğer isteklerin göreceği gecikme: 10ms'lik uykunun ne kadar geciktiği
+        nonlocal max_lag
+        while running:
+            before = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - before - 0.01)
+
+    monitor = asyncio.create_task(heartbeat())
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login_func(PASSWORD, hashed) for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - started
+    running = False
+    await monitor
+
+    assert all(results)
+    return elapsed, max_lag
+
+
+async def sync_login(password, hashed):
+    # Eski davranış: bcrypt doğrudan async handler içinde
+    return verify_password(password, hashed)
+
+
+async def async_login(password, hashed):
+    return await verify_password_async(password, hashed)
+
+
+async def main():
+    print(f"🔐 Concurrency: {CONCURRENCY}, hash workers: {PASSWORD_HASH_WORKERS}")
+    for label, func in (("before (sync bcrypt)", sync_login), ("after (executor)", async_login)):
+        elapsed, max_lag = await _measure(func)
+        print(
+            f"   {label:22s} {CONCURRENCY / elapsed:7.1f} logins/s  "
+            f"total {elapsed * 1000:8.1f} ms  max loop lag {max_lag * 1000:8.1f} ms"
+        )
+    print(f"📊 Executor metrics: {get_hash_executor_metrics()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Push Dispatch Benchmark
+N bildirimi (bildirim başına bir HTTP çağrısı) eski yöntemle ve batch'leyen
+ExpoPushDispatcher ile expo_stub_server'a gönderir; süre ve istek sayısını karşılaştırır.
+
+Kullanım: EXPO_STUB_LATENCY_MS=50 python bench_push_dispatch.py [notifications]
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+
+from expo_stub_server import app as stub_app, state as stub_state
+from push_notification_service import ExpoPushDispatcher
+
+NOTIFICATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+BASE_URL = "http://expo-stub"
+PUSH_URL = f"{BASE_URL}/--/api/v2/push/send"
+RECEIPTS_URL = f"{BASE_URL}/--/api/v2/push/getReceipts"
+
+
+def _message(i: int) -> dict:
+    token = f"ExponentPushToken[{'Dead' if i % 50 == 0 else 'device'}-{i}]"
+    return {"to": token, "title": "Bench", "body": f"Bildirim {i}", "data": {}, "badge": 1}
+
+
+def _reset_stub():
+    stub_state.update({"requests": 0, "messages": 0, "max_batch": 0, "tickets": {}})
+
+
+async def per_notification():
+    # Eski davranış: her bildirim için ayrı istek (burada async client ile, bloklamadan)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=stub_app)) as client:
+        for i in range(NOTIFICATIONS):
+            await client.post(PUSH_URL, json=[_message(i)])
+
+
+async def dispatched():
+    dispatcher = ExpoPushDispatcher(
+        push_url=PUSH_URL, receipts_url=RECEIPTS_URL,
+        transport=httpx.ASGITransport(app=stub_app)
+    )
+    dispatcher.start()
+    # Bildirimler farklı isteklerden tek tek gelir; dispatcher bunları birleştirir
+    await asyncio.gather(*(dispatcher.send([_message(i)]) for i in range(NOTIFICATIONS)))
+    receipts = await dispatcher.check_receipts(min_age=0)
+    metrics = dispatcher.metrics()
+    await dispatcher.stop()
+    return receipts, metrics
+
+
+async def main():
+    print(f"📲 Notifications: {NOTIFICATIONS}")
+
+    _reset_stub()
+    started = time.perf_counter()
+    await per_notification()
+    elapsed = time.perf_counter() - started
+    print(f"   before (1 request/notification) {elapsed * 1000:8.1f} ms  requests {stub_state['requests']}")
+
+    _reset_stub()
+    started = time.perf_counter()
+    receipts, metrics = await dispatched()
+    elapsed = time.perf_counter() - started
+    print(
+        f"   after  (batched dispatcher)     {elapsed * 1000:8.1f} ms  requests {stub_state['requests']}  "
+        f"max batch {stub_state['max_batch']}"
+    )
+    print(f"📊 Receipts: {receipts}")
+    print(f"📊 Dispatcher metrics: {metrics}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+Slot Claim Concurrency Check
+Aynı saha ve saat için N paralel istek (varsayılan 100) gönderir ve yalnızca birinin
+rezervasyon oluşturabildiğini doğrular:
+
+1. POST /facilities/{id}/manual-reservation - hepsi aynı saat
+2. POST /facilities/{id}/fields/{field_id}/create-reservation - hepsi aynı saat
+3. claim_hours() - rastgele çakışan 1-3 saatlik aralıklar; kazananların
+   hiçbirinin saatleri kesişmemeli
+
+Geçici bir veritabanı oluşturur ve sonunda siler; ihlalde çıkış kodu 1:
+    MONGO_URL=mongodb://localhost:27017 python bench_slot_claims.py [requests]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import FastAPI
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import facility_endpoints
+from auth import get_current_user
+from field_availability import claim_hours, load_day_masks, mask_hours
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+DATE = (datetime.utcnow() + timedelta(days=2)).strftime("%Y-%m-%d")
+OWNER_ID = "bench-owner"
+
+
+async def seed(db):
+    facility_id, field_id = str(uuid.uuid4()), str(uuid.uuid4())
+    await db.facilities.insert_one({"id": facility_id, "name": "Bench Tesis", "owner_id": OWNER_ID})
+    await db.facility_fields.insert_one({
+        "id": field_id, "facility_id": facility_id, "field_name": "Saha 1",
+        "is_active": True, "created_at": datetime.utcnow(),
+    })
+    return facility_id, field_id
+
+
+async def fire(client, method, url, payloads):
+    started = time.perf_counter()
+    responses = await asyncio.gather(*[client.request(method, url, json=p) for p in payloads])
+    elapsed = (time.perf_counter() - started) * 1000
+    codes = [r.status_code for r in responses]
+    return codes.count(200), codes, elapsed
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[f"bench_slots_{uuid.uuid4().hex[:8]}"]
+    facility_endpoints.db = db
+
+    app = FastAPI()
+    app.include_router(facility_endpoints.router, prefix="/api")
+    app.dependency_overrides[get_current_user] = lambda: {"id": OWNER_ID, "user_type": "facility_owner"}
+
+    failures = []
+    try:
+        facility_id, field_id = await seed(db)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+            # 1. Manuel rezervasyon: hepsi 19:00-20:00
+            ok, codes, elapsed = await fire(http, "POST", f"/api/facilities/{facility_id}/manual-reservation", [
+                {"field_id": field_id, "date": DATE, "start_time": "19:00", "end_time": "20:00",
+                 "customer_name": f"Müşteri {i}", "hourly_rate": 100}
+                for i in range(REQUESTS)
+            ])
+            stored = await db.manual_reservations.count_documents({"field_id": field_id, "date": DATE})
+            print(f"manual-reservation:  {ok} ok / {codes.count(400)} conflict / {REQUESTS} in {elapsed:.0f} ms, stored {stored}")
+            if ok != 1 or stored != 1:
+                failures.append("manual-reservation")
+
+            # 2. Sahadan anlık rezervasyon: hepsi 21:00, 60 dk
+            ok, codes, elapsed = await fire(http, "POST", f"/api/facilities/{facility_id}/fields/{field_id}/create-reservation", [
+                {"start_time": f"{DATE}T21:00:00", "planned_duration": 60, "player_names": [f"Oyuncu {i}"]}
+                for i in range(REQUESTS)
+            ])
+            field = await db.facility_fields.find_one({"id": field_id})
+            stored = len(field.get("reservations", []))
+            print(f"create-reservation:  {ok} ok / {codes.count(400)} conflict / {REQUESTS} in {elapsed:.0f} ms, stored {stored}")
+            if ok != 1 or stored != 1:
+                failures.append("create-reservation")
+
+        # 3. Çakışan çok saatli talepler: kazananlar ayrık olmalı, maske birleşimlerine eşit
+        rng = random.Random(7)
+        other_field = str(uuid.uuid4())
+        requests = []
+        for _ in range(REQUESTS):
+            start = rng.randint(8, 20)
+            requests.append(list(range(start, start + rng.randint(1, 3))))
+        results = await asyncio.gather(*[claim_hours(db, other_field, DATE, hours) for hours in requests])
+        winners = [hours for hours, ok in zip(requests, results) if ok]
+        taken = [hour for hours in winners for hour in hours]
+        mask = (await load_day_masks(db, [other_field], DATE))[other_field]
+        print(f"claim_hours:         {len(winners)} winners {winners}, mask {mask_hours(mask)}")
+        if len(taken) != len(set(taken)) or sorted(taken) != mask_hours(mask):
+            failures.append("claim_hours")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+    if failures:
+        print(f"❌ double booking: {', '.join(failures)}")
+        sys.exit(1)
+    print("✅ no double booking")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
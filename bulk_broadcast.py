@@ -0,0 +1,254 @@
+"""
+Bulk Broadcast Jobs
+Admin toplu bildirimlerini HTTP isteğinden bağımsız, parça parça işleyen arka plan işi.
+
+Hedef kullanıcılar id sırasına göre keyset cursor ile BROADCAST_CHUNK_SIZE'lık
+parçalar halinde okunur; her parça için bildirimler insert_many ile yazılır ve
+push token'ları batch'leyen push dispatcher'a verilir. İlerleme (last_user_id,
+sayaçlar, durum) admin_sent_notifications dokümanında tutulur; yarıda kalan işler
+uygulama yeniden başladığında kaldığı yerden devam eder.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from push_notification_service import PushNotificationService
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CHUNK_SIZE = int(os.environ.get("BROADCAST_CHUNK_SIZE", "1000"))
+# Bu süre boyunca heartbeat atmayan "running" iş sahipsiz sayılır ve devralınabilir
+BROADCAST_STALE_AFTER = timedelta(minutes=2)
+# Heartbeat parça sınırlarından bağımsız bu aralıkla yenilenir (yavaş parça sahipliği kaybetmez)
+BROADCAST_HEARTBEAT_SECONDS = 30
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+_WORKER_ID = str(uuid.uuid4())
+_tasks: Dict[str, asyncio.Task] = {}
+
+
+def build_broadcast_query(filters: dict) -> dict:
+    """Admin filtrelerinden (BulkNotificationFilters.dict()) hedef kullanıcı sorgusu oluştur"""
+    user_query = {"is_active": {"$ne": False}}
+    filters = filters or {}
+
+    # Spor dalı filtresi (çoklu)
+    if filters.get("sports"):
+        user_query["$or"] = [
+            {"sports": {"$in": filters["sports"]}},
+            {"preferred_sport": {"$in": filters["sports"]}},
+            {"favorite_sports": {"$in": filters["sports"]}}
+        ]
+
+    # Kullanıcı türü filtresi (çoklu)
+    if filters.get("user_types"):
+        user_query["user_type"] = {"$in": filters["user_types"]}
+
+    # Cinsiyet filtresi (çoklu)
+    if filters.get("genders"):
+        user_query["gender"] = {"$in": filters["genders"]}
+
+    # Yaş grubu filtresi (çoklu) - liderlik tablosundaki gibi users.age_group üzerinden
+    if filters.get("age_groups"):
+        user_query["age_group"] = {"$in": filters["age_groups"]}
+
+    return user_query
+
+
+async def _claim(db, broadcast_id: str) -> Optional[dict]:
+    """İşi bu worker için atomik olarak sahiplen (başka worker canlı çalıştırıyorsa None)"""
+    now = datetime.utcnow()
+    return await db.admin_sent_notifications.find_one_and_update(
+        {
+            "id": broadcast_id,
+            "$or": [
+                {"status": STATUS_PENDING},
+                {"status": STATUS_RUNNING, "heartbeat_at": {"$lt": now - BROADCAST_STALE_AFTER}},
+                {"status": STATUS_RUNNING, "worker_id": _WORKER_ID},
+            ]
+        },
+        {"$set": {"status": STATUS_RUNNING, "worker_id": _WORKER_ID, "heartbeat_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _heartbeat(db, broadcast_id: str):
+    """İş sürdükçe heartbeat_at'i periyodik olarak yenile"""
+    while True:
+        await asyncio.sleep(BROADCAST_HEARTBEAT_SECONDS)
+        try:
+            await db.admin_sent_notifications.update_one(
+                {"id": broadcast_id, "worker_id": _WORKER_ID},
+                {"$set": {"heartbeat_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Broadcast {broadcast_id} heartbeat failed: {e}")
+
+
+def _chunk_tokens(users: List[dict], registered: List[dict]) -> List[str]:
+    tokens = [u.get("push_token") or u.get("expoPushToken") for u in users]
+    tokens.extend(doc.get("expo_push_token") for doc in registered)
+    return list(dict.fromkeys(t for t in tokens if t))
+
+
+async def run_broadcast(db, broadcast_id: str):
+    """Yayını kaldığı yerden sonuna kadar işle"""
+    job = await _claim(db, broadcast_id)
+    if not job:
+        logger.info(f"📤 Broadcast {broadcast_id} already handled by another worker")
+        return
+
+    user_query = build_broadcast_query(job.get("filters"))
+    last_user_id = job.get("last_user_id")
+    resumed = last_user_id is not None
+    if not job.get("started_at"):
+        await db.admin_sent_notifications.update_one(
+            {"id": broadcast_id}, {"$set": {"started_at": datetime.utcnow()}}
+        )
+    logger.info(f"📤 Broadcast {broadcast_id} {'resumed' if resumed else 'started'}: {job.get('total_targets')} targets")
+
+    heartbeat = asyncio.create_task(_heartbeat(db, broadcast_id))
+    try:
+        while True:
+            query = dict(user_query)
+            if last_user_id is not None:
+                query = {"$and": [user_query, {"id": {"$gt": last_user_id}}]}
+            users = await db.users.find(
+                query, {"_id": 0, "id": 1, "push_token": 1, "expoPushToken": 1}
+            ).sort("id", 1).limit(BROADCAST_CHUNK_SIZE).to_list(BROADCAST_CHUNK_SIZE)
+            if not users:
+                break
+
+            user_ids = [u["id"] for u in users]
+            if resumed:
+                # Yarıda kalan parçada bildirimi zaten yazılmış kullanıcıları atla
+                done = await db.notifications.distinct(
+                    "user_id", {"broadcast_id": broadcast_id, "user_id": {"$in": user_ids}}
+                )
+                done = set(done)
+                pending_ids = [uid for uid in user_ids if uid not in done]
+                resumed = False
+            else:
+                pending_ids = user_ids
+
+            now = datetime.utcnow()
+            if pending_ids:
+                await db.notifications.insert_many([
+                    {
+                        "id": str(uuid.uuid4()),
+                        "user_id": user_id,
+                        "type": "admin_broadcast",
+                        "broadcast_id": broadcast_id,
+                        "title": job["title"],
+                        "body": job["body"],
+                        "read": False,
+                        "created_at": now,
+                        "data": {
+                            "notification_type": job["notification_type"],
+                            "media_url": job.get("media_url"),
+                            "media_type": job.get("media_type"),
+                        }
+                    }
+                    for user_id in pending_ids
+                ], ordered=False)
+
+            push_sent = push_failed = 0
+            if job["notification_type"] == "push" and pending_ids:
+                pending = set(pending_ids)
+                registered = await db.push_tokens.find(
+                    {"user_id": {"$in": pending_ids}}, {"_id": 0, "expo_push_token": 1}
+                ).to_list(None)
+                tokens = _chunk_tokens([u for u in users if u["id"] in pending], registered)
+                if tokens:
+                    result = await PushNotificationService.send_push_notification(
+                        push_tokens=tokens,
+                        title=job["title"],
+                        body=job["body"],
+                        data={"type": "admin_broadcast", "broadcast_id": broadcast_id},
+                        badge=1
+                    )
+                    tickets = (result.get("data") or {}).get("data") or []
+                    push_sent = sum(1 for t in tickets if t.get("status") == "ok")
+                    push_failed = len(tokens) - push_sent
+
+            last_user_id = user_ids[-1]
+            await db.admin_sent_notifications.update_one(
+                {"id": broadcast_id},
+                {
+                    "$set": {"last_user_id": last_user_id, "heartbeat_at": datetime.utcnow()},
+                    "$inc": {
+                        "processed_count": len(user_ids),
+                        "sent_count": len(pending_ids),
+                        "push_sent_count": push_sent,
+                        "push_failed_count": push_failed,
+                    }
+                }
+            )
+
+        await db.admin_sent_notifications.update_one(
+            {"id": broadcast_id},
+            {"$set": {"status": STATUS_COMPLETED, "completed_at": datetime.utcnow()}}
+        )
+        logger.info(f"✅ Broadcast {broadcast_id} completed")
+    except asyncio.CancelledError:
+        # Kapanış: iş pending'e döner, sonraki başlangıçta kaldığı yerden devam eder
+        await db.admin_sent_notifications.update_one(
+            {"id": broadcast_id, "worker_id": _WORKER_ID},
+            {"$set": {"status": STATUS_PENDING}}
+        )
+        logger.info(f"⏸️ Broadcast {broadcast_id} paused at user {last_user_id}")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Broadcast {broadcast_id} failed: {e}")
+        await db.admin_sent_notifications.update_one(
+            {"id": broadcast_id},
+            {"$set": {"status": STATUS_FAILED, "error": str(e), "failed_at": datetime.utcnow()}}
+        )
+    finally:
+        heartbeat.cancel()
+
+
+def start_broadcast(db, broadcast_id: str) -> asyncio.Task:
+    """Yayını mevcut event loop üzerinde arka plan görevi olarak başlat"""
+    task = _tasks.get(broadcast_id)
+    if task and not task.done():
+        return task
+    task = asyncio.create_task(run_broadcast(db, broadcast_id))
+    _tasks[broadcast_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(broadcast_id, None))
+    return task
+
+
+async def resume_broadcasts(db) -> int:
+    """Yarıda kalmış (pending / sahipsiz running) yayınları yeniden başlat"""
+    stale_before = datetime.utcnow() - BROADCAST_STALE_AFTER
+    jobs = await db.admin_sent_notifications.find(
+        {"$or": [
+            {"status": STATUS_PENDING},
+            {"status": STATUS_RUNNING, "heartbeat_at": {"$lt": stale_before}},
+        ]},
+        {"_id": 0, "id": 1}
+    ).to_list(None)
+    for job in jobs:
+        start_broadcast(db, job["id"])
+    if jobs:
+        logger.info(f"📤 Resuming {len(jobs)} unfinished broadcasts")
+    return len(jobs)
+
+
+async def stop_broadcasts():
+    """Çalışan yayın görevlerini durdur (ilerleme kaydedildiği için sonra devam edilir)"""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
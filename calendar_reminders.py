@@ -0,0 +1,88 @@
+"""
+Calendar Reminder Badges
+GET /calendar/upcoming-reminders için sabit sayıda sorgu ile hesaplama.
+
+Kullanıcının katılımları ve rezervasyonları toplu ($in) okunur; etkinlik ve
+rezervasyonlar veritabanı tarafında önümüzdeki 24 saate göre filtrelenir.
+Okunmamış takvim öğesi sayısı user_calendar projeksiyonundan gelir. Katılım/
+rezervasyon sayısından bağımsız olarak istek başına sabit sayıda sorgu yapılır.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from reminder_scheduler import _as_utc, datetime_range_query, reservation_day_query, reservation_start
+
+logger = logging.getLogger(__name__)
+
+# Rezervasyonu "alan" taraf olarak hatırlatma görebilecek kullanıcı türleri
+PROVIDER_USER_TYPES = ("player", "coach", "referee", "venue_owner")
+
+
+def _bucket(item: dict, hours_until: float, within_1h: list, within_24h: list):
+    if hours_until <= 1:
+        within_1h.append(item)
+    elif hours_until <= 24:
+        within_24h.append(item)
+
+
+async def load_upcoming_reminders(db, user_id: str, now: datetime, participations: List[dict]) -> Tuple[list, list]:
+    """Önümüzdeki 24 saatteki etkinlik ve rezervasyonları (1 saat içi / 24 saat içi) döndür"""
+    within_24h, within_1h = [], []
+    horizon = now + timedelta(hours=24)
+
+    event_ids = list({p["event_id"] for p in participations if p.get("status") == "approved" and p.get("event_id")})
+    if event_ids:
+        events = await db.events.find(
+            {"id": {"$in": event_ids}, **datetime_range_query("start_date", now, horizon)},
+            {"_id": 0, "id": 1, "title": 1, "start_date": 1, "city": 1}
+        ).to_list(None)
+        for event in events:
+            start = _as_utc(event.get("start_date"))
+            if not start or start <= now:
+                continue
+            hours_until = (start - now).total_seconds() / 3600
+            _bucket({
+                "id": event["id"],
+                "title": event.get("title", "Etkinlik"),
+                "type": "event",
+                "date": event["start_date"],
+                "hours_until": round(hours_until, 1),
+                "location": event.get("city"),
+            }, hours_until, within_1h, within_24h)
+
+    # Kullanıcının yaptığı ve (hizmet veren ise) kendisine yapılan rezervasyonlar tek sorguda
+    parties = [{"user_id": user_id}]
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "user_type": 1})
+    if user and user.get("user_type") in PROVIDER_USER_TYPES:
+        parties += [{field: user_id} for field in ("player_id", "coach_id", "referee_id", "venue_id")]
+    reservations = await db.reservations.find(
+        {"status": "confirmed", "$or": parties, **reservation_day_query(now, horizon)},
+        {"_id": 0, "id": 1, "date": 1, "start_time": 1, "venue_id": 1}
+    ).to_list(None)
+
+    upcoming = []
+    for reservation in reservations:
+        start = reservation_start(reservation)
+        if start and now < start <= horizon:
+            upcoming.append((reservation, (start - now).total_seconds() / 3600))
+
+    venue_ids = list({r.get("venue_id") for r, _ in upcoming if r.get("venue_id")})
+    venue_names = {}
+    if venue_ids:
+        venues = await db.venues.find({"id": {"$in": venue_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+        venue_names = {v["id"]: v.get("name") for v in venues}
+
+    for reservation, hours_until in upcoming:
+        venue_name = venue_names.get(reservation.get("venue_id"))
+        _bucket({
+            "id": reservation["id"],
+            "title": f"Rezervasyon - {venue_name or 'Yer'}",
+            "type": "reservation",
+            "date": reservation["date"],
+            "start_time": reservation["start_time"],
+            "hours_until": round(hours_until, 1),
+            "venue_name": venue_name,
+        }, hours_until, within_1h, within_24h)
+
+    return within_24h, within_1h
@@ -14,6 +14,9 @@ import uuid
 import logging
 
 from auth import get_current_user
+from rating_aggregates import apply_review_rating
+from user_calendar import refresh_user_calendar
+from field_availability import release_reservation
 
 router = APIRouter(prefix="/api/cancellation-requests", tags=["Cancellation"])
 
@@ -580,6 +583,7 @@ async def create_automatic_review(target_user_id: str, reviewer_id: str, item_ty
         "created_at": datetime.utcnow().isoformat()
     }
     await db.reviews.insert_one(review)
+    await apply_review_rating(db, review)
     
     # Update user's review stats
     await db.users.update_one(
@@ -895,11 +899,14 @@ async def accept_cancellation_request(
     item_id = cancel_req["item_id"]
     
     if item_type == "reservation":
-        await db.reservations.update_one(
+        reservation = await db.reservations.find_one_and_update(
             {"id": item_id},
             {"$set": {"status": "cancelled", "cancelled_at": datetime.utcnow().isoformat()}}
         )
+        if reservation:
+            await release_reservation(db, reservation)
         await db.calendar_items.delete_many({"reservation_id": item_id})
+        await refresh_user_calendar(db, reservation_ids=[item_id])
         
     elif item_type == "facility_reservation":
         await db.facility_reservations.update_one(
@@ -907,6 +914,7 @@ async def accept_cancellation_request(
             {"$set": {"status": "cancelled", "cancelled_at": datetime.utcnow().isoformat()}}
         )
         await db.calendar_items.delete_many({"reservation_id": item_id})
+        await refresh_user_calendar(db, reservation_ids=[item_id])
         
     elif item_type == "event_participation":
         # Cancellation request'ten event_id'yi al
@@ -962,6 +970,7 @@ async def accept_cancellation_request(
             "event_id": event_id, 
             "user_id": cancel_req["requester_id"]
         })
+        await refresh_user_calendar(db, event_ids=[event_id], user_ids=[cancel_req["requester_id"]])
         
         logger.info(f"📅 Removed {delete_result.deleted_count} calendar items for event {event_id} from user {cancel_req['requester_id']}'s calendar")
     
@@ -1157,11 +1166,14 @@ async def force_cancel(
     
     # Cancel the item
     if item_type == "reservation":
-        await db.reservations.update_one(
+        reservation = await db.reservations.find_one_and_update(
             {"id": item_id},
             {"$set": {"status": "cancelled", "cancelled_by": "provider", "cancelled_at": datetime.utcnow().isoformat()}}
         )
+        if reservation:
+            await release_reservation(db, reservation)
         await db.calendar_items.delete_many({"reservation_id": item_id})
+        await refresh_user_calendar(db, reservation_ids=[item_id])
         
     elif item_type == "facility_reservation":
         await db.facility_reservations.update_one(
@@ -1169,6 +1181,7 @@ async def force_cancel(
             {"$set": {"status": "cancelled", "cancelled_by": "provider", "cancelled_at": datetime.utcnow().isoformat()}}
         )
         await db.calendar_items.delete_many({"reservation_id": item_id})
+        await refresh_user_calendar(db, reservation_ids=[item_id])
         
     elif item_type == "event_participation":
         # This is when organizer cancels - different logic
@@ -1184,6 +1197,7 @@ async def force_cancel(
                 {"$set": {"status": "cancelled", "cancelled_at": datetime.utcnow().isoformat()}}
             )
             await db.calendar_items.delete_many({"event_id": event["id"]})
+            await refresh_user_calendar(db, event_ids=[event["id"]])
     
     # Create automatic 1-star review as penalty
     await create_automatic_review(
@@ -1543,6 +1557,7 @@ async def transfer_participation(
         "created_at": datetime.utcnow().isoformat()
     }
     await db.calendar_items.insert_one(calendar_item)
+    await refresh_user_calendar(db, event_ids=[request.event_id], user_ids=[user_id, new_user_id])
     
     # Transfer kaydı oluştur
     transfer_log = {
@@ -17,6 +17,7 @@ import bcrypt
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from fixture_generator import FixtureGenerator
+from message_endpoints import conversation_key
 
 load_dotenv()
 
@@ -507,6 +508,7 @@ async def create_messages(users):
                 "id": str(uuid.uuid4()),
                 "sender_id": sender['id'],
                 "receiver_id": receiver['id'],
+                "conversation_key": conversation_key(sender['id'], receiver['id']),
                 "content": f"Test mesajı {i+1}. Merhaba, nasılsın?",
                 "sent_at": datetime.utcnow() - timedelta(minutes=random.randint(0, 1440)),
                 "read": random.choice([True, False])
@@ -0,0 +1,287 @@
+"""
+Database Index Registry
+Router modüllerinin sıcak sorguları için gereken MongoDB index'lerini tek yerde tanımlar.
+
+Index'ler server.py lifespan içinde idempotent olarak uygulanır (create_indexes
+aynı tanım için no-op'tur). Komut satırından tanımlı ve canlı index'leri
+karşılaştırmak için:
+
+    python db_indexes.py --diff        # declared vs. live farklarını göster
+    python db_indexes.py --dry-run     # oluşturulacak index'leri raporla
+    python db_indexes.py --apply       # eksik index'leri oluştur
+"""
+import argparse
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+# Her modül kendi sorgu desenlerine göre index tanımlar.
+# Tanım formatı: {"collection": str, "keys": [(field, direction), ...], "unique": bool, ...}
+# Ek IndexModel seçenekleri (sparse, partialFilterExpression, expireAfterSeconds) aynen geçirilir.
+INDEX_REGISTRY: Dict[str, List[dict]] = {
+    "auth": [
+        {"collection": "users", "keys": [("id", 1)], "unique": True},
+        {"collection": "users", "keys": [("email", 1)]},
+        {"collection": "users", "keys": [("phone", 1)]},
+        {"collection": "users", "keys": [("session_token", 1)], "sparse": True},
+        {"collection": "user_sessions", "keys": [("session_token", 1)]},
+    ],
+    "users": [
+        {"collection": "users", "keys": [("user_type", 1), ("city", 1)]},
+        {"collection": "push_tokens", "keys": [("user_id", 1)]},
+        {"collection": "user_activity_logs", "keys": [("user_id", 1), ("created_at", -1)]},
+    ],
+    "events": [
+        {"collection": "events", "keys": [("id", 1)], "unique": True},
+        {"collection": "events", "keys": [("status", 1), ("date", 1)]},
+        {"collection": "events", "keys": [("organizer_id", 1), ("date", -1)]},
+        {"collection": "events", "keys": [("sport", 1), ("city", 1), ("date", 1)]},
+        {"collection": "events", "keys": [("start_date", 1)]},
+        {"collection": "participations", "keys": [("event_id", 1), ("user_id", 1)]},
+        {"collection": "participations", "keys": [("user_id", 1), ("status", 1)]},
+        {"collection": "event_participants", "keys": [("event_id", 1)]},
+        {"collection": "event_matches", "keys": [("id", 1)], "unique": True},
+        {"collection": "event_matches", "keys": [("event_id", 1), ("scheduled_time", 1)]},
+        {"collection": "event_matches", "keys": [("status", 1), ("scheduled_time", 1)]},
+        {"collection": "due_reminders", "keys": [("status", 1), ("due_at", 1)]},
+        {"collection": "due_reminders", "keys": [("match_id", 1)]},
+        {"collection": "due_reminders", "keys": [("event_id", 1)]},
+        {"collection": "event_groups", "keys": [("event_id", 1)]},
+        {"collection": "event_standings", "keys": [("event_id", 1), ("group_id", 1)]},
+    ],
+    "messages": [
+        {"collection": "messages", "keys": [("receiver_id", 1), ("is_read", 1), ("sender_id", 1)]},
+        {"collection": "messages", "keys": [("sender_id", 1), ("receiver_id", 1), ("sent_at", -1)]},
+        {"collection": "messages", "keys": [("id", 1)]},
+        {"collection": "group_chats", "keys": [("id", 1)], "unique": True},
+        {"collection": "group_chats", "keys": [("member_ids", 1)]},
+        {"collection": "group_chats", "keys": [("event_id", 1)]},
+        {"collection": "messages", "keys": [("conversation_key", 1), ("sent_at", -1), ("id", -1)]},
+        {"collection": "group_messages", "keys": [("group_id", 1), ("sent_at", -1), ("id", -1)]},
+        {"collection": "group_messages", "keys": [("id", 1)]},
+    ],
+    "notifications": [
+        {"collection": "notifications", "keys": [("user_id", 1), ("created_at", -1)]},
+        {"collection": "notifications", "keys": [("user_id", 1), ("_id", -1)]},
+        {"collection": "notifications", "keys": [("user_id", 1), ("is_read", 1)]},
+        {"collection": "notifications", "keys": [("id", 1)]},
+        {"collection": "notifications", "keys": [("broadcast_id", 1), ("user_id", 1)], "sparse": True},
+        {"collection": "admin_sent_notifications", "keys": [("created_at", -1)]},
+        {"collection": "admin_sent_notifications", "keys": [("status", 1)]},
+        {"collection": "sent_reminders", "keys": [("created_at", 1)], "expireAfterSeconds": 7 * 24 * 3600},
+    ],
+    "reservations": [
+        {"collection": "reservations", "keys": [("id", 1)], "unique": True},
+        {"collection": "reservations", "keys": [("field_id", 1), ("date", 1)]},
+        {"collection": "reservations", "keys": [("user_id", 1), ("date", -1)]},
+        {"collection": "reservations", "keys": [("status", 1), ("date", 1)]},
+        {"collection": "calendar_items", "keys": [("user_id", 1), ("date", 1)]},
+        {"collection": "calendar_items", "keys": [("reservation_id", 1)]},
+        {"collection": "venues", "keys": [("id", 1)], "unique": True},
+        {"collection": "venues", "keys": [("owner_id", 1)]},
+    ],
+    "facilities": [
+        {"collection": "facilities", "keys": [("id", 1)], "unique": True},
+        {"collection": "facilities", "keys": [("owner_id", 1)]},
+        {"collection": "facilities", "keys": [("status", 1), ("city", 1)]},
+        {"collection": "facility_fields", "keys": [("id", 1)]},
+        {"collection": "facility_fields", "keys": [("facility_id", 1)]},
+        {"collection": "facilities", "keys": [("status", 1), ("is_published", 1), ("latitude", 1), ("longitude", 1)]},
+        {"collection": "facility_fields", "keys": [("facility_id", 1), ("is_active", 1), ("created_at", 1)]},
+    ],
+    "marketplace": [
+        {"collection": "marketplace_listings", "keys": [("id", 1)], "unique": True},
+        {"collection": "marketplace_listings", "keys": [("status", 1), ("created_at", -1)]},
+        {"collection": "marketplace_listings", "keys": [("seller_id", 1)]},
+        {"collection": "marketplace_transactions", "keys": [("id", 1)]},
+        {"collection": "marketplace_transactions", "keys": [("status", 1)]},
+        {"collection": "marketplace_offers", "keys": [("id", 1)]},
+    ],
+    "reviews": [
+        {"collection": "reviews", "keys": [("id", 1)]},
+        {"collection": "reviews", "keys": [("target_type", 1), ("target_id", 1)]},
+    ],
+    "teams": [
+        {"collection": "teams", "keys": [("id", 1)]},
+    ],
+    "memberships": [
+        {"collection": "memberships", "keys": [("id", 1)]},
+    ],
+    "calendar": [
+        {"collection": "calendar_items", "keys": [("event_id", 1), ("user_id", 1)]},
+        {"collection": "user_calendar", "keys": [("user_id", 1), ("listed", 1), ("created_at", -1)]},
+        {"collection": "user_calendar", "keys": [("user_id", 1), ("is_read", 1), ("orphaned", 1)]},
+        {"collection": "user_calendar", "keys": [("event_id", 1)]},
+        {"collection": "user_calendar", "keys": [("reservation_id", 1)]},
+    ],
+    "field_availability": [
+        {"collection": "field_availability", "keys": [("facility_id", 1), ("date", 1)]},
+        {"collection": "field_availability", "keys": [("date", 1)]},
+        {"collection": "reservations", "keys": [("venue_id", 1), ("date", 1)]},
+        {"collection": "reservations", "keys": [("status", 1), ("created_at", 1)]},
+        {"collection": "manual_reservations", "keys": [("field_id", 1), ("date", 1)]},
+    ],
+    "rankings": [
+        {"collection": "matches", "keys": [("participant1_id", 1), ("status", 1)]},
+        {"collection": "matches", "keys": [("participant2_id", 1), ("status", 1)]},
+    ],
+    "jobs": [
+        {"collection": "job_leases", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "payments": [
+        {"collection": "payments", "keys": [("id", 1)]},
+        {"collection": "payments", "keys": [("iyzico_token", 1)], "sparse": True},
+        {"collection": "payment_transactions", "keys": [("session_id", 1)]},
+    ],
+}
+
+
+def register_indexes(module: str, specs: List[dict]):
+    """Bir modülün index tanımlarını registry'ye ekle"""
+    INDEX_REGISTRY.setdefault(module, []).extend(specs)
+
+
+def _index_name(spec: dict) -> str:
+    """Tanım için deterministik index adı üret (MongoDB varsayılanı ile aynı)"""
+    if spec.get("name"):
+        return spec["name"]
+    return "_".join(f"{field}_{direction}" for field, direction in spec["keys"])
+
+
+def _index_options(spec: dict) -> dict:
+    """IndexModel'e geçirilecek seçenekler"""
+    return {k: v for k, v in spec.items() if k not in ("collection", "keys", "name")}
+
+
+def declared_indexes(modules: Optional[List[str]] = None) -> Dict[str, Dict[str, dict]]:
+    """Koleksiyon → {index_adı: tanım} eşlemesi (aynı index birden çok modülde tanımlanabilir)"""
+    result: Dict[str, Dict[str, dict]] = {}
+    for module, specs in INDEX_REGISTRY.items():
+        if modules and module not in modules:
+            continue
+        for spec in specs:
+            result.setdefault(spec["collection"], {})[_index_name(spec)] = spec
+    return result
+
+
+async def diff_indexes(db, modules: Optional[List[str]] = None) -> Dict[str, dict]:
+    """
+    Tanımlı ve canlı index'leri karşılaştır.
+
+    Her koleksiyon için: missing (tanımlı ama yok), changed (aynı ad, farklı seçenek),
+    extra (canlıda var ama registry'de yok) listeleri döner.
+    """
+    report = {}
+    for collection, declared in declared_indexes(modules).items():
+        live = await db[collection].index_information()
+        missing, changed = [], []
+        for name, spec in declared.items():
+            if name not in live:
+                missing.append(name)
+                continue
+            live_info = live[name]
+            if list(live_info.get("key", [])) != [tuple(k) for k in spec["keys"]]:
+                changed.append(name)
+            elif bool(live_info.get("unique", False)) != bool(spec.get("unique", False)):
+                changed.append(name)
+        extra = [name for name in live if name != "_id_" and name not in declared]
+        report[collection] = {"missing": missing, "changed": changed, "extra": extra}
+    return report
+
+
+async def ensure_indexes(db, dry_run: bool = False, modules: Optional[List[str]] = None) -> dict:
+    """
+    Registry'deki index'leri idempotent olarak uygula.
+
+    dry_run=True ise hiçbir şey oluşturulmaz, sadece eksik index'ler raporlanır.
+    Tek bir index'in başarısız olması (ör. mevcut verideki duplicate id'ler)
+    diğerlerini engellemez; hata raporda döner.
+    """
+    report = {"created": [], "existing": [], "failed": [], "dry_run": dry_run}
+
+    for collection, declared in declared_indexes(modules).items():
+        try:
+            live = await db[collection].index_information()
+        except OperationFailure:
+            live = {}
+
+        to_create = []
+        for name, spec in declared.items():
+            if name in live:
+                report["existing"].append(f"{collection}.{name}")
+            else:
+                to_create.append((name, spec))
+
+        if dry_run:
+            report["created"].extend(f"{collection}.{name}" for name, _ in to_create)
+            continue
+
+        # Her index'i ayrı oluştur: biri başarısız olursa diğerleri etkilenmesin
+        for name, spec in to_create:
+            try:
+                await db[collection].create_indexes([
+                    IndexModel(spec["keys"], name=name, **_index_options(spec))
+                ])
+                report["created"].append(f"{collection}.{name}")
+            except Exception as e:
+                logger.error(f"❌ Index oluşturulamadı {collection}.{name}: {e}")
+                report["failed"].append({"index": f"{collection}.{name}", "error": str(e)})
+
+    logger.info(
+        f"📇 Index registry {'(dry-run) ' if dry_run else ''}applied: "
+        f"{len(report['created'])} created, {len(report['existing'])} existing, "
+        f"{len(report['failed'])} failed"
+    )
+    return report
+
+
+async def _main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.environ.get("DB_NAME", "sports_management")]
+    modules = args.module or None
+
+    try:
+        if args.diff:
+            report = await diff_indexes(db, modules)
+            for collection, info in sorted(report.items()):
+                if not any(info.values()):
+                    continue
+                print(f"📂 {collection}")
+                for name in info["missing"]:
+                    print(f"   + {name} (missing)")
+                for name in info["changed"]:
+                    print(f"   ~ {name} (differs from registry)")
+                for name in info["extra"]:
+                    print(f"   - {name} (not in registry)")
+        else:
+            report = await ensure_indexes(db, dry_run=not args.apply, modules=modules)
+            label = "Would create" if report["dry_run"] else "Created"
+            for name in report["created"]:
+                print(f"✅ {label}: {name}")
+            for failure in report["failed"]:
+                print(f"❌ Failed: {failure['index']} - {failure['error']}")
+            print(f"ℹ️  {len(report['existing'])} index already present")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MongoDB index registry")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--diff", action="store_true", help="declared vs. live index farklarını göster")
+    group.add_argument("--dry-run", action="store_true", help="oluşturulacak index'leri raporla (varsayılan)")
+    group.add_argument("--apply", action="store_true", help="eksik index'leri oluştur")
+    parser.add_argument("--module", action="append", help="sadece belirtilen modül(ler)in index'leri")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
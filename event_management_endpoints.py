@@ -15,6 +15,7 @@ import logging
 
 # Auth import
 from auth import get_current_user
+from match_reminders import sync_match_reminders
 
 # Logger setup
 logger = logging.getLogger(__name__)
@@ -2733,6 +2734,8 @@ async def generate_fixture(
     # Yeni maçları kaydet
     if all_matches:
         await db.event_matches.insert_many(all_matches)
+    # Maç hatırlatmalarını yeni programa göre kur (silinen maçlarınkiler kalkar)
+    await sync_match_reminders(db, event_id=event_id)
     
     # Grup içi hakemlik bildirimleri gönder
     if in_group_refereeing:
@@ -2806,6 +2809,7 @@ async def delete_fixture(event_id: str, current_user: dict = None):
     # Tüm maçları sil
     match_result = await db.event_matches.delete_many({"event_id": event_id})
     deleted_matches = match_result.deleted_count
+    await sync_match_reminders(db, event_id=event_id)
     
     # Puan durumlarını sil
     standings_result = await db.event_standings.delete_many({"event_id": event_id})
@@ -2995,6 +2999,9 @@ async def update_match(event_id: str, match_id: str, update: MatchUpdate):
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Maç bulunamadı")
     
+    # Saat/durum/hakem değişmiş olabilir: hatırlatmaları yeniden kur
+    await sync_match_reminders(db, match_ids=[match_id])
+    
     # Saat değiştiyse oyunculara bildirim gönder
     if update.scheduled_time and old_match:
         old_time = old_match.get("scheduled_time")
@@ -4742,6 +4749,7 @@ async def assign_referee_to_match(event_id: str, match_id: str, referee_id: str
         {"id": match_id},
         {"$set": {"referee_id": referee_id}}
     )
+    await sync_match_reminders(db, match_ids=[match_id])
     
     return {"status": "success", "message": "Hakem atandı"}
 
@@ -4914,6 +4922,7 @@ async def auto_assign_courts(event_id: str, current_user: dict = None):
                 "scheduled_time": match["scheduled_time"]
             }}
         )
+    await sync_match_reminders(db, match_ids=[match["id"] for match in updated_matches])
     
     return {"status": "success", "message": f"{len(updated_matches)} maça saha atandı"}
 
@@ -12,6 +12,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 
 from auth import get_current_user
 from iyzico_service import IyzicoService
+from user_calendar import refresh_user_calendar
 
 # Database
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
@@ -540,6 +541,7 @@ async def event_payment_callback(request: Request):
                 "created_at": datetime.utcnow()
             }
             await db.calendar_items.insert_one(calendar_item)
+            await refresh_user_calendar(db, event_ids=[event_id], user_ids=[user_id])
             logger.info(f"📅 Calendar item added for user: {user_id}")
             
             # 4. KATILIMCIYA BİLDİRİM
@@ -0,0 +1,39 @@
+"""
+Event List Serializers
+Etkinlik listeleri için hızlı serileştirme: önceden oluşturulmuş TypeAdapter'lar ile
+tek seferde doğrulama + JSON üretimi (satır başına Event(**event) ve ardından
+response_model ile ikinci kez doğrulama yerine).
+"""
+from typing import List
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from models import Event, EventSummary
+
+EVENT_LIST_ADAPTER = TypeAdapter(List[Event])
+EVENT_SUMMARY_LIST_ADAPTER = TypeAdapter(List[EventSummary])
+
+# EventSummary alanları + sıralama/cursor alanları; görsellerden sadece kapak görseli
+EVENT_SUMMARY_PROJECTION = {
+    **{field: 1 for field in EventSummary.model_fields if field != "images"},
+    "images": {"$slice": 1},
+    "last_accessed": 1,
+    "_id": 0,
+}
+
+
+def normalize_event_doc(event: dict) -> dict:
+    """_id'yi kaldır ve dict olarak saklanmış katılımcıları ID listesine çevir"""
+    event.pop("_id", None)
+    participants = event.get("participants")
+    if participants and any(isinstance(p, dict) for p in participants):
+        event["participants"] = [p.get("id") if isinstance(p, dict) else p for p in participants]
+    return event
+
+
+def event_list_response(events: List[dict], summary: bool = False) -> Response:
+    """Ham Mongo dokümanlarını doğrulayıp doğrudan JSON Response olarak döndür"""
+    adapter = EVENT_SUMMARY_LIST_ADAPTER if summary else EVENT_LIST_ADAPTER
+    validated = adapter.validate_python([normalize_event_doc(event) for event in events])
+    return Response(content=adapter.dump_json(validated), media_type="application/json")
@@ -0,0 +1,82 @@
+"""
+Expo Push Stub Server
+Expo Push API'nin yerel taklidi: push_notification_service dispatcher'ını
+internete çıkmadan test etmek / benchmark etmek için.
+
+    uvicorn expo_stub_server:app --port 8099
+    EXPO_PUSH_URL=http://localhost:8099/--/api/v2/push/send
+    EXPO_RECEIPTS_URL=http://localhost:8099/--/api/v2/push/getReceipts
+
+Davranış:
+- İçinde "Dead" geçen token'lar için receipt DeviceNotRegistered döner
+- İçinde "Unregistered" geçen token'lar için ticket anında DeviceNotRegistered döner
+- EXPO_STUB_LATENCY_MS: her isteğe eklenen gecikme
+- EXPO_STUB_FAIL_EVERY: her N. send isteğine 503 döner (retry testi)
+"""
+import asyncio
+import os
+import uuid
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Expo Push Stub")
+
+LATENCY = float(os.environ.get("EXPO_STUB_LATENCY_MS", "0")) / 1000
+FAIL_EVERY = int(os.environ.get("EXPO_STUB_FAIL_EVERY", "0"))
+
+# İstatistikler ve ticket → token eşlemesi
+state: Dict = {"requests": 0, "messages": 0, "max_batch": 0, "tickets": {}}
+
+
+def _unregistered(token: str) -> dict:
+    return {
+        "status": "error",
+        "message": f'"{token}" is not a registered push notification recipient',
+        "details": {"error": "DeviceNotRegistered"}
+    }
+
+
+@app.post("/--/api/v2/push/send")
+async def push_send(request: Request):
+    payload = await request.json()
+    messages: List[dict] = payload if isinstance(payload, list) else [payload]
+    state["requests"] += 1
+
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    if FAIL_EVERY and state["requests"] % FAIL_EVERY == 0:
+        return JSONResponse(status_code=503, content={"errors": [{"code": "UNAVAILABLE"}]})
+    if len(messages) > 100:
+        return JSONResponse(status_code=400, content={"errors": [{"code": "PUSH_TOO_MANY_NOTIFICATIONS"}]})
+
+    state["messages"] += len(messages)
+    state["max_batch"] = max(state["max_batch"], len(messages))
+    tickets = []
+    for message in messages:
+        token = message.get("to", "")
+        if "Unregistered" in token:
+            tickets.append(_unregistered(token))
+            continue
+        ticket_id = str(uuid.uuid4())
+        state["tickets"][ticket_id] = token
+        tickets.append({"status": "ok", "id": ticket_id})
+    return {"data": tickets}
+
+
+@app.post("/--/api/v2/push/getReceipts")
+async def push_receipts(request: Request):
+    payload = await request.json()
+    receipts = {}
+    for ticket_id in payload.get("ids", []):
+        token = state["tickets"].get(ticket_id)
+        if token is None:
+            continue
+        receipts[ticket_id] = _unregistered(token) if "Dead" in token else {"status": "ok"}
+    return {"data": receipts}
+
+
+@app.get("/stats")
+async def stats():
+    return {k: v for k, v in state.items() if k != "tickets"}
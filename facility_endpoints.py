@@ -3,6 +3,7 @@ from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
 import os
+import math
 import uuid
 import logging
 
@@ -13,6 +14,10 @@ from models import (
     FacilityField
 )
 from auth import get_current_user
+from field_availability import (
+    claim_hours, hours_mask, load_day_masks, range_hours, release_hours, session_hours
+)
+from map_endpoints import calculate_distance
 
 # Setup
 router = APIRouter()
@@ -256,6 +261,45 @@ async def get_approved_facilities(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/facilities/search-available")
+async def search_available(
+    date: str,  # Format: YYYY-MM-DD
+    start_time: str,  # Format: HH:MM
+    end_time: str,  # Format: HH:MM
+    sport: Optional[str] = None,
+    city: Optional[str] = None,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius: float = 10,  # km
+    limit: int = 50
+):
+    """Tarih ve saat aralığında boş sahası olan tesisleri fiyatlarıyla getir (tek istekte)"""
+    try:
+        if (lat is None) != (lng is None):
+            raise HTTPException(status_code=400, detail="lat ve lng birlikte verilmeli")
+        if not city and lat is None:
+            raise HTTPException(status_code=400, detail="Şehir veya konum (lat/lng) gerekli")
+        limit = min(max(limit, 1), 200)
+        
+        facilities = await search_available_facilities(
+            db, date, start_time, end_time,
+            sport=sport, city=city, lat=lat, lng=lng, radius_km=radius, limit=limit
+        )
+        
+        logger.info(f"🔎 Müsait tesis araması ({city or f'{lat},{lng}'} {date} {start_time}-{end_time}): {len(facilities)} tesis")
+        return {
+            "success": True,
+            "facilities": facilities,
+            "count": len(facilities)
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Müsait tesis arama hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/facilities/my-facilities")
 async def get_my_facilities(
     current_user: dict = Depends(get_current_user)
@@ -1600,29 +1644,26 @@ async def _create_fields_for_facility(facility: dict, db):
 
 # ==================== MÜSAİT SAHALAR ENDPOINT ====================
 
-async def calculate_field_price_v2(
+def calculate_field_prices_v2(
     facility: dict,
-    field: dict,
-    field_index: int,  # Saha sırası (1, 2, 3...)
+    fields: List[tuple],  # [(field_index, field), ...]
     booking_date,  # datetime object
     start_time: str,
     end_time: str
-) -> float:
+) -> List[float]:
     """
-    YENİ V2 SİSTEM: Tesis bazlı dinamik fiyatlandırma
-    1. Tesis ücretsizse -> 0 TL
-    2. Dinamik fiyatlama yoksa -> Sabit saatlik fiyat
-    3. Dinamik fiyatlama varsa -> Hesapla
+    calculate_field_price_v2'nin toplu hali: tesis düzeyindeki kısımlar (ücretsiz mi,
+    zaman dilimi, hafta sonu/özel gün çarpanları) bir kez hesaplanır, sahalar yalnızca
+    saha çarpanıyla ayrışır. Sonuçlar fields sırasıyla döner.
     """
     try:
-        from datetime import datetime as dt
         import pytz
         
         # 1. TESİS ÜCRETSİZ Mİ?
         pricing = facility.get("pricing", {})
         if pricing.get("is_free"):
-            logger.info(f"💰 Saha {field.get('name')} - Ücretsiz tesis")
-            return 0.0
+            logger.debug(f"💰 Tesis {facility.get('name')} - Ücretsiz tesis")
+            return [0.0 for _ in fields]
         
         # GMT+3 timezone
         tz = pytz.timezone('Europe/Istanbul')
@@ -1635,9 +1676,12 @@ async def calculate_field_price_v2(
         if not pricing_v2 or not pricing_v2.get("use_dynamic_pricing_v2"):
             # Dinamik fiyatlandırma yok, STANDART saatlik fiyat kullan
             # Öncelik: 1. Saha fiyatı, 2. Tesis hourly_rate, 3. Varsayılan 80
-            default_price = field.get("hourly_rate") or pricing.get("hourly_rate") or pricing.get("base_price_per_hour", 80)
-            logger.info(f"💰 Saha {field.get('name')} - Standart fiyat: {default_price} TL (field={field.get('hourly_rate')}, pricing.hourly_rate={pricing.get('hourly_rate')})")
-            return default_price
+            prices = [
+                field.get("hourly_rate") or pricing.get("hourly_rate") or pricing.get("base_price_per_hour", 80)
+                for _, field in fields
+            ]
+            logger.debug(f"💰 Tesis {facility.get('name')} - Standart fiyat: {prices} TL (pricing.hourly_rate={pricing.get('hourly_rate')})")
+            return prices
         
         # 1. Temel fiyat (base_prices)
         base_prices = pricing_v2.get("base_prices", {})
@@ -1659,11 +1703,7 @@ async def calculate_field_price_v2(
         
         # 2. Saha çarpanı
         same_for_all = pricing_v2.get("same_for_all_fields", True)
-        if same_for_all:
-            field_mult = 1.0
-        else:
-            field_multipliers = pricing_v2.get("field_multipliers", {})
-            field_mult = float(field_multipliers.get(str(field_index), 1.0))
+        field_multipliers = pricing_v2.get("field_multipliers", {})
         
         # 3. Ölü dönem çarpanı
         dead_period_mult = float(pricing_v2.get("dead_period_multiplier", 1.0))
@@ -1687,13 +1727,19 @@ async def calculate_field_price_v2(
         else:
             time_mult = 1.0
         
-        # Final fiyat hesaplama
-        final_price = base_price * field_mult * dead_period_mult * time_mult
-        final_price = round(final_price, 2)
+        # Final fiyat hesaplama (saha bazında)
+        prices = []
+        for field_index, field in fields:
+            try:
+                field_mult = 1.0 if same_for_all else float(field_multipliers.get(str(field_index), 1.0))
+                prices.append(round(base_price * field_mult * dead_period_mult * time_mult, 2))
+            except Exception as e:
+                logger.error(f"❌ Saha çarpanı hatası ({field.get('name')}): {str(e)}")
+                prices.append(field.get("hourly_rate") or pricing.get("hourly_rate", 80))
         
-        logger.info(f"💰 Saha {field.get('name')} - Dinamik V2: {final_price} TL (base={base_price}, field_mult={field_mult}, dead={dead_period_mult}, time_mult={time_mult})")
+        logger.debug(f"💰 Tesis {facility.get('name')} - Dinamik V2: {prices} TL (base={base_price}, dead={dead_period_mult}, time_mult={time_mult})")
         
-        return final_price
+        return prices
         
     except Exception as e:
         logger.error(f"❌ Fiyat hesaplama hatası: {str(e)}")
@@ -1701,7 +1747,260 @@ async def calculate_field_price_v2(
         traceback.print_exc()
         # Öncelik: saha fiyatı -> tesis hourly_rate -> 80
         pricing = facility.get("pricing", {})
-        return field.get("hourly_rate") or pricing.get("hourly_rate", 80)
+        return [field.get("hourly_rate") or pricing.get("hourly_rate", 80) for _, field in fields]
+
+
+async def calculate_field_price_v2(
+    facility: dict,
+    field: dict,
+    field_index: int,  # Saha sırası (1, 2, 3...)
+    booking_date,  # datetime object
+    start_time: str,
+    end_time: str
+) -> float:
+    """
+    YENİ V2 SİSTEM: Tesis bazlı dinamik fiyatlandırma
+    1. Tesis ücretsizse -> 0 TL
+    2. Dinamik fiyatlama yoksa -> Sabit saatlik fiyat
+    3. Dinamik fiyatlama varsa -> Hesapla
+    """
+    return calculate_field_prices_v2(facility, [(field_index, field)], booking_date, start_time, end_time)[0]
+
+
+DAY_NAMES_TR = {
+    'monday': 'pazartesi',
+    'tuesday': 'salı',
+    'wednesday': 'çarşamba',
+    'thursday': 'perşembe',
+    'friday': 'cuma',
+    'saturday': 'cumartesi',
+    'sunday': 'pazar'
+}
+
+
+def facility_open_hours(facility: dict, selected_date) -> Optional[tuple]:
+    """Tesisin o gün açık olduğu saat aralığı (open_hour, close_hour); kapalıysa None"""
+    day_name_en = selected_date.strftime("%A").lower()  # monday, tuesday, etc.
+    day_name_tr = DAY_NAMES_TR.get(day_name_en, day_name_en)
+    working_hours = facility.get("working_hours", {})
+    day_hours_obj = None
+    
+    # CRITICAL: working_hours iki format olabilir
+    # Format 1 (eski): {"monday": {"open": "08:00", "close": "20:00"}}
+    # Format 2 (yeni): [{"day": "monday", "opening_time": "08:00", "closing_time": "20:00"}]
+    if isinstance(working_hours, dict):
+        day_hours_obj = working_hours.get(day_name_en, working_hours.get(day_name_tr))
+    elif isinstance(working_hours, list):
+        for wh in working_hours:
+            if wh.get("day") == day_name_en or wh.get("day") == day_name_tr:
+                if wh.get("is_open", True):
+                    day_hours_obj = wh
+                break
+    
+    if not isinstance(day_hours_obj, dict):
+        return None
+    
+    open_time = day_hours_obj.get("open") or day_hours_obj.get("opening_time")
+    close_time = day_hours_obj.get("close") or day_hours_obj.get("closing_time")
+    if not open_time or not close_time:
+        return None
+    try:
+        return int(open_time.split(":")[0]), int(close_time.split(":")[0])
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def parse_availability_window(date: str, start_time: str, end_time: str) -> tuple:
+    """YYYY-MM-DD + HH:MM-HH:MM → (datetime, start_hour, end_hour); hatalıysa 400"""
+    try:
+        selected_date = datetime.strptime(date, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Geçersiz tarih formatı (YYYY-MM-DD kullanın)")
+    try:
+        start_hour = int(start_time.split(":")[0])
+        end_hour = int(end_time.split(":")[0])
+    except (AttributeError, ValueError):
+        raise HTTPException(status_code=400, detail="Geçersiz saat formatı (HH:MM kullanın)")
+    return selected_date, start_hour, end_hour
+
+
+def available_fields_with_prices(
+    facility: dict,
+    all_fields: List[dict],
+    day_masks: dict,
+    selected_date,
+    start_hour: int,
+    end_hour: int,
+    start_time: str,
+    end_time: str
+) -> List[dict]:
+    """
+    Tesisin istenen saatlerde boş sahaları, hourly_rate/pricing_type eklenmiş olarak.
+    all_fields tesisin tüm aktif sahaları olmalı (created_at sırasıyla) çünkü saha
+    numarası (field_index) fiyat çarpanını belirler.
+    """
+    open_hours = facility_open_hours(facility, selected_date)
+    if not open_hours:
+        logger.debug(f"   Tesis {facility.get('id')} - {selected_date.strftime('%A').lower()} günü çalışma saati yok")
+        return []
+    if not (open_hours[0] <= start_hour and end_hour <= open_hours[1]):
+        logger.debug(f"   Tesis {facility.get('id')} - İstenen saat ({start_hour}-{end_hour}) çalışma saatleri ({open_hours[0]}-{open_hours[1]}) dışında")
+        return []
+    
+    # İstenen saatler müsait mi? (pending/confirmed rezervasyon bitleri)
+    requested_mask = hours_mask(range(start_hour, end_hour))
+    free = [
+        (field_index, field)
+        for field_index, field in enumerate(all_fields, 1)  # Saha numarası (1, 2, 3...)
+        if not day_masks.get(str(field["id"]), 0) & requested_mask
+    ]
+    
+    # DİNAMİK FİYATLANDIRMA V2: tesis başına tek hesap
+    prices = calculate_field_prices_v2(facility, free, selected_date, start_time, end_time)
+    pricing_type = "dynamic_v2" if facility.get("pricing_v2", {}).get("use_dynamic_pricing_v2") else "fixed"
+    for (_, field), price in zip(free, prices):
+        field["hourly_rate"] = price
+        field["pricing_type"] = pricing_type
+    return [field for _, field in free]
+
+
+# Çoklu tesis müsaitlik araması: tesisler, sahalar ve doluluk maskeleri üçer $in okuması
+SEARCH_MAX_FACILITIES = int(os.getenv("FACILITY_SEARCH_MAX_FACILITIES", "2000"))
+SEARCH_FACILITY_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "city": 1, "district": 1, "address": 1,
+    "latitude": 1, "longitude": 1, "sports": 1, "pricing": 1, "pricing_v2": 1,
+    "working_hours": 1, "rating": 1, "review_count": 1,
+}
+SEARCH_FIELD_PROJECTION = {
+    "reservations": 0, "session_history": 0, "active_session": 0, "current_reservation": 0,
+}
+
+
+def _sport_matches(sport: str, names: List[str]) -> bool:
+    return any(sport.lower() in (name or "").lower() for name in names)
+
+
+def _facility_sport_names(facility: dict) -> List[str]:
+    # sports array'i string veya object olabilir
+    names = []
+    for s in facility.get("sports", []) or []:
+        if isinstance(s, str):
+            names.append(s)
+        elif isinstance(s, dict):
+            names.append(s.get("name", "") or s.get("sport_type", "") or s.get("sport_name", ""))
+    return names
+
+
+async def search_available_facilities(
+    db,
+    date: str,
+    start_time: str,
+    end_time: str,
+    sport: Optional[str] = None,
+    city: Optional[str] = None,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius_km: float = 10,
+    limit: int = 50
+) -> List[dict]:
+    """
+    İstenen tarih/saatte boş sahası olan onaylı tesisler, sahaların hesaplanmış
+    fiyatlarıyla. lat/lng verilirse mesafeye, verilmezse en düşük fiyata göre sıralı.
+    """
+    selected_date, start_hour, end_hour = parse_availability_window(date, start_time, end_time)
+    
+    query = {"status": "approved", "is_published": True}
+    if city:
+        query["city"] = city
+    if lat is not None and lng is not None:
+        # Kaba kutu filtresi index'ten, kesin mesafe aşağıda haversine ile
+        lat_delta = radius_km / 111.0
+        lng_delta = radius_km / max(111.0 * math.cos(math.radians(lat)), 1e-6)
+        query["latitude"] = {"$gte": lat - lat_delta, "$lte": lat + lat_delta}
+        query["longitude"] = {"$gte": lng - lng_delta, "$lte": lng + lng_delta}
+    
+    facilities = await db.facilities.find(query, SEARCH_FACILITY_PROJECTION).to_list(SEARCH_MAX_FACILITIES)
+    
+    candidates = {}
+    for facility in facilities:
+        if sport and not _sport_matches(sport, _facility_sport_names(facility)):
+            continue
+        distance = None
+        if lat is not None and lng is not None:
+            distance = calculate_distance(lat, lng, facility["latitude"], facility["longitude"])
+            if distance > radius_km:
+                continue
+        # Kapalı tesisler için saha okumaya gerek yok
+        open_hours = facility_open_hours(facility, selected_date)
+        if not open_hours or not (open_hours[0] <= start_hour and end_hour <= open_hours[1]):
+            continue
+        facility["distance_km"] = round(distance, 2) if distance is not None else None
+        candidates[facility["id"]] = facility
+    
+    if not candidates:
+        return []
+    
+    # created_at sırası field_index'i (saha fiyat çarpanı) belirler, tesis bazında korunur
+    fields = await db.facility_fields.find(
+        {"facility_id": {"$in": list(candidates)}, "is_active": True},
+        SEARCH_FIELD_PROJECTION
+    ).sort("created_at", 1).to_list(None)
+    
+    fields_by_facility = {}
+    for field in fields:
+        if "_id" in field and "id" not in field:
+            field["id"] = field["_id"]
+        field.pop("_id", None)
+        fields_by_facility.setdefault(field["facility_id"], []).append(field)
+    
+    day_masks = await load_day_masks(db, [field["id"] for field in fields], date)
+    
+    results = []
+    for facility_id, facility_fields in fields_by_facility.items():
+        facility = candidates[facility_id]
+        available = available_fields_with_prices(
+            facility, facility_fields, day_masks, selected_date, start_hour, end_hour, start_time, end_time
+        )
+        if sport:
+            available = [
+                field for field in available
+                if not field.get("sport_type") or _sport_matches(sport, [field["sport_type"]])
+            ]
+        if not available:
+            continue
+        
+        results.append({
+            "id": facility_id,
+            "name": facility.get("name"),
+            "city": facility.get("city"),
+            "district": facility.get("district"),
+            "address": facility.get("address"),
+            "latitude": facility.get("latitude"),
+            "longitude": facility.get("longitude"),
+            "rating": facility.get("rating"),
+            "review_count": facility.get("review_count", 0),
+            "distance_km": facility["distance_km"],
+            "min_price": min(field["hourly_rate"] for field in available),
+            "available_count": len(available),
+            "total_fields": len(facility_fields),
+            "available_fields": [
+                {
+                    "id": field["id"],
+                    "field_name": field.get("field_name") or field.get("name"),
+                    "sport_type": field.get("sport_type"),
+                    "field_type": field.get("field_type"),
+                    "hourly_rate": field["hourly_rate"],
+                    "pricing_type": field["pricing_type"],
+                }
+                for field in available
+            ],
+        })
+    
+    if lat is not None and lng is not None:
+        results.sort(key=lambda r: (r["distance_km"], r["min_price"]))
+    else:
+        results.sort(key=lambda r: (r["min_price"], r["name"] or ""))
+    return results[:limit]
 
 
 @router.get("/facilities/{facility_id}/available-fields")
@@ -1713,36 +2012,9 @@ async def get_available_fields(
 ):
     """Belirli tarih ve saat aralığında müsait sahaları getir"""
     try:
-        from datetime import datetime, timedelta
-        
         logger.info(f"🏟️ Müsait sahalar getiriliyor - Tesis: {facility_id}, Tarih: {date}, Saat: {start_time}-{end_time}")
         
-        # Tarihi parse et
-        try:
-            selected_date = datetime.strptime(date, "%Y-%m-%d")
-            day_name_en = selected_date.strftime("%A").lower()  # monday, tuesday, etc.
-            
-            # Türkçe gün isimleri map
-            day_map = {
-                'monday': 'pazartesi',
-                'tuesday': 'salı',
-                'wednesday': 'çarşamba',
-                'thursday': 'perşembe',
-                'friday': 'cuma',
-                'saturday': 'cumartesi',
-                'sunday': 'pazar'
-            }
-            day_name_tr = day_map.get(day_name_en, day_name_en)
-        except:
-            raise HTTPException(status_code=400, detail="Geçersiz tarih formatı (YYYY-MM-DD kullanın)")
-        
-        # Saatleri parse et
-        try:
-            start_hour = int(start_time.split(":")[0])
-            end_hour = int(end_time.split(":")[0])
-            requested_hours = list(range(start_hour, end_hour))
-        except:
-            raise HTTPException(status_code=400, detail="Geçersiz saat formatı (HH:MM kullanın)")
+        selected_date, start_hour, end_hour = parse_availability_window(date, start_time, end_time)
         
         # Tesisi getir (working_hours için)
         facility = await db.facilities.find_one({"id": facility_id})
@@ -1767,102 +2039,18 @@ async def get_available_fields(
                 "message": "Bu tesiste henüz saha bulunmuyor"
             }
         
-        available_fields = []
-        
         for field in all_fields:
             # CRITICAL: MongoDB'de _id var ama id yok, _id'yi id olarak kullan
             if "_id" in field and "id" not in field:
                 field["id"] = field["_id"]
             field.pop("_id", None)
-            
-            field_id = field.get("id", "unknown")
-            
-            # 1. TESİSİN çalışma saatlerini kontrol et (sahada değil)
-            working_hours = facility.get("working_hours", {})
-            day_hours_obj = None
-            
-            # CRITICAL: working_hours iki format olabilir
-            # Format 1 (eski): {"monday": {"open": "08:00", "close": "20:00"}}
-            # Format 2 (yeni): [{"day": "monday", "opening_time": "08:00", "closing_time": "20:00"}]
-            
-            if isinstance(working_hours, dict):
-                # Format 1 - dict
-                day_hours_obj = working_hours.get(day_name_en, working_hours.get(day_name_tr))
-            elif isinstance(working_hours, list):
-                # Format 2 - array
-                for wh in working_hours:
-                    if wh.get("day") == day_name_en or wh.get("day") == day_name_tr:
-                        if wh.get("is_open", True):
-                            day_hours_obj = wh
-                        break
-            
-            if not day_hours_obj:
-                logger.warning(f"   Saha {field_id[:8] if isinstance(field_id, str) else field_id}... - {day_name_en} günü çalışma saati yok")
-                continue  # Bu gün çalışmıyor
-            
-            # working_hours formatına göre open/close time çıkar
-            if isinstance(day_hours_obj, dict):
-                open_time = day_hours_obj.get("open") or day_hours_obj.get("opening_time")
-                close_time = day_hours_obj.get("close") or day_hours_obj.get("closing_time")
-                
-                if not open_time or not close_time:
-                    continue
-                
-                try:
-                    range_start_hour = int(open_time.split(":")[0])
-                    range_end_hour = int(close_time.split(":")[0])
-                    
-                    # Kullanıcının istediği saatler çalışma saatleri içinde mi?
-                    if range_start_hour <= start_hour and end_hour <= range_end_hour:
-                        is_field_working = True
-                    else:
-                        logger.info(f"   Saha {field.get('id')[:8]}... - İstenen saat ({start_hour}-{end_hour}) çalışma saatleri ({range_start_hour}-{range_end_hour}) dışında")
-                        continue
-                except Exception as e:
-                    logger.error(f"   Saha {field.get('id')[:8]}... - Saat parse hatası: {e}")
-                    continue
-            else:
-                logger.warning(f"   Saha {field.get('id')[:8]}... - working_hours formatı hatalı: {day_hours_obj}")
-                continue
-            
-            # 2. O tarih ve saatlerde rezervasyon var mı kontrol et
-            reservations = await db.reservations.find({
-                "field_id": field["id"],
-                "date": date,
-                "status": {"$in": ["pending", "confirmed"]}  # İptal edilenler hariç
-            }).to_list(100)
-            
-            # Rezerve edilmiş saatleri topla
-            reserved_hours = set()
-            for reservation in reservations:
-                time_slots = reservation.get("time_slots", [])
-                for slot in time_slots:
-                    try:
-                        hour = int(slot.split(":")[0])
-                        reserved_hours.add(hour)
-                    except:
-                        continue
-            
-            # İstenen saatler müsait mi?
-            is_available = all(hour not in reserved_hours for hour in requested_hours)
-            
-            if is_available:
-                # 3. DİNAMİK FİYATLANDIRMA V2: Tesis bazlı fiyat hesaplama
-                field_index = all_fields.index(field) + 1  # Saha numarası (1, 2, 3...)
-                
-                calculated_price = await calculate_field_price_v2(
-                    facility=facility,
-                    field=field,
-                    field_index=field_index,
-                    booking_date=selected_date,
-                    start_time=start_time,
-                    end_time=end_time
-                )
-                
-                field["hourly_rate"] = calculated_price
-                field["pricing_type"] = "dynamic_v2" if facility.get("pricing_v2", {}).get("use_dynamic_pricing_v2") else "fixed"
-                
-                available_fields.append(field)
+        
+        # Tüm sahaların o günkü doluluk maskeleri tek okumada
+        day_masks = await load_day_masks(db, [field["id"] for field in all_fields], date)
+        
+        available_fields = available_fields_with_prices(
+            facility, all_fields, day_masks, selected_date, start_hour, end_hour, start_time, end_time
+        )
         
         logger.info(f"✅ {len(available_fields)}/{len(all_fields)} saha müsait")
         
@@ -2034,7 +2222,18 @@ async def create_manual_reservation(
             "created_at": datetime.utcnow().isoformat()
         }
         
-        await db.manual_reservations.insert_one(reservation)
+        # Saatleri atomik olarak ayır (aynı saate eşzamanlı rezervasyonlardan yalnızca biri geçer)
+        slot_hours = range_hours(reservation["start_time"], reservation["end_time"])
+        if not slot_hours:
+            raise HTTPException(status_code=400, detail="Geçersiz saat aralığı")
+        if not await claim_hours(db, reservation["field_id"], reservation["date"], slot_hours, facility_id):
+            raise HTTPException(status_code=400, detail="Seçilen saat aralığında saha dolu")
+        
+        try:
+            await db.manual_reservations.insert_one(reservation)
+        except Exception:
+            await release_hours(db, reservation["field_id"], reservation["date"], slot_hours)
+            raise
         reservation.pop("_id", None)
         
         logger.info(f"✅ Manuel rezervasyon oluşturuldu: {reservation['id']}")
@@ -2205,18 +2404,30 @@ async def create_field_reservation(
             "status": "confirmed"
         }
         
+        # Saatleri atomik olarak ayır (aynı saate eşzamanlı rezervasyonlardan yalnızca biri geçer)
+        slot_field_id = field.get("id") or str(field.get("_id"))
+        slot_date, slot_hours = session_hours(reservation["start_time"], reservation["duration"])
+        if not slot_date or not slot_hours:
+            raise HTTPException(status_code=400, detail="Geçersiz başlangıç zamanı")
+        if not await claim_hours(db, slot_field_id, slot_date, slot_hours, facility_id):
+            raise HTTPException(status_code=400, detail="Seçilen saat aralığında saha dolu")
+        
         # Güncelleme query'sini field'ın _id'sine göre yap
         update_query = {"_id": field.get("_id")} if field.get("_id") else {"id": field.get("id")}
         
         # Rezervasyonu reservations array'ine ekle (is_occupied DEĞİŞMEZ)
-        await db.facility_fields.update_one(
-            update_query,
-            {
-                "$push": {
-                    "reservations": reservation
+        try:
+            await db.facility_fields.update_one(
+                update_query,
+                {
+                    "$push": {
+                        "reservations": reservation
+                    }
                 }
-            }
-        )
+            )
+        except Exception:
+            await release_hours(db, slot_field_id, slot_date, slot_hours)
+            raise
         
         # Log kaydı oluştur
         await log_user_activity(
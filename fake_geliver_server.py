@@ -0,0 +1,73 @@
+"""
+Fake Geliver Server
+Geliver kargo takip API'sinin yerel taklidi: kargo takip job'unu ve
+geliver_endpoints'in retry/pool davranışını internete çıkmadan test etmek için.
+
+    uvicorn fake_geliver_server:app --port 8098
+    GELIVER_API_URL=http://localhost:8098/api/v1 GELIVER_API_TOKEN=fake
+
+Davranış:
+- Barkodun hash'ine göre deterministik bir trackingStatusCode döner
+- İçinde "missing" geçen barkodlar için boş transaction listesi döner
+- FAKE_GELIVER_LATENCY_MS: her isteğe eklenen gecikme
+- FAKE_GELIVER_RATE_LIMIT_EVERY: her N. isteğe 429 (Retry-After: 0) döner
+- FAKE_GELIVER_FAIL_EVERY: her N. isteğe 503 döner
+"""
+import asyncio
+import os
+import zlib
+from typing import Dict
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Fake Geliver")
+
+LATENCY = float(os.environ.get("FAKE_GELIVER_LATENCY_MS", "0")) / 1000
+RATE_LIMIT_EVERY = int(os.environ.get("FAKE_GELIVER_RATE_LIMIT_EVERY", "0"))
+FAIL_EVERY = int(os.environ.get("FAKE_GELIVER_FAIL_EVERY", "0"))
+
+STATUS_CODES = ["PRE_TRANSIT", "IN_TRANSIT", "OUT_FOR_DELIVERY", "DELIVERED"]
+
+state: Dict = {"requests": 0, "rate_limited": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def tracking_status_for(barcode: str) -> str:
+    """Barkod için fake sunucunun döndüreceği durum kodu"""
+    return STATUS_CODES[zlib.crc32(barcode.encode()) % len(STATUS_CODES)]
+
+
+@app.get("/api/v1/transactions")
+async def transactions(barcode: str = ""):
+    state["requests"] += 1
+    state["in_flight"] += 1
+    state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+    try:
+        if LATENCY:
+            await asyncio.sleep(LATENCY)
+        if RATE_LIMIT_EVERY and state["requests"] % RATE_LIMIT_EVERY == 0:
+            state["rate_limited"] += 1
+            return JSONResponse(status_code=429, headers={"Retry-After": "0"},
+                                content={"result": False, "message": "Too many requests"})
+        if FAIL_EVERY and state["requests"] % FAIL_EVERY == 0:
+            state["failed"] += 1
+            return JSONResponse(status_code=503, content={"result": False, "message": "Unavailable"})
+    finally:
+        state["in_flight"] -= 1
+
+    if "missing" in barcode:
+        return {"result": True, "data": {"transactions": []}}
+    code = tracking_status_for(barcode)
+    return {
+        "result": True,
+        "data": {"transactions": [{
+            "barcode": barcode,
+            "trackingStatus": {"trackingStatusCode": code, "statusDetails": code.replace("_", " ").title()},
+            "trackingEvents": []
+        }]}
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return state
@@ -0,0 +1,430 @@
+"""
+Field Availability Index
+Saha bazında günlük doluluk bit maskesi: her (saha, gün) için tek doküman
+
+    {"_id": "<field_id>|2025-06-01", "field_id": ..., "date": "2025-06-01", "mask": 0b...}
+
+mask'ın h. biti, o gün h:00-h+1:00 saatinin dolu olduğunu gösterir. Dolu sayılanlar:
+- reservations: field_id'li, pending/confirmed/payment_pending (ödeme bekleyen tutma)
+  rezervasyonların time_slots'u; venue rezervasyonlarında onaylanan (approved/paid)
+  approved_time_slot (anahtar venue_id)
+- manual_reservations: tesis sahibinin girdiği start_time-end_time aralığı
+- facility_fields.reservations: sahadan açılan anlık rezervasyonlar (start_time + duration)
+
+Yeni rezervasyonlar claim_hours()/claim_reservation() ile yer ayırır: maskede istenen
+bitler boşsa tek bir koşullu $bit or ile hepsi birden alınır, değilse hiçbiri alınmaz;
+aynı saate gelen eşzamanlı isteklerden yalnızca biri kazanır (global kilit yok).
+Rezervasyon dolu sayılan bir duruma girince block_reservation(), çıkınca (iptal/red/
+tamamlandı/süresi dolan ödeme) güncelleme öncesi dokümanla release_reservation()
+maskeyi atomik $bit or/and ile günceller; bırakılan saatler o günün kaynaklarından
+yeniden hesaplanır, başka bir kaydın tuttuğu saatler dolu kalır. Bir tesisin tüm sahaları için müsaitlik
+sorgusu tek $in okuması + bit işlemleridir.
+
+Doküman yoksa (eski veriler, hiç rezervasyon almamış gün) okumada yukarıdaki
+kaynaklardan bellekte hesaplanır; doküman yalnızca ilk yazmada (claim/block/release)
+oluşturulur, arama trafiği koleksiyonu büyütmez. Toplu yeniden hesaplama için:
+
+    python field_availability.py --rebuild [--from 2025-01-01]
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cachetools import TTLCache
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "field_availability"
+BLOCKING_STATUSES = ["pending", "confirmed", "payment_pending"]
+VENUE_BLOCKING_STATUSES = ["approved", "paid"]
+HOURS_PER_DAY = 24
+FULL_DAY = (1 << HOURS_PER_DAY) - 1
+
+# Ödemesi tamamlanmayan rezervasyonun saatleri bu süre sonunda serbest kalır
+PAYMENT_HOLD_MINUTES = int(os.getenv("RESERVATION_PAYMENT_HOLD_MINUTES", "30"))
+
+# (saha, gün) → mask; her worker'ın kendi cache'i var, yazmalar yerel kaydı düşürür,
+# TTL diğer worker'lardaki bayat maskeleri sınırlar
+AVAILABILITY_CACHE_TTL = int(os.getenv("FIELD_AVAILABILITY_CACHE_TTL", "5"))
+_mask_cache = TTLCache(maxsize=8192, ttl=AVAILABILITY_CACHE_TTL)
+
+
+def day_key(field_id, date: str) -> str:
+    return f"{field_id}|{date}"
+
+
+def _hour(value) -> Optional[int]:
+    try:
+        return int(str(value).split(":")[0])
+    except (TypeError, ValueError):
+        return None
+
+
+def slot_hours(time_slots: Optional[Iterable[str]]) -> List[int]:
+    """["14:00", "15:00"] → [14, 15]; bozuk girdiler atlanır"""
+    hours = []
+    for slot in time_slots or []:
+        hour = _hour(slot)
+        if hour is not None and 0 <= hour < HOURS_PER_DAY:
+            hours.append(hour)
+    return hours
+
+
+def _minutes(value) -> Optional[int]:
+    try:
+        hour, _, minute = str(value).partition(":")
+        return int(hour) * 60 + int(minute[:2] or 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def range_hours(start_time: str, end_time: str) -> List[int]:
+    """
+    "19:00"-"21:00" → [19, 20]; yarım kalan son saat de dolu sayılır
+    ("19:00"-"20:30" → [19, 20]), "00:00" bitiş gece yarısıdır ("23:00"-"00:00" → [23])
+    """
+    start, end = _minutes(start_time), _minutes(end_time)
+    if start is None or end is None:
+        return []
+    if end == 0:
+        end = HOURS_PER_DAY * 60
+    return list(range(max(start // 60, 0), min(math.ceil(end / 60), HOURS_PER_DAY)))
+
+
+def session_hours(start_time, duration_minutes) -> Tuple[Optional[str], List[int]]:
+    """ISO başlangıç + dakika → (YYYY-MM-DD, kapsanan saatler)"""
+    try:
+        start = start_time if isinstance(start_time, datetime) else datetime.fromisoformat(str(start_time).replace("Z", ""))
+        minutes = int(duration_minutes or 60)
+    except (TypeError, ValueError):
+        return None, []
+    first = start.hour
+    last = math.ceil((start.hour * 60 + start.minute + minutes) / 60)
+    return start.strftime("%Y-%m-%d"), list(range(first, min(last, HOURS_PER_DAY)))
+
+
+def hours_mask(hours: Iterable[int]) -> int:
+    mask = 0
+    for hour in hours:
+        if 0 <= hour < HOURS_PER_DAY:
+            mask |= 1 << hour
+    return mask
+
+
+def mask_hours(mask: int) -> List[int]:
+    return [hour for hour in range(HOURS_PER_DAY) if mask >> hour & 1]
+
+
+def reservation_hold(reservation: dict) -> Optional[Tuple[str, int]]:
+    """Rezervasyon dokümanının tuttuğu (kaynak id, mask); dolu sayılmıyorsa None"""
+    status = reservation.get("status")
+    if reservation.get("field_id") and status in BLOCKING_STATUSES:
+        mask = hours_mask(slot_hours(reservation.get("time_slots")))
+        resource_id = reservation["field_id"]
+    elif reservation.get("venue_id") and status in VENUE_BLOCKING_STATUSES:
+        mask = hours_mask(slot_hours([reservation.get("approved_time_slot")]))
+        resource_id = reservation["venue_id"]
+    else:
+        return None
+    return (str(resource_id), mask) if mask else None
+
+
+def _date_matches(date: Optional[str], date_query) -> bool:
+    if not date:
+        return False
+    if isinstance(date_query, str):
+        return date == date_query
+    return date >= date_query.get("$gte", "")
+
+
+async def _occupied_masks(db, date_query, resource_ids: List[str] = None) -> Dict[str, Tuple[int, Optional[str]]]:
+    """Tüm kaynaklardan gün anahtarı → (mask, facility_id)"""
+    id_filter = {"$in": resource_ids} if resource_ids is not None else {"$exists": True, "$ne": None}
+    masks: Dict[str, Tuple[int, Optional[str]]] = {}
+
+    def add(resource_id, date, mask, facility_id=None):
+        if not mask:
+            return
+        key = day_key(resource_id, date)
+        current, current_facility = masks.get(key, (0, None))
+        masks[key] = (current | mask, current_facility or facility_id)
+
+    reservations = await db.reservations.find(
+        {"date": date_query, "$or": [
+            {"field_id": id_filter, "status": {"$in": BLOCKING_STATUSES}},
+            {"venue_id": id_filter, "status": {"$in": VENUE_BLOCKING_STATUSES}},
+        ]},
+        {"_id": 0, "field_id": 1, "venue_id": 1, "facility_id": 1, "date": 1, "status": 1,
+         "time_slots": 1, "approved_time_slot": 1}
+    ).to_list(None)
+    for reservation in reservations:
+        hold = reservation_hold(reservation)
+        if hold:
+            add(hold[0], reservation["date"], hold[1], reservation.get("facility_id"))
+
+    manual = await db.manual_reservations.find(
+        {"field_id": id_filter, "date": date_query, "status": {"$ne": "cancelled"}},
+        {"_id": 0, "field_id": 1, "facility_id": 1, "date": 1, "start_time": 1, "end_time": 1}
+    ).to_list(None)
+    for reservation in manual:
+        add(reservation["field_id"], reservation["date"],
+            hours_mask(range_hours(reservation.get("start_time"), reservation.get("end_time"))),
+            reservation.get("facility_id"))
+
+    field_query = {"reservations.0": {"$exists": True}}
+    if resource_ids is not None:
+        field_query["id"] = {"$in": resource_ids}
+    fields = await db.facility_fields.find(
+        field_query, {"id": 1, "facility_id": 1, "reservations.start_time": 1, "reservations.duration": 1}
+    ).to_list(None)
+    for field in fields:
+        for reservation in field.get("reservations", []):
+            date, hours = session_hours(reservation.get("start_time"), reservation.get("duration"))
+            if _date_matches(date, date_query):
+                add(field.get("id") or str(field["_id"]), date, hours_mask(hours), field.get("facility_id"))
+
+    return masks
+
+
+async def _create_days(db, field_ids: List[str], date: str, facility_id: str = None):
+    """Eksik günlük dokümanları kaynaklardan hesaplayıp oluştur (varsa dokunmaz)"""
+    masks = await _occupied_masks(db, date, field_ids)
+    now = datetime.utcnow()
+    await db[COLLECTION].bulk_write([
+        UpdateOne(
+            {"_id": day_key(field_id, date)},
+            {"$setOnInsert": {
+                "field_id": field_id,
+                "facility_id": facility_id or masks.get(day_key(field_id, date), (0, None))[1],
+                "date": date,
+                "mask": masks.get(day_key(field_id, date), (0, None))[0],
+                "updated_at": now,
+            }},
+            upsert=True
+        )
+        for field_id in field_ids
+    ], ordered=False)
+
+
+async def load_day_masks(db, field_ids: List[str], date: str) -> Dict[str, int]:
+    """Sahaların o günkü doluluk maskeleri: field_id → mask"""
+    field_ids = [str(field_id) for field_id in field_ids]
+    masks = {}
+    missing = []
+    for field_id in field_ids:
+        cached = _mask_cache.get(day_key(field_id, date))
+        if cached is None:
+            missing.append(field_id)
+        else:
+            masks[field_id] = cached
+
+    if missing:
+        docs = await db[COLLECTION].find(
+            {"_id": {"$in": [day_key(field_id, date) for field_id in missing]}},
+            {"field_id": 1, "mask": 1}
+        ).to_list(None)
+        for doc in docs:
+            masks[doc["field_id"]] = doc.get("mask", 0)
+            _mask_cache[doc["_id"]] = doc.get("mask", 0)
+        missing = [field_id for field_id in missing if field_id not in masks]
+
+    if missing:
+        # Gün dokümanı yok: okuma için bellekte hesapla, doküman ilk yazmada oluşur
+        computed = await _occupied_masks(db, date, missing)
+        for field_id in missing:
+            key = day_key(field_id, date)
+            masks[field_id] = computed.get(key, (0, None))[0]
+            _mask_cache[key] = masks[field_id]
+    return masks
+
+
+async def _apply_bits(db, resource_id: str, date: str, mask: int, op: str, facility_id: str = None):
+    key = day_key(resource_id, date)
+    value = mask if op == "or" else ~mask & FULL_DAY
+    update = {"$bit": {"mask": {op: value}}, "$set": {"updated_at": datetime.utcnow()}}
+    result = await db[COLLECTION].update_one({"_id": key}, update)
+    if result.matched_count == 0:
+        # Gün dokümanı yok: rezervasyonun güncel durumu dahil baştan hesapla;
+        # $bit or/and idempotent olduğundan tekrar uygulamak güvenli
+        await _create_days(db, [resource_id], date, facility_id)
+        await db[COLLECTION].update_one({"_id": key}, update)
+    _mask_cache.pop(key, None)
+
+
+async def claim_hours(db, resource_id, date: str, hours: Iterable[int], facility_id: str = None) -> bool:
+    """
+    Saatleri atomik olarak ayır: hepsi boşsa hepsini dolu işaretleyip True,
+    herhangi biri doluysa (veya ayrılacak saat yoksa) hiçbirine dokunmadan False döner.
+    """
+    mask = hours_mask(hours)
+    if not resource_id or not date or not mask:
+        return False
+
+    resource_id = str(resource_id)
+    key = day_key(resource_id, date)
+    for attempt in range(2):
+        result = await db[COLLECTION].update_one(
+            {"_id": key, "mask": {"$bitsAllClear": mask}},
+            {"$bit": {"mask": {"or": mask}}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            _mask_cache.pop(key, None)
+            return True
+        # Eşleşmedi: ya saatler dolu ya da gün dokümanı henüz yok
+        if attempt == 0 and not await db[COLLECTION].find_one({"_id": key}, {"_id": 1}):
+            await _create_days(db, [resource_id], date, facility_id)
+            continue
+        break
+    _mask_cache.pop(key, None)
+    return False
+
+
+async def _release_mask(db, resource_id: str, date: str, mask: int, facility_id: str = None):
+    """
+    mask'taki saatlerden, kaynak koleksiyonlarda hâlâ dolu sayan başka bir kayıt
+    (çakışan eski rezervasyonlar, manuel kayıtlar...) olmayanları boşalt.
+    Bırakan kaydın durumu çağrıdan önce güncellenmiş olmalı.
+    """
+    occupied = (await _occupied_masks(db, date, [resource_id])).get(day_key(resource_id, date), (0, None))[0]
+    free = mask & ~occupied
+    if free:
+        await _apply_bits(db, resource_id, date, free, "and", facility_id)
+    else:
+        _mask_cache.pop(day_key(resource_id, date), None)
+
+
+async def release_hours(db, resource_id, date: str, hours: Iterable[int]):
+    """claim_hours ile alınan saatleri geri bırak (ör. kayıt eklenemediyse)"""
+    mask = hours_mask(hours)
+    if resource_id and date and mask:
+        await _release_mask(db, str(resource_id), date, mask)
+
+
+async def claim_reservation(db, reservation: dict) -> bool:
+    """Eklenecek rezervasyonun (dolu sayılan durumda) saatlerini ayır"""
+    hold = reservation_hold(reservation)
+    if not hold or not reservation.get("date"):
+        return True
+    return await claim_hours(db, hold[0], reservation["date"], mask_hours(hold[1]), reservation.get("facility_id"))
+
+
+async def block_reservation(db, reservation: dict) -> bool:
+    """Rezervasyon dolu sayılan bir duruma geçti: saatlerini dolu işaretle (güncel doküman)"""
+    hold = reservation_hold(reservation)
+    if not hold or not reservation.get("date"):
+        return False
+    await _apply_bits(db, hold[0], reservation["date"], hold[1], "or", reservation.get("facility_id"))
+    return True
+
+
+async def confirm_reservation_hold(db, reservation: dict, status: str = "confirmed") -> bool:
+    """
+    Ödemesi tamamlanan rezervasyonun saatlerini kesinleştir (güncelleme öncesi doküman).
+    Tutma süresi dolmuşsa (payment_expired) saatler yeniden ayrılmaya çalışılır;
+    bu arada başkası almışsa çakışma loglanır ve False döner.
+    """
+    confirmed = {**reservation, "status": status}
+    if reservation.get("status") != "payment_expired":
+        return await block_reservation(db, confirmed)
+    if await claim_reservation(db, confirmed):
+        return True
+    logger.error(f"⚠️ Rezervasyon {reservation.get('id')} ödendi ama saatleri tutma süresi dolduktan sonra başka rezervasyona verildi")
+    return False
+
+
+async def release_reservation(db, reservation: dict) -> bool:
+    """
+    Rezervasyon iptal/red/tamamlandı: saatlerini boşalt.
+    reservation, durumu koşullu güncellemeyle (find_one_and_update) değiştiren
+    çağrının döndürdüğü güncelleme ÖNCESİ doküman olmalı; zaten dolu saymadığımız
+    bir durumdaysa (cancelled, rejected...) başka rezervasyonun bitlerine dokunmayız.
+    Aynı saatleri tutan başka bir kayıt varsa o saatler dolu kalır.
+    """
+    hold = reservation_hold(reservation)
+    if not hold or not reservation.get("date"):
+        return False
+    await _release_mask(db, hold[0], reservation["date"], hold[1], reservation.get("facility_id"))
+    return True
+
+
+async def expire_payment_holds(db, hold_minutes: int = PAYMENT_HOLD_MINUTES) -> dict:
+    """Süresi dolan payment_pending rezervasyonları payment_expired yapıp saatlerini bırak"""
+    cutoff = datetime.utcnow() - timedelta(minutes=hold_minutes)
+    stale = await db.reservations.find(
+        {"status": "payment_pending", "created_at": {"$lt": cutoff}},
+        {"_id": 0, "id": 1}
+    ).to_list(None)
+    expired = 0
+    for row in stale:
+        reservation = await db.reservations.find_one_and_update(
+            {"id": row["id"], "status": "payment_pending"},
+            {"$set": {"status": "payment_expired", "updated_at": datetime.utcnow()}}
+        )
+        if reservation:
+            await release_reservation(db, reservation)
+            expired += 1
+    if expired:
+        logger.info(f"⏳ {expired} ödeme bekleyen rezervasyonun süresi doldu, saatleri serbest bırakıldı")
+    return {"expired": expired}
+
+
+async def rebuild_field_availability(db, date_from: str = None) -> dict:
+    """Maskeleri kaynaklardan yeniden hesapla (date_from verilirse o günden itibaren)"""
+    date_query = {"$gte": date_from} if date_from else {"$gte": ""}
+    masks = await _occupied_masks(db, date_query)
+
+    existing = await db[COLLECTION].find({"date": date_query}, {"_id": 1}).to_list(None)
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"_id": key},
+            {"$set": {
+                "field_id": key.rsplit("|", 1)[0],
+                "facility_id": facility_id,
+                "date": key.rsplit("|", 1)[1],
+                "mask": mask,
+                "updated_at": now,
+            }},
+            upsert=True
+        )
+        for key, (mask, facility_id) in masks.items()
+    ]
+    ops += [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"mask": 0, "updated_at": now}})
+        for doc in existing if doc["_id"] not in masks
+    ]
+    if ops:
+        await db[COLLECTION].bulk_write(ops, ordered=False)
+    _mask_cache.clear()
+
+    report = {"days": len(masks), "cleared": len(ops) - len(masks)}
+    logger.info(f"🏟️ Field availability rebuilt: {report}")
+    return report
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Field availability index tools")
+    parser.add_argument("--rebuild", action="store_true", required=True, help="maskeleri yeniden hesapla")
+    parser.add_argument("--from", dest="date_from", help="YYYY-MM-DD, bu günden itibaren")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.getenv("DB_NAME", "sports_management")]
+    try:
+        print(await rebuild_field_availability(db, date_from=args.date_from))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
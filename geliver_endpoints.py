@@ -5,18 +5,29 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
+from contextlib import asynccontextmanager
+import asyncio
 import httpx
 import os
 import logging
 import json
+import random
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 # Geliver API Configuration
-GELIVER_API_URL = "https://api.geliver.io/api/v1"
+GELIVER_API_URL = os.getenv("GELIVER_API_URL", "https://api.geliver.io/api/v1")  # yerel test: fake_geliver_server.py
 GELIVER_API_TOKEN = os.getenv("GELIVER_API_TOKEN", "")  # Test token'ı .env'den alınacak
+GELIVER_MAX_RETRIES = int(os.getenv("GELIVER_MAX_RETRIES", "3"))
+# Retry-After bundan uzunsa beklenmez; 429 döndürülür ve gönderi bu turda atlanır
+GELIVER_MAX_BACKOFF = float(os.getenv("GELIVER_MAX_BACKOFF", "30"))
+
+# Paylaşılan (pooled) HTTP client: her çağrıda yeni bağlantı havuzu açılmaz
+_http_client: Optional[httpx.AsyncClient] = None
+_http_transport: Optional[httpx.AsyncBaseTransport] = None
+geliver_stats = {"requests": 0, "retries": 0, "rate_limited": 0}
 
 # MongoDB connection
 db = None
@@ -74,6 +85,72 @@ class ShippingOffer(BaseModel):
     currency: str
     estimated_time: Optional[str] = None
 
+def configure_geliver_client(transport: Optional[httpx.AsyncBaseTransport] = None):
+    """Client'ı yeniden oluşturulacak şekilde ayarla (testlerde fake transport için)"""
+    global _http_client, _http_transport
+    _http_transport = transport
+    _http_client = None
+
+
+def get_geliver_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            transport=_http_transport,
+        )
+    return _http_client
+
+
+@asynccontextmanager
+async def geliver_client():
+    """Paylaşılan client'ı ver (çıkışta kapatılmaz; kapanış close_geliver_client ile)"""
+    yield get_geliver_http_client()
+
+
+async def close_geliver_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def geliver_get(path: str, params: Optional[dict] = None, retries: int = GELIVER_MAX_RETRIES) -> httpx.Response:
+    """
+    Geliver GET isteği: 429 (Retry-After'a uyarak), 5xx ve bağlantı hatalarında
+    üstel backoff ile tekrar dener. Son yanıtı döndürür; bağlantı hiç kurulamazsa hata fırlatır.
+    Retry-After GELIVER_MAX_BACKOFF'u aşarsa beklemeden 429 döndürür (worker bloklanmaz).
+    """
+    client = get_geliver_http_client()
+    attempt = 0
+    while True:
+        geliver_stats["requests"] += 1
+        try:
+            response = await client.get(f"{GELIVER_API_URL}{path}", params=params, headers=get_geliver_headers())
+        except httpx.TransportError:
+            if attempt >= retries:
+                raise
+            response = None
+
+        if response is not None and response.status_code != 429 and response.status_code < 500:
+            return response
+        if attempt >= retries:
+            return response
+
+        delay = 0.5 * (2 ** attempt) + random.uniform(0, 0.25)
+        if response is not None and response.status_code == 429:
+            geliver_stats["rate_limited"] += 1
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                if float(retry_after) > GELIVER_MAX_BACKOFF:
+                    return response
+                delay = float(retry_after)
+        attempt += 1
+        geliver_stats["retries"] += 1
+        await asyncio.sleep(delay)
+
+
 # Helper functions
 def get_geliver_headers():
     return {
@@ -282,7 +359,7 @@ async def create_geliver_shipment_after_payment(
             }
         }
         
-        async with httpx.AsyncClient() as client:
+        async with geliver_client() as client:
             response = await client.post(
                 f"{GELIVER_API_URL}/transactions",
                 json=shipment_data,
@@ -470,7 +547,7 @@ async def create_geliver_return_shipment(
             }
         }
         
-        async with httpx.AsyncClient() as client:
+        async with geliver_client() as client:
             response = await client.post(
                 f"{GELIVER_API_URL}/transactions",
                 headers={
@@ -592,7 +669,7 @@ async def get_shipping_rates(
             }
         
         # Gerçek Geliver API çağrısı
-        async with httpx.AsyncClient() as client:
+        async with geliver_client() as client:
             response = await client.get(
                 f"{GELIVER_API_URL}/priceList",
                 params={
@@ -835,7 +912,7 @@ async def create_shipment(request: CreateShipmentRequest):
             }
         }
         
-        async with httpx.AsyncClient() as client:
+        async with geliver_client() as client:
             # 1. Gönderi oluştur ve teklifleri al
             response = await client.post(
                 f"{GELIVER_API_URL}/shipments",
@@ -956,7 +1033,6 @@ async def track_shipment_by_code(tracking_code: str, provider_code: str = None)
     try:
         if not GELIVER_API_TOKEN:
             # Test modu - rastgele durum döndür
-            import random
             test_statuses = ["in_transit", "out_for_delivery", "delivered"]
             status = random.choice(test_statuses)
             return {
@@ -970,61 +1046,55 @@ async def track_shipment_by_code(tracking_code: str, provider_code: str = None)
         
         # Geliver API'ye barkod/takip kodu ile sorgulama
         # Geliver transactions endpoint'i kendi barcode'uyla sorgulanabilir
-        async with httpx.AsyncClient() as client:
-            # Shipment bilgisini tracking code ile al
-            response = await client.get(
-                f"{GELIVER_API_URL}/transactions",
-                params={"barcode": tracking_code},
-                headers=get_geliver_headers(),
-                timeout=30.0
-            )
-            
-            if response.status_code != 200:
-                logger.warning(f"Geliver tracking sorgusu başarısız: {tracking_code} - {response.status_code}")
-                return {
-                    "success": False,
-                    "error": f"API hatası: {response.status_code}"
-                }
-            
-            data = response.json()
-            
-            if not data.get("result"):
-                return {
-                    "success": False,
-                    "error": data.get("message", "Gönderi bulunamadı")
-                }
-            
-            transactions = data.get("data", {}).get("transactions", [])
-            
-            if not transactions:
-                return {
-                    "success": False,
-                    "error": "Gönderi bulunamadı"
-                }
-            
-            shipment = transactions[0]
-            tracking_status = shipment.get("trackingStatus", {})
-            raw_status = tracking_status.get("trackingStatusCode", "UNKNOWN")
-            status = GELIVER_STATUS_MAP.get(raw_status, "unknown")
-            
-            # Tracking history'yi parse et
-            tracking_history = []
-            events = shipment.get("trackingEvents", [])
-            for event in events:
-                tracking_history.append({
-                    "date": event.get("createdAt", ""),
-                    "status": event.get("statusDescription", ""),
-                    "location": event.get("location", "")
-                })
-            
+        # Shipment bilgisini tracking code ile al (429/5xx'te tekrar dener)
+        response = await geliver_get("/transactions", params={"barcode": tracking_code})
+        
+        if response.status_code != 200:
+            logger.warning(f"Geliver tracking sorgusu başarısız: {tracking_code} - {response.status_code}")
             return {
-                "success": True,
-                "test_mode": False,
-                "status": status,
-                "status_text": tracking_status.get("statusDetails", SHIPPING_STATUS_TEXT.get(status, "")),
-                "tracking_history": tracking_history,
-                "raw_status": raw_status
+                "success": False,
+                "error": f"API hatası: {response.status_code}"
             }
+        
+        data = response.json()
+        
+        if not data.get("result"):
+            return {
+                "success": False,
+                "error": data.get("message", "Gönderi bulunamadı")
+            }
+        
+        transactions = data.get("data", {}).get("transactions", [])
+        
+        if not transactions:
+            return {
+                "success": False,
+                "error": "Gönderi bulunamadı"
+            }
+        
+        shipment = transactions[0]
+        tracking_status = shipment.get("trackingStatus", {})
+        raw_status = tracking_status.get("trackingStatusCode", "UNKNOWN")
+        status = GELIVER_STATUS_MAP.get(raw_status, "unknown")
+        
+        # Tracking history'yi parse et
+        tracking_history = []
+        events = shipment.get("trackingEvents", [])
+        for event in events:
+            tracking_history.append({
+                "date": event.get("createdAt", ""),
+                "status": event.get("statusDescription", ""),
+                "location": event.get("location", "")
+            })
+        
+        return {
+            "success": True,
+            "test_mode": False,
+            "status": status,
+            "status_text": tracking_status.get("statusDetails", SHIPPING_STATUS_TEXT.get(status, "")),
+            "tracking_history": tracking_history,
+            "raw_status": raw_status
+        }
             
     except Exception as e:
         logger.error(f"Kargo takip hatası ({tracking_code}): {str(e)}")
@@ -1055,31 +1125,26 @@ async def track_shipment(shipment_id: str):
                 ]
             }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{GELIVER_API_URL}/shipments/{shipment_id}",
-                headers=get_geliver_headers(),
-                timeout=30.0
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Gönderi bulunamadı")
-            
-            data = response.json()
-            shipment = data.get("data", {})
-            
-            tracking_status = shipment.get("trackingStatus", {})
-            status_code = tracking_status.get("trackingStatusCode", "UNKNOWN")
-            
-            return {
-                "success": True,
-                "test_mode": False,
-                "shipment_id": shipment_id,
-                "status": GELIVER_STATUS_MAP.get(status_code, "unknown"),
-                "status_text": tracking_status.get("statusDetails", ""),
-                "tracking_code": shipment.get("trackingCode", ""),
-                "tracking_history": []
-            }
+        response = await geliver_get(f"/shipments/{shipment_id}")
+        
+        if response.status_code != 200:
+            raise HTTPException(status_code=404, detail="Gönderi bulunamadı")
+        
+        data = response.json()
+        shipment = data.get("data", {})
+        
+        tracking_status = shipment.get("trackingStatus", {})
+        status_code = tracking_status.get("trackingStatusCode", "UNKNOWN")
+        
+        return {
+            "success": True,
+            "test_mode": False,
+            "shipment_id": shipment_id,
+            "status": GELIVER_STATUS_MAP.get(status_code, "unknown"),
+            "status_text": tracking_status.get("statusDetails", ""),
+            "tracking_code": shipment.get("trackingCode", ""),
+            "tracking_history": []
+        }
             
     except HTTPException:
         raise
@@ -0,0 +1,122 @@
+"""
+Job Lease Lock
+Birden fazla uvicorn worker/replica'da çalışan zamanlanmış job'ların aynı tick'te
+yalnızca bir kez çalışması için MongoDB tabanlı lease kilidi.
+
+Her job için `job_leases` koleksiyonunda tek doküman (_id = job adı) tutulur.
+Kilidi alan worker çalışma boyunca lease'i heartbeat ile uzatır; job bitince
+lease bir sonraki tick'e kadar (min_interval) tutulur ki diğer worker'lar aynı
+periyotta job'u tekrar çalıştırmasın. Çöken worker'ın lease'i süresi dolunca
+devralınabilir; TTL index süresi geçmiş dokümanları temizler.
+
+    ran = await run_exclusive(db, "event_reminder_job", func, ttl=300, min_interval=3600)
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "job_leases"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# JOB_LOCKS=off: tek worker'lı geliştirme ortamında kilitleri devre dışı bırak
+LOCKS_ENABLED = os.environ.get("JOB_LOCKS", "on").lower() != "off"
+
+
+async def acquire_lease(db, name: str, ttl: float) -> bool:
+    """Lease'i al (boşsa veya süresi dolmuşsa); tutuluyorsa - bu worker'da bile - False"""
+    now = datetime.utcnow()
+    try:
+        await db[COLLECTION].find_one_and_update(
+            {"_id": name, "expires_at": {"$lt": now}},
+            {"$set": {
+                "owner": WORKER_ID,
+                "acquired_at": now,
+                "heartbeat_at": now,
+                "expires_at": now + timedelta(seconds=ttl),
+            }},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Doküman var ve başka bir worker'da, süresi de dolmamış
+        return False
+
+
+async def renew_lease(db, name: str, ttl: float) -> bool:
+    """Lease süresini uzat; lease artık bizde değilse False"""
+    now = datetime.utcnow()
+    result = await db[COLLECTION].update_one(
+        {"_id": name, "owner": WORKER_ID},
+        {"$set": {"heartbeat_at": now, "expires_at": now + timedelta(seconds=ttl)}}
+    )
+    return result.matched_count == 1
+
+
+async def release_lease(db, name: str, hold_until: Optional[datetime] = None):
+    """Lease'i bırak; hold_until verilirse o zamana kadar başka worker alamaz"""
+    if hold_until and hold_until > datetime.utcnow():
+        await db[COLLECTION].update_one(
+            {"_id": name, "owner": WORKER_ID},
+            {"$set": {"expires_at": hold_until, "released_at": datetime.utcnow()}}
+        )
+    else:
+        await db[COLLECTION].delete_one({"_id": name, "owner": WORKER_ID})
+
+
+async def _heartbeat(db, name: str, ttl: float):
+    while True:
+        await asyncio.sleep(max(ttl / 3, 1))
+        try:
+            if not await renew_lease(db, name, ttl):
+                logger.warning(f"⚠️ Lease lost for job {name}")
+                return
+        except Exception as e:
+            logger.warning(f"⚠️ Lease heartbeat failed for job {name}: {e}")
+
+
+async def run_exclusive(
+    db,
+    name: str,
+    func: Callable[[], Awaitable],
+    ttl: float = 300,
+    min_interval: float = 0,
+) -> bool:
+    """
+    func'u tüm worker'lar arasında tek seferde çalıştır.
+
+    ttl: heartbeat'siz kalınca lease'in devralınabileceği süre (saniye)
+    min_interval: job bittikten sonra, başlangıçtan itibaren bu süre dolana kadar
+                  diğer worker'ların aynı job'u başlatmasını engeller (genelde job periyodu
+                  biraz altı). Çalıştıysa True, başka worker'daysa False döner.
+    """
+    if not LOCKS_ENABLED:
+        await func()
+        return True
+
+    started = datetime.utcnow()
+    if not await acquire_lease(db, name, ttl):
+        logger.debug(f"🔒 Job {name} is running on another worker, skipping")
+        return False
+
+    heartbeat = asyncio.create_task(_heartbeat(db, name, ttl))
+    try:
+        await func()
+    finally:
+        heartbeat.cancel()
+        try:
+            await heartbeat
+        except asyncio.CancelledError:
+            pass
+        try:
+            await release_lease(db, name, hold_until=started + timedelta(seconds=min_interval))
+        except Exception as e:
+            logger.warning(f"⚠️ Lease release failed for job {name}: {e}")
+    return True
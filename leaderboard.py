@@ -0,0 +1,79 @@
+"""
+Leaderboard
+GET /rankings için tek aggregation ile puan/galibiyet/maç sayısı hesabı.
+
+Kullanıcı filtresi (sport/city/gender/age_group) users üzerinde uygulanır;
+tamamlanmış maçlar participant1_id / participant2_id index'leri üzerinden iki
+$lookup ile bağlanır. Sıra ($rank) puana göre verilir, eşit puanlılar aynı sırayı
+paylaşır (1, 2, 2, 4). Sıralama cursor filtresinden önce hesaplandığı için
+sonraki sayfalarda da genel sıra korunur.
+"""
+from typing import List, Optional, Tuple
+
+from pagination import decode_cursor, encode_cursor, keyset_filter
+
+# Galibiyet başına puan
+POINTS_PER_WIN = 3
+
+# Eşit puanda daha az maçla ulaşan önde; user_id sıralamayı benzersiz yapar
+LEADERBOARD_SORT: List[Tuple[str, int]] = [("points", -1), ("matches_played", 1), ("user_id", 1)]
+
+
+def _completed_matches(field: str, alias: str) -> dict:
+    return {"$lookup": {
+        "from": "matches",
+        "localField": "user_id",
+        "foreignField": field,
+        "pipeline": [
+            {"$match": {"status": "completed"}},
+            {"$project": {"_id": 0, "winner_id": 1}},
+        ],
+        "as": alias,
+    }}
+
+
+def build_leaderboard_pipeline(user_query: dict, limit: int, cursor: Optional[str] = None) -> list:
+    """Filtrelenmiş kullanıcılar için sıralı liderlik tablosu pipeline'ı (limit + 1 satır döner)"""
+    pipeline = [
+        {"$match": user_query},
+        {"$project": {"_id": 0, "user_id": "$id", "sport": 1, "city": 1, "gender": 1, "age_group": 1}},
+        _completed_matches("participant1_id", "home"),
+        _completed_matches("participant2_id", "away"),
+        {"$set": {"played": {"$concatArrays": ["$home", "$away"]}}},
+        {"$set": {
+            "matches_played": {"$size": "$played"},
+            "wins": {"$size": {"$filter": {
+                "input": "$played", "cond": {"$eq": ["$$this.winner_id", "$user_id"]}
+            }}},
+            "losses": {"$size": {"$filter": {
+                "input": "$played",
+                "cond": {"$and": [
+                    {"$ifNull": ["$$this.winner_id", False]},
+                    {"$ne": ["$$this.winner_id", "$user_id"]},
+                ]}
+            }}},
+        }},
+        {"$set": {"points": {"$multiply": ["$wins", POINTS_PER_WIN]}}},
+        {"$unset": ["home", "away", "played"]},
+        {"$setWindowFields": {"sortBy": {"points": -1}, "output": {"rank": {"$rank": {}}}}},
+    ]
+    if cursor:
+        pipeline.append({"$match": keyset_filter(LEADERBOARD_SORT, decode_cursor(cursor, LEADERBOARD_SORT))})
+    pipeline += [
+        {"$sort": dict(LEADERBOARD_SORT)},
+        {"$limit": limit + 1},
+    ]
+    return pipeline
+
+
+async def load_leaderboard(db, user_query: dict, limit: int, cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+    """Bir sayfa sıralama satırı ve bir sonraki sayfanın cursor'ını döndür"""
+    rows = await db.users.aggregate(
+        build_leaderboard_pipeline(user_query, limit, cursor), allowDiskUse=True
+    ).to_list(limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], LEADERBOARD_SORT)
+    return rows, next_cursor
@@ -18,6 +18,7 @@ from models import (
     ProductCondition, ServiceType, UserType, NotificationType, NotificationRelatedType
 )
 from auth import get_current_user
+from pagination import paginate, cached_count
 from iyzico_service import IyzicoService
 from notification_endpoints import create_notification_helper
 from geliver_endpoints import create_geliver_shipment_after_payment, get_provider_name, create_geliver_return_shipment
@@ -226,9 +227,15 @@ async def get_listings(
     sort_order: str = "desc",
     skip: int = 0,
     limit: int = 20,
+    cursor: Optional[str] = None,
+    exact_total: bool = False,
     
 ):
-    """Get marketplace listings with filters"""
+    """Get marketplace listings with filters
+
+    cursor verilirse keyset sayfalama yapılır; yanıttaki next_cursor bir sonraki sayfayı verir.
+    total varsayılan olarak kısa süre cache'lenen yaklaşık değerdir (exact_total=true ile tam sayım).
+    """
     try:
         query = {}
         
@@ -321,12 +328,17 @@ async def get_listings(
         if and_conditions:
             query["$and"] = and_conditions
         
-        total = await db.marketplace_listings.count_documents(query)
+        if exact_total:
+            total = await db.marketplace_listings.count_documents(query)
+        else:
+            total = await cached_count(db.marketplace_listings, query)
         
         sort_direction = -1 if sort_order == "desc" else 1
-        listings = await db.marketplace_listings.find(query).sort(
-            sort_by, sort_direction
-        ).skip(skip).limit(limit).to_list(limit)
+        listings, next_cursor = await paginate(
+            db.marketplace_listings, query,
+            [(sort_by, sort_direction), ("id", sort_direction)],
+            limit, cursor=cursor, skip=skip
+        )
         
         for listing in listings:
             listing.pop("_id", None)
@@ -335,7 +347,8 @@ async def get_listings(
             "listings": listings,
             "total": total,
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor
         }
         
     except Exception as e:
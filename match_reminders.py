@@ -0,0 +1,283 @@
+"""
+Match Reminder Schedule
+Maç hatırlatmaları (30 dk / 5 dk önce) için kalıcı "due reminders" koleksiyonu ve
+süreç içi timer wheel.
+
+Maçlar planlandığında / saati değiştiğinde sync_match_reminders() ile her
+hatırlatma için bir kayıt (due_at = maç saati - offset) yazılır. MatchReminderWheel
+her LOAD_INTERVAL'da sadece önümüzdeki HORIZON içinde vadesi gelecek kayıtları
+belleğe yükler ve saniyelik dilimlerde tam zamanında tetikler; maliyet saklanan
+maç sayısıyla değil, vadesi gelen hatırlatma sayısıyla ölçeklenir.
+
+Kayıtlar tetiklenirken atomik olarak "sent" işaretlenir; birden fazla worker
+aynı hatırlatmayı tekrar göndermez. Alıcılar tetiklenme anında maçtan okunur.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import DeleteMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "due_reminders"
+ACTIVE_MATCH_STATUSES = ["scheduled", "in_progress"]
+
+# tip → (maçtan önceki süre, alıcı alanları, başlık, mesaj)
+MATCH_REMINDERS = {
+    "match_reminder_30min": (
+        timedelta(minutes=30), ("participant1_id", "participant2_id"),
+        "🏟️ Maç 30 Dakika Sonra", "Maçınız 30 dakika sonra başlıyor!"
+    ),
+    "match_reminder_5min": (
+        timedelta(minutes=5), ("participant1_id", "participant2_id"),
+        "🏟️ Maç 5 Dakika Sonra", "Maçınız 5 dakika sonra başlıyor!"
+    ),
+    "match_reminder_5min_referee": (
+        timedelta(minutes=5), ("referee_id",),
+        "🏟️ Hakemlik Göreviniz 5 Dakika Sonra", "Hakemlik yapacağınız maç 5 dakika sonra başlıyor!"
+    ),
+}
+
+# Vadesinden bu kadar geç kalmış hatırlatmalar gönderilmez (eski ±2 dk pencereyle aynı)
+LATE_GRACE = timedelta(minutes=2)
+
+MATCH_PROJECTION = {
+    "_id": 0, "id": 1, "event_id": 1, "status": 1, "scheduled_time": 1,
+    "participant1_id": 1, "participant2_id": 1, "referee_id": 1
+}
+
+
+def _reminder_docs(match: dict) -> Dict[str, dict]:
+    """Maç için olması gereken hatırlatma kayıtları (_id → doküman)"""
+    scheduled_time = match.get("scheduled_time")
+    if not isinstance(scheduled_time, datetime) or match.get("status") not in ACTIVE_MATCH_STATUSES:
+        return {}
+    docs = {}
+    for kind, (offset, fields, _, _) in MATCH_REMINDERS.items():
+        user_ids = [match.get(field) for field in fields if match.get(field)]
+        if not user_ids:
+            continue
+        docs[f"{match['id']}:{kind}"] = {
+            "kind": kind,
+            "match_id": match["id"],
+            "event_id": match.get("event_id"),
+            "user_ids": user_ids,
+            "scheduled_time": scheduled_time,
+            "due_at": scheduled_time - offset,
+        }
+    return docs
+
+
+async def schedule_match_reminders(db, matches: List[dict]) -> int:
+    """
+    Verilen maçların hatırlatma kayıtlarını güncelle. Saati değişen maçların
+    kayıtları yeniden "pending" olur; planı kalkan/iptal edilen maçlarınkiler silinir.
+    """
+    operations = []
+    for match in matches:
+        if not match.get("id"):
+            continue
+        docs = _reminder_docs(match)
+        for key, doc in docs.items():
+            # Saat değiştiyse (veya kayıt yoksa) yeniden planla; değişmediyse durum
+            # (zaten gönderilmiş olabilir) korunur
+            operations.append(UpdateOne(
+                {"_id": key, "scheduled_time": {"$ne": doc["scheduled_time"]}},
+                {"$set": {**doc, "status": "pending", "updated_at": datetime.utcnow()}},
+                upsert=True
+            ))
+            # Alıcılar (hakem / katılımcı değişimi) her durumda güncellenir
+            operations.append(UpdateOne(
+                {"_id": key},
+                {"$set": {"user_ids": doc["user_ids"], "event_id": doc["event_id"], "updated_at": datetime.utcnow()}}
+            ))
+        operations.append(DeleteMany({
+            "match_id": match["id"], "status": "pending", "_id": {"$nin": list(docs)}
+        }))
+    if not operations:
+        return 0
+    try:
+        await db[COLLECTION].bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate key: kayıt aynı saatle zaten mevcut → beklenen durum
+        errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+        if errors:
+            logger.error(f"❌ Match reminder schedule errors: {errors[:3]}")
+    match_reminder_wheel.wake()
+    return len(operations)
+
+
+async def sync_match_reminders(db, event_id: Optional[str] = None, match_ids: Optional[List[str]] = None) -> int:
+    """Bir etkinliğin (veya belirli maçların) hatırlatmalarını maç koleksiyonundan yeniden kur"""
+    if match_ids:
+        query = {"id": {"$in": match_ids}}
+    elif event_id:
+        query = {"event_id": event_id}
+    else:
+        return 0
+    matches = await db.event_matches.find(query, MATCH_PROJECTION).to_list(None)
+
+    # Silinmiş maçların bekleyen hatırlatmalarını da temizle
+    existing_ids = {m["id"] for m in matches if m.get("id")}
+    stale_query = {"status": "pending", "match_id": {"$nin": list(existing_ids)}}
+    if match_ids:
+        stale_query["match_id"]["$in"] = match_ids
+    else:
+        stale_query["event_id"] = event_id
+    await db[COLLECTION].delete_many(stale_query)
+
+    return await schedule_match_reminders(db, matches)
+
+
+async def sync_upcoming_match_reminders(db, hours: int = 2) -> int:
+    """
+    Güvenlik ağı: önümüzdeki `hours` saatteki maçların kayıtlarını yeniden kur.
+    sync çağrısı olmayan yollardan planlanan maçları da yakalar; maliyet yakın
+    zamanlı maç sayısıyla sınırlıdır (scheduled_time index aralığı).
+    """
+    now = datetime.utcnow()
+    matches = await db.event_matches.find({
+        "status": {"$in": ACTIVE_MATCH_STATUSES},
+        "scheduled_time": {"$gte": now, "$lte": now + timedelta(hours=hours)}
+    }, MATCH_PROJECTION).to_list(None)
+    return await schedule_match_reminders(db, matches)
+
+
+async def fire_reminder(db, item: dict, now: Optional[datetime] = None) -> int:
+    """Hatırlatmayı atomik olarak sahiplen ve bildirimlerini yaz; gönderilen bildirim sayısı"""
+    now = now or datetime.utcnow()
+    claimed = await db[COLLECTION].find_one_and_update(
+        {"_id": item["_id"], "status": "pending", "due_at": item["due_at"]},
+        {"$set": {"status": "sent", "sent_at": now}}
+    )
+    if not claimed:
+        return 0  # başka worker gönderdi veya yeniden planlandı
+    if now - claimed["due_at"] > LATE_GRACE:
+        await db[COLLECTION].update_one({"_id": item["_id"]}, {"$set": {"status": "expired"}})
+        return 0
+
+    # Alıcılar tetiklenme anındaki maçtan okunur (sonradan atanan hakem / eşleşme)
+    _, fields, title, message = MATCH_REMINDERS[claimed["kind"]]
+    match = await db.event_matches.find_one({"id": claimed["match_id"]}, MATCH_PROJECTION)
+    if (not match or match.get("status") not in ACTIVE_MATCH_STATUSES
+            or match.get("scheduled_time") != claimed["scheduled_time"]):
+        # Maç silinmiş / iptal / saati değişmiş: sync yeniden planlar
+        await db[COLLECTION].update_one({"_id": item["_id"]}, {"$set": {"status": "skipped"}})
+        return 0
+    user_ids = [match.get(field) for field in fields if match.get(field)]
+    if not user_ids:
+        return 0
+
+    await db.notifications.insert_many([
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "type": claimed["kind"],
+            "title": title,
+            "message": message,
+            "related_id": claimed["match_id"],
+            "read": False,
+            "created_at": now
+        }
+        for user_id in user_ids
+    ])
+    logger.info(f"{claimed['kind']} sent for match: {claimed['match_id']}")
+    return len(user_ids)
+
+
+class MatchReminderWheel:
+    """
+    Saniyelik dilimli timer wheel: önümüzdeki `horizon` içindeki hatırlatmalar
+    tetiklenecekleri saniyenin dilimine konur, her tick'te vadesi gelen dilimler boşaltılır.
+    """
+
+    def __init__(self, horizon: timedelta = timedelta(minutes=10),
+                 load_interval: float = 60.0, tick: float = 1.0):
+        self.horizon = horizon
+        self.load_interval = load_interval
+        self.tick = tick
+        self.db = None
+        self._slots: Dict[int, Dict[str, dict]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_load = 0.0
+        self._stats = {"loaded": 0, "fired": 0, "notifications": 0}
+
+    def _slot(self, due_at: datetime) -> int:
+        return int((due_at - datetime(1970, 1, 1)).total_seconds() // self.tick)
+
+    def wake(self):
+        """Yeni/değişen kayıtlar için bir sonraki tick'te yeniden yükleme iste"""
+        self._last_load = 0.0
+
+    async def load(self, now: Optional[datetime] = None) -> int:
+        """Ufuk içindeki bekleyen hatırlatmaları dilimlere yerleştir"""
+        now = now or datetime.utcnow()
+        items = await self.db[COLLECTION].find(
+            {"status": "pending", "due_at": {"$gte": now - LATE_GRACE, "$lte": now + self.horizon}},
+            {"_id": 1, "due_at": 1}
+        ).to_list(None)
+        # Yeniden planlanan kayıtlar eski dilimlerinden çıkarılır
+        self._slots = {}
+        for item in items:
+            self._slots.setdefault(self._slot(item["due_at"]), {})[item["_id"]] = item
+        self._last_load = time.monotonic()
+        self._stats["loaded"] = len(items)
+        return len(items)
+
+    async def fire_due(self, now: Optional[datetime] = None) -> int:
+        """Vadesi gelmiş dilimleri tetikle"""
+        now = now or datetime.utcnow()
+        current = self._slot(now)
+        due = [slot for slot in self._slots if slot <= current]
+        sent = 0
+        for slot in sorted(due):
+            for item in self._slots.pop(slot).values():
+                try:
+                    count = await fire_reminder(self.db, item, now)
+                except Exception as e:
+                    logger.error(f"❌ Match reminder {item['_id']} failed: {e}")
+                    continue
+                if count:
+                    self._stats["fired"] += 1
+                    self._stats["notifications"] += count
+                sent += count
+        return sent
+
+    async def _run(self):
+        while True:
+            try:
+                if time.monotonic() - self._last_load >= self.load_interval:
+                    await self.load()
+                await self.fire_due()
+            except Exception as e:
+                logger.error(f"❌ Match reminder wheel error: {e}")
+            await asyncio.sleep(self.tick)
+
+    def start(self, db):
+        self.db = db
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            **self._stats,
+            "running": self._task is not None and not self._task.done(),
+            "in_wheel": sum(len(items) for items in self._slots.values()),
+        }
+
+
+match_reminder_wheel = MatchReminderWheel()
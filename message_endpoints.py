@@ -5,12 +5,18 @@ Handles: Direct Messages, Group Chats, Unread Counts
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional
 from datetime import datetime
+import time
 import uuid
 import logging
 
 from models import Message, MessageBase, GroupChat, GroupChatCreate, GroupMessage, GroupMessageBase, GroupMessagePermission
 from auth import get_current_user
+from pagination import keyset_filter, merge_filters
 from api_response import success_response, error_response, ErrorMessages
+from unread_counters import (
+    increment_direct, increment_group, clear_direct, read_group, get_unread_counters
+)
+from realtime_gateway import publish_direct_message, publish_group_message, publish_unread_cleared
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +33,144 @@ def set_database(database):
 
 # ==================== DIRECT MESSAGES ====================
 
+MESSAGE_PAGE_MAX = 1000
+
+
+def conversation_key(user_a: str, user_b: str) -> str:
+    """İki kullanıcı arasındaki konuşmanın sıralı anahtarı (iki yönlü $or yerine tek eşitlik)"""
+    return "|".join(sorted([user_a, user_b]))
+
+
+# migrate_conversation_keys.py tamamlanana kadar anahtarsız eski mesajlar
+# sender/receiver ile de aranır; kontrol LEGACY_CHECK_SECONDS'ta bir tekrarlanır
+LEGACY_CHECK_SECONDS = 300
+_legacy_keys = {"remaining": True, "checked_at": 0.0}
+
+
+async def _legacy_messages_remaining(db) -> bool:
+    """conversation_key alanı olmayan mesaj kaldı mı? (backfill bitince bir daha sorgulanmaz)"""
+    if not _legacy_keys["remaining"]:
+        return False
+    now = time.monotonic()
+    if now - _legacy_keys["checked_at"] >= LEGACY_CHECK_SECONDS:
+        _legacy_keys["remaining"] = await db.messages.find_one(
+            {"conversation_key": {"$exists": False}}, {"_id": 1}
+        ) is not None
+        _legacy_keys["checked_at"] = now
+    return _legacy_keys["remaining"]
+
+
+async def conversation_filter(db, user_a: str, user_b: str) -> dict:
+    """İki kullanıcı arasındaki mesajlar: conversation_key eşitliği (+ backfill bitene kadar eski mesajlar)"""
+    key_query = {"conversation_key": conversation_key(user_a, user_b)}
+    if not await _legacy_messages_remaining(db):
+        return key_query
+    legacy = {"conversation_key": {"$exists": False}}
+    return {"$or": [
+        key_query,
+        {**legacy, "sender_id": user_a, "receiver_id": user_b},
+        {**legacy, "sender_id": user_b, "receiver_id": user_a},
+    ]}
+
+
+async def load_message_page(collection, base_query: dict, limit: int,
+                            before: Optional[str] = None, after: Optional[str] = None) -> list:
+    """
+    Mesaj geçmişinden bir sayfa: before=<mesaj id> daha eskileri, after=<mesaj id> daha
+    yenileri getirir; ikisi de yoksa en yeni `limit` mesaj (en fazla MESSAGE_PAGE_MAX).
+    Sonuç her zaman eskiden yeniye sıralıdır.
+    Sorgu şekli (anahtar eşitliği + sent_at/id aralığı) (key, sent_at, id) index'ini kullanır.
+    """
+    limit = max(1, min(limit, MESSAGE_PAGE_MAX))
+    anchor_id = before or after
+    sort_keys = [("sent_at", 1), ("id", 1)] if after else [("sent_at", -1), ("id", -1)]
+    query = base_query
+    if anchor_id:
+        anchor = await collection.find_one({**base_query, "id": anchor_id}, {"sent_at": 1, "id": 1})
+        if not anchor:
+            raise HTTPException(status_code=404, detail="Mesaj bulunamadı")
+        query = merge_filters(base_query, keyset_filter(sort_keys, [anchor.get("sent_at"), anchor["id"]]))
+
+    messages = await collection.find(query).sort(sort_keys).limit(limit).to_list(limit)
+    if not after:
+        messages.reverse()
+    return messages
+
+
+INBOX_PEER_PROJECTION = {"_id": 0, "id": 1, "full_name": 1, "profile_image": 1, "avatar": 1, "user_type": 1}
+
+
+def build_inbox_pipeline(user_id: str, skip: int = 0, limit: int = 50) -> list:
+    """
+    Tek aggregation ile konuşma listesi: her karşı taraf için son mesaj,
+    okunmamış sayısı ve toplam konuşma sayısı ($facet).
+    """
+    return [
+        {"$match": {
+            "$or": [{"sender_id": user_id}, {"receiver_id": user_id}],
+            "deleted_for": {"$ne": user_id}
+        }},
+        {"$addFields": {
+            "peer_id": {"$cond": [{"$eq": ["$sender_id", user_id]}, "$receiver_id", "$sender_id"]}
+        }},
+        {"$sort": {"sent_at": -1}},
+        {"$group": {
+            "_id": "$peer_id",
+            "last_message": {"$first": "$$ROOT"},
+            "unread_count": {"$sum": {"$cond": [
+                {"$and": [{"$eq": ["$receiver_id", user_id]}, {"$eq": ["$is_read", False]}]}, 1, 0
+            ]}},
+            "message_count": {"$sum": 1}
+        }},
+        {"$sort": {"last_message.sent_at": -1}},
+        {"$facet": {
+            "conversations": [
+                {"$skip": skip},
+                {"$limit": limit},
+                {"$project": {
+                    "_id": 0,
+                    "peer_id": "$_id",
+                    "unread_count": 1,
+                    "message_count": 1,
+                    "last_message": {
+                        "id": "$last_message.id",
+                        "sender_id": "$last_message.sender_id",
+                        "receiver_id": "$last_message.receiver_id",
+                        "content": "$last_message.content",
+                        "is_read": "$last_message.is_read",
+                        "sent_at": "$last_message.sent_at"
+                    }
+                }}
+            ],
+            "total": [{"$count": "count"}]
+        }}
+    ]
+
+
+async def load_inbox(db, user_id: str, skip: int = 0, limit: int = 50) -> dict:
+    """Konuşma listesi: bir aggregation + karşı taraf profilleri için tek $in sorgusu"""
+    # $skip negatif, $limit pozitif olmalı; sayfa boyutu mesaj sayfalarıyla aynı sınırda
+    skip = max(0, skip)
+    limit = max(1, min(limit, MESSAGE_PAGE_MAX))
+    result = await db.messages.aggregate(build_inbox_pipeline(user_id, skip, limit)).to_list(1)
+    facet = result[0] if result else {"conversations": [], "total": []}
+    conversations = [c for c in facet["conversations"] if isinstance(c.get("peer_id"), str)]
+
+    peer_ids = [c["peer_id"] for c in conversations]
+    peers = await db.users.find({"id": {"$in": peer_ids}}, INBOX_PEER_PROJECTION).to_list(len(peer_ids) or 1)
+    peers_by_id = {peer["id"]: peer for peer in peers}
+    for conversation in conversations:
+        conversation["peer"] = peers_by_id.get(conversation["peer_id"])
+
+    total = facet["total"][0]["count"] if facet["total"] else 0
+    return {
+        "conversations": conversations,
+        "total": total,
+        "skip": skip,
+        "limit": limit
+    }
+
+
 @router.get("/messages")
 async def get_messages(current_user: dict = Depends(get_current_user)):
     """Get all messages for current user (excluding hidden conversations)"""
@@ -64,29 +208,12 @@ async def get_unread_message_counts(current_user: dict = Depends(get_current_use
     """Get unread message counts for individual and group chats"""
     current_user_id = current_user.get("id")
     
-    # Individual messages
-    pipeline = [
-        {"$match": {"receiver_id": current_user_id, "is_read": False}},
-        {"$group": {"_id": "$sender_id", "count": {"$sum": 1}}}
-    ]
-    
-    individual_unread = await db.messages.aggregate(pipeline).to_list(None)
-    total_individual = sum(item["count"] for item in individual_unread)
-    
-    # Group messages
-    user_groups = await db.group_chats.find({"member_ids": current_user_id}).to_list(None)
-    group_ids = [group["id"] for group in user_groups]
-    
-    group_unread_count = await db.group_messages.count_documents({
-        "group_id": {"$in": group_ids},
-        "sender_id": {"$ne": current_user_id},
-        "read_by": {"$ne": current_user_id}
-    })
+    counters = await get_unread_counters(db, current_user_id)
     
     return {
-        "individual_unread": total_individual,
-        "group_unread": group_unread_count,
-        "total_unread": total_individual + group_unread_count
+        "individual_unread": counters["individual_unread"],
+        "group_unread": counters["group_unread"],
+        "total_unread": counters["individual_unread"] + counters["group_unread"]
     }
 
 
@@ -96,41 +223,32 @@ async def get_conversations_with_unread(current_user: dict = Depends(get_current
     current_user_id = current_user.get("id")
     
     try:
-        pipeline = [
-            {"$match": {"receiver_id": current_user_id, "is_read": False}},
-            {"$group": {"_id": "$sender_id", "unread_count": {"$sum": 1}}}
-        ]
-        
-        unread_by_sender = await db.messages.aggregate(pipeline).to_list(None)
-        unread_dict = {item["_id"]: item["unread_count"] for item in unread_by_sender}
-        
-        return {"unread_by_user": unread_dict}
+        counters = await get_unread_counters(db, current_user_id)
+        return {"unread_by_user": counters["direct"]}
     except Exception as e:
         logger.error(f"Error in conversations-with-unread: {str(e)}")
         return {"unread_by_user": {}}
 
 
 @router.get("/messages/{other_user_id}")
-async def get_conversation(other_user_id: str, current_user: dict = Depends(get_current_user)):
-    """Get conversation between two users"""
+async def get_conversation(
+    other_user_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 1000,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get conversation between two users (before/after mesaj id ile sayfalama)"""
     current_user_id = current_user.get("id")
     
-    messages = await db.messages.find({
-        "$and": [
-            {
-                "$or": [
-                    {"sender_id": current_user_id, "receiver_id": other_user_id},
-                    {"sender_id": other_user_id, "receiver_id": current_user_id}
-                ]
-            },
-            {
-                "$or": [
-                    {"deleted_for": {"$exists": False}},
-                    {"deleted_for": {"$nin": [current_user_id]}}
-                ]
-            }
-        ]
-    }).sort("sent_at", 1).to_list(1000)
+    messages = await load_message_page(
+        db.messages,
+        {
+            **await conversation_filter(db, current_user_id, other_user_id),
+            "deleted_for": {"$ne": current_user_id}
+        },
+        limit, before=before, after=after
+    )
     
     for msg in messages:
         if isinstance(msg.get('sender_id'), dict):
@@ -150,6 +268,8 @@ async def mark_messages_as_read(other_user_id: str, current_user: dict = Depends
         {"sender_id": other_user_id, "receiver_id": current_user_id, "is_read": False},
         {"$set": {"is_read": True}}
     )
+    await clear_direct(db, current_user_id, other_user_id, result.modified_count)
+    await publish_unread_cleared(current_user_id, peer_id=other_user_id)
     
     return success_response(data={"marked_count": result.modified_count})
 
@@ -160,12 +280,7 @@ async def hide_conversation(other_user_id: str, current_user: dict = Depends(get
     current_user_id = current_user.get("id") if isinstance(current_user, dict) else current_user
     
     result = await db.messages.update_many(
-        {
-            "$or": [
-                {"sender_id": current_user_id, "receiver_id": other_user_id},
-                {"sender_id": other_user_id, "receiver_id": current_user_id}
-            ]
-        },
+        await conversation_filter(db, current_user_id, other_user_id),
         {"$addToSet": {"deleted_for": current_user_id}}
     )
     
@@ -183,12 +298,15 @@ async def send_message(message: MessageBase, current_user: dict = Depends(get_cu
         "id": message_id,
         "sender_id": current_user_id,
         "receiver_id": message.receiver_id,
+        "conversation_key": conversation_key(current_user_id, message.receiver_id),
         "content": message.content,
         "sent_at": datetime.utcnow(),
         "is_read": False
     }
     
     await db.messages.insert_one(message_data)
+    await increment_direct(db, message.receiver_id, current_user_id)
+    await publish_direct_message(message_data)
     
     return Message(**message_data)
 
@@ -251,20 +369,8 @@ async def get_unread_counts_per_group(current_user: dict = Depends(get_current_u
     """Get unread message counts for each group"""
     current_user_id = current_user.get("id")
     
-    user_groups = await db.group_chats.find({"member_ids": current_user_id}).to_list(None)
-    group_ids = [group["id"] for group in user_groups]
-    
-    unread_by_group = {}
-    for group_id in group_ids:
-        count = await db.group_messages.count_documents({
-            "group_id": group_id,
-            "sender_id": {"$ne": current_user_id},
-            "read_by": {"$ne": current_user_id}
-        })
-        if count > 0:
-            unread_by_group[group_id] = count
-    
-    return {"unread_by_group": unread_by_group}
+    counters = await get_unread_counters(db, current_user_id)
+    return {"unread_by_group": counters["groups"]}
 
 
 @router.get("/group-chats/{group_id}")
@@ -339,12 +445,20 @@ async def send_group_message(group_id: str, message_data: dict, current_user: di
     }
     
     await db.group_messages.insert_one(message)
+    await increment_group(db, group, current_user_id)
+    await publish_group_message(message, group)
     return GroupMessage(**message)
 
 
 @router.get("/group-chats/{group_id}/messages")
-async def get_group_messages(group_id: str, current_user: dict = Depends(get_current_user)):
-    """Get all messages in a group"""
+async def get_group_messages(
+    group_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 1000,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get messages in a group (before/after mesaj id ile sayfalama)"""
     current_user_id = current_user.get("id")
     
     group = await db.group_chats.find_one({"id": group_id})
@@ -354,18 +468,26 @@ async def get_group_messages(group_id: str, current_user: dict = Depends(get_cur
     if current_user_id not in group.get("member_ids", []):
         raise HTTPException(status_code=403, detail="Bu gruba erişim yetkiniz yok")
     
-    messages = await db.group_messages.find({"group_id": group_id}).sort("sent_at", 1).to_list(1000)
-    
-    for msg in messages:
-        sender_id = msg.get("sender_id")
-        if sender_id and not msg.get("sender_name"):
-            user = await db.users.find_one({"id": sender_id})
-            if user:
-                msg["sender_name"] = user.get("full_name", "Bilinmeyen")
+    messages = await load_message_page(
+        db.group_messages, {"group_id": group_id}, limit, before=before, after=after
+    )
+    await fill_sender_names(messages)
     
     return [GroupMessage(**msg) for msg in messages]
 
 
+async def fill_sender_names(messages: list):
+    """sender_name'i eksik mesajlar için gönderenleri tek $in sorgusuyla yükle"""
+    missing = {msg.get("sender_id") for msg in messages if msg.get("sender_id") and not msg.get("sender_name")}
+    if not missing:
+        return
+    users = await db.users.find({"id": {"$in": list(missing)}}, {"_id": 0, "id": 1, "full_name": 1}).to_list(len(missing))
+    names = {user["id"]: user.get("full_name", "Bilinmeyen") for user in users}
+    for msg in messages:
+        if not msg.get("sender_name") and msg.get("sender_id") in names:
+            msg["sender_name"] = names[msg["sender_id"]]
+
+
 @router.put("/group-chats/{group_id}/mark-read")
 async def mark_group_messages_as_read(group_id: str, current_user: dict = Depends(get_current_user)):
     """Mark all messages in a group as read for current user"""
@@ -386,5 +508,7 @@ async def mark_group_messages_as_read(group_id: str, current_user: dict = Depend
         },
         {"$addToSet": {"read_by": current_user_id}}
     )
+    await read_group(db, current_user_id, group_id, result.modified_count)
+    await publish_unread_cleared(current_user_id, group_id=group_id)
     
     return success_response(data={"marked_count": result.modified_count})
@@ -0,0 +1,92 @@
+"""
+Conversation Key Migration
+Mevcut direkt mesajlara conversation_key alanını ekler.
+
+GET /messages/{other_user_id} geçmişi artık tek eşitlik sorgusuyla
+(conversation_key, sent_at, id) index'i üzerinden okunur. Bu alanı olmayan
+mesaj kaldığı sürece konuşma sorguları sender/receiver $or'una geri düşer
+(conversation_filter); backfill bitince sorgu tek eşitliğe iner.
+Gönderen/alıcısı eksik mesajlar conversation_key: null ile işaretlenir.
+Script idempotent'tir: sadece alanı eksik mesajları günceller.
+
+    python migrate_conversation_keys.py
+"""
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from message_endpoints import conversation_key
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# MongoDB connection
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+client = AsyncIOMotorClient(MONGO_URL)
+db = client[os.getenv("DB_NAME", "sports_management")]
+
+
+def _user_id(value):
+    """Eski dokümanlarda sender_id/receiver_id dict olabilir"""
+    if isinstance(value, dict):
+        return value.get("id")
+    return value
+
+
+async def migrate_conversation_keys():
+    """conversation_key alanı olmayan mesajları toplu olarak güncelle"""
+    logger.info("🔍 Checking messages without conversation_key...")
+    total = await db.messages.count_documents({"conversation_key": {"$exists": False}})
+    logger.info(f"   Messages to migrate: {total}")
+
+    updated = 0
+    skipped = 0
+    operations = []
+    cursor = db.messages.find(
+        {"conversation_key": {"$exists": False}},
+        {"_id": 1, "sender_id": 1, "receiver_id": 1}
+    )
+    async for message in cursor:
+        sender_id = _user_id(message.get("sender_id"))
+        receiver_id = _user_id(message.get("receiver_id"))
+        if not sender_id or not receiver_id:
+            # Karşı taraf yok: null ile işaretle ki $exists: False (legacy) kontrolüne takılmasın
+            skipped += 1
+            key = None
+        else:
+            key = conversation_key(sender_id, receiver_id)
+        operations.append(UpdateOne(
+            {"_id": message["_id"]},
+            {"$set": {"conversation_key": key}}
+        ))
+        if len(operations) >= BATCH_SIZE:
+            result = await db.messages.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+            logger.info(f"   ... {updated}/{total}")
+
+    if operations:
+        result = await db.messages.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+
+    logger.info(f"✅ conversation_key migration: {updated} updated, {skipped} of them set to null (missing participants)")
+    return updated
+
+
+async def main():
+    try:
+        await migrate_conversation_keys()
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
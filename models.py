@@ -349,6 +349,32 @@ class Event(EventBase):
 class EventCreate(EventBase):
     pass
 
+class EventSummary(BaseModel):
+    """Etkinlik listeleri için hafif özet (açıklama, medya, kurallar vb. hariç)"""
+    id: str
+    title: str
+    event_type: EventType
+    sport: str
+    city: str
+    venue_id: Optional[str] = None
+    start_date: datetime
+    end_date: datetime
+    organizer_id: str
+    status: str = "pending"
+    is_active: bool = True
+    created_at: Optional[datetime] = None
+    ticket_info: Optional[TicketInfo] = None
+    images: List[str] = []  # Sadece kapak görseli (ilk görsel)
+    max_participants: Optional[int] = None
+    participant_count: int = 0
+    participants: List[str] = []
+    skill_level: Optional[SkillLevel] = None
+    gender_restriction: Optional[Gender] = None
+    age_groups: Optional[List[str]] = None
+    genders: Optional[List[str]] = None
+    game_types: Optional[List[str]] = None
+    prize_money: Optional[float] = None
+
 # Venue Models
 class VenueBase(BaseModel):
     name: str
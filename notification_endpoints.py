@@ -13,6 +13,10 @@ from models import (
     PushToken, PushTokenBase
 )
 from auth import get_current_user
+from pagination import paginate
+from realtime_gateway import publish_notification
+from related_loader import attach_related_details
+from bulk_broadcast import build_broadcast_query, start_broadcast, STATUS_PENDING, STATUS_COMPLETED
 
 notification_router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -23,6 +27,7 @@ async def create_notification_helper(db, notification_data: dict):
     result = await db.notifications.insert_one(notification_data)
     notification_data["id"] = str(result.inserted_id)
     notification_data.pop("_id", None)
+    await publish_notification(notification_data)
     return notification_data
 
 @notification_router.get("/notifications")
@@ -30,10 +35,11 @@ async def get_notifications(
     request: Request,
     skip: int = 0,
     limit: int = 50,
+    cursor: str = None,
     unread_only: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get user's notifications with related entity details"""
+    """Get user's notifications with related entity details (cursor ile keyset sayfalama)"""
     db = request.app.state.db
     current_user_id = current_user["id"]
     
@@ -41,67 +47,24 @@ async def get_notifications(
     if unread_only:
         query["read"] = False
     
-    notifications = await db.notifications.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    # created_at hem BSON date hem ISO string tutuyor ($lt tipler arası karşılaştırmaz);
+    # cursor tek tipli ve zaman sıralı ObjectId _id üzerinden tutulur
+    notifications, next_cursor = await paginate(
+        db.notifications, query, [("_id", -1)], limit, cursor=cursor, skip=skip
+    )
     
     # Log first 3 notification dates for debugging
     if notifications:
         logging.info(f"📬 First 3 notifications (newest first): {[(n.get('title'), n.get('created_at')) for n in notifications[:3]]}")
     
-    # Enrich notifications with related entity details
     for notif in notifications:
         # _id'yi kaldır, eğer id yoksa _id'yi kullan
         mongo_id = notif.pop("_id", None)
         if "id" not in notif and mongo_id:
             notif["id"] = str(mongo_id)
-        
-        # Fetch related entity details
-        related_details = None
-        if notif.get("related_id") and notif.get("related_type"):
-            related_type = notif["related_type"]
-            related_id = notif["related_id"]
-            
-            try:
-                # Case-insensitive comparison için upper() kullan
-                related_type_upper = related_type.upper() if related_type else ""
-                
-                if related_type_upper == "EVENT":
-                    event = await db.events.find_one({"id": related_id})
-                    if event:
-                        related_details = {
-                            "name": event.get("title"),
-                            "date": event.get("start_date"),
-                            "sport": event.get("sport"),
-                            "city": event.get("city")
-                        }
-                elif related_type_upper == "RESERVATION":
-                    reservation = await db.reservations.find_one({"id": related_id})
-                    if reservation:
-                        related_details = {
-                            "name": f"{reservation.get('type', '')} Rezervasyonu",
-                            "date": reservation.get("date"),
-                            "sport": reservation.get("sport"),
-                            "city": reservation.get("city"),
-                            "total_price": reservation.get("total_price")
-                        }
-                elif related_type_upper == "MESSAGE":
-                    message = await db.messages.find_one({"id": related_id})
-                    if message:
-                        related_details = {
-                            "name": "Yeni Mesaj",
-                            "date": message.get("created_at")
-                        }
-                elif related_type_upper == "FACILITY":
-                    facility = await db.facilities.find_one({"id": related_id})
-                    if facility:
-                        related_details = {
-                            "name": facility.get("name"),
-                            "city": facility.get("city"),
-                            "status": facility.get("status", "pending")
-                        }
-            except Exception as e:
-                print(f"Error fetching related details: {e}")
-        
-        notif["related_details"] = related_details
+    
+    # Enrich notifications with related entity details (tip başına tek $in sorgusu)
+    await attach_related_details(db, notifications)
     
     # Get unread count
     unread_count = await db.notifications.count_documents({"user_id": current_user_id, "read": False})
@@ -109,7 +72,8 @@ async def get_notifications(
     return {
         "notifications": notifications,
         "unread_count": unread_count,
-        "total": len(notifications)
+        "total": len(notifications),
+        "next_cursor": next_cursor
     }
 
 @notification_router.get("/notifications/unread-count")
@@ -361,98 +325,50 @@ async def send_bulk_notification(
         raise HTTPException(status_code=403, detail="Bu işlem için admin yetkisi gerekiyor")
     
     try:
-        # Kullanıcıları filtrele
-        user_query = {"is_active": {"$ne": False}}
-        
         filters = data.filters
-        
         logger.info(f"📤 Bildirim gönderme isteği - Filtreler: {filters}")
         
-        # Spor dalı filtresi (çoklu)
-        if filters.sports and len(filters.sports) > 0:
-            user_query["$or"] = [
-                {"sports": {"$in": filters.sports}},
-                {"preferred_sport": {"$in": filters.sports}},
-                {"favorite_sports": {"$in": filters.sports}}
-            ]
-        
-        # Kullanıcı türü filtresi (çoklu)
-        if filters.user_types and len(filters.user_types) > 0:
-            user_query["user_type"] = {"$in": filters.user_types}
-        
-        # Cinsiyet filtresi (çoklu)
-        if filters.genders and len(filters.genders) > 0:
-            user_query["gender"] = {"$in": filters.genders}
-        
-        # Yaş grubu filtresi - şimdilik basitleştirilmiş
-        # TODO: Doğum tarihine göre daha detaylı filtreleme
-        
+        user_query = build_broadcast_query(filters.dict())
         logger.info(f"📤 Kullanıcı sorgusu: {user_query}")
         
-        # Hedef kullanıcıları getir
-        target_users = await db.users.find(user_query, {"id": 1, "full_name": 1}).to_list(10000)
-        
-        logger.info(f"📤 Bulunan kullanıcı sayısı: {len(target_users)}")
+        total_targets = await db.users.count_documents(user_query)
+        logger.info(f"📤 Bulunan kullanıcı sayısı: {total_targets}")
         
-        if not target_users:
+        if not total_targets:
             return {"message": "Filtrelere uyan kullanıcı bulunamadı", "sent_count": 0}
         
-        # Her kullanıcıya bildirim oluştur
-        notifications_to_insert = []
-        for user in target_users:
-            notification = {
-                "id": str(uuid.uuid4()),
-                "user_id": user.get("id"),
-                "type": "admin_broadcast",
-                "title": data.title,
-                "body": data.body,
-                "read": False,
-                "created_at": datetime.utcnow(),
-                "data": {
-                    "notification_type": data.notification_type,
-                    "media_url": data.media_url,
-                    "media_type": data.media_type,
-                }
-            }
-            notifications_to_insert.append(notification)
-        
-        # Toplu insert
-        if notifications_to_insert:
-            await db.notifications.insert_many(notifications_to_insert)
-        
-        # Push bildirim ise, push token'ları olan kullanıcılara gönder
-        push_sent_count = 0
-        if data.notification_type == "push":
-            user_ids = [u.get("id") for u in target_users]
-            push_tokens = await db.push_tokens.find({"user_id": {"$in": user_ids}}).to_list(10000)
-            
-            # TODO: Expo Push Notification API'ye gönder
-            # Bu kısım gerçek push gönderimi için ayrı bir servisle yapılabilir
-            push_sent_count = len(push_tokens)
-            logger.info(f"📱 Push bildirim {push_sent_count} cihaza gönderilecek")
-        
-        # Gönderilmiş bildirimi kaydet
+        # Gönderim kaydı aynı zamanda işin ilerleme/devam durumunu tutar
+        broadcast_id = str(uuid.uuid4())
         sent_notification = {
-            "id": str(uuid.uuid4()),
+            "id": broadcast_id,
             "notification_type": data.notification_type,
             "title": data.title,
             "body": data.body,
             "filters": filters.dict(),
             "media_url": data.media_url,
             "media_type": data.media_type,
-            "sent_count": len(target_users),
-            "push_sent_count": push_sent_count,
+            "status": STATUS_PENDING,
+            "total_targets": total_targets,
+            "processed_count": 0,
+            "sent_count": 0,
+            "push_sent_count": 0,
+            "push_failed_count": 0,
+            "last_user_id": None,
             "sent_by": current_user.get("id"),
             "created_at": datetime.utcnow()
         }
         await db.admin_sent_notifications.insert_one(sent_notification)
         
-        logger.info(f"✅ Toplu bildirim gönderildi: {len(target_users)} kullanıcı, {data.title}")
+        # Gönderim arka planda parça parça yapılır; ilerleme: GET /admin/notifications/sent/{id}
+        start_broadcast(db, broadcast_id)
+        logger.info(f"✅ Toplu bildirim başlatıldı: {total_targets} kullanıcı, {data.title}")
         
         return {
-            "message": "Bildirim gönderildi",
-            "sent_count": len(target_users),
-            "push_sent_count": push_sent_count
+            "message": "Bildirim gönderimi başlatıldı",
+            "broadcast_id": broadcast_id,
+            "status": STATUS_PENDING,
+            "sent_count": total_targets,
+            "push_sent_count": 0
         }
         
     except Exception as e:
@@ -460,6 +376,33 @@ async def send_bulk_notification(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@notification_router.get("/admin/notifications/sent/{broadcast_id}")
+async def get_broadcast_progress(
+    request: Request,
+    broadcast_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Toplu bildirim gönderiminin ilerlemesi"""
+    db = request.app.state.db
+    
+    # Admin kontrolü
+    if current_user.get("user_type") != "admin":
+        raise HTTPException(status_code=403, detail="Bu işlem için admin yetkisi gerekiyor")
+    
+    job = await db.admin_sent_notifications.find_one(
+        {"id": broadcast_id}, {"_id": 0, "worker_id": 0}
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Gönderim bulunamadı")
+    
+    # Eski (senkron gönderilmiş) kayıtlarda status yoktur; tamamlanmış sayılır
+    job.setdefault("status", STATUS_COMPLETED)
+    total = job.get("total_targets") or job.get("sent_count") or 0
+    processed = job.get("processed_count", total)
+    job["progress"] = round(processed / total * 100, 1) if total else 100.0
+    return job
+
+
 @notification_router.get("/admin/notifications/sent")
 async def get_sent_notifications(
     request: Request,
@@ -475,7 +418,9 @@ async def get_sent_notifications(
         raise HTTPException(status_code=403, detail="Bu işlem için admin yetkisi gerekiyor")
     
     try:
-        notifications = await db.admin_sent_notifications.find().sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+        notifications = await db.admin_sent_notifications.find(
+            {}, {"worker_id": 0}
+        ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
         
         # ObjectId'yi string'e çevir
         for n in notifications:
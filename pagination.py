@@ -0,0 +1,132 @@
+"""
+Cursor (Keyset) Pagination
+Listeleme endpoint'leri için skip/limit yerine opak cursor tabanlı sayfalama.
+
+Cursor, son dokümanın sıralama anahtarlarının değerlerini taşır; bir sonraki sayfa
+bu değerlerden "sonra" gelen dokümanlarla başlar. Böylece derin sayfalar da index
+üzerinden sabit maliyetle okunur. Son sıralama anahtarı her zaman benzersiz bir
+alan (id / _id) olmalıdır ki eşit değerlerde sıra bozulmasın.
+"""
+import base64
+import hashlib
+import logging
+from typing import Any, List, Optional, Tuple
+
+from bson import json_util
+from cachetools import TTLCache
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Yaklaşık toplamlar için: (koleksiyon, sorgu) → count
+COUNT_CACHE_TTL = 30
+_count_cache = TTLCache(maxsize=2048, ttl=COUNT_CACHE_TTL)
+
+
+def _get_path(doc: dict, path: str) -> Any:
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def encode_cursor(doc: dict, sort_keys: List[Tuple[str, int]]) -> str:
+    """Dokümanın sıralama değerlerinden opak cursor üret"""
+    values = [_get_path(doc, field) for field, _ in sort_keys]
+    raw = json_util.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_keys: List[Tuple[str, int]]) -> list:
+    """Cursor'ı sıralama değerlerine çöz; geçersizse 400 döndür"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Geçersiz cursor")
+    if not isinstance(values, list) or len(values) != len(sort_keys):
+        raise HTTPException(status_code=400, detail="Geçersiz cursor")
+    return values
+
+
+def _after(field: str, direction: int, value: Any) -> Optional[dict]:
+    """Sıralamada `value`'dan sonra gelen değerler için koşul (null'lar artan sırada başta)"""
+    if direction == 1:
+        if value is None:
+            return {field: {"$ne": None}}
+        return {field: {"$gt": value}}
+    if value is None:
+        return None
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def keyset_filter(sort_keys: List[Tuple[str, int]], values: list) -> dict:
+    """
+    (k1, k2, ..., kn) > (v1, v2, ..., vn) koşulunu Mongo sorgusuna çevir:
+    k1 > v1  OR  (k1 == v1 AND k2 > v2)  OR ...
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort_keys):
+        after = _after(field, direction, values[i])
+        if after is None:
+            continue
+        equal = [{sort_keys[j][0]: values[j]} for j in range(i)]
+        clauses.append({"$and": equal + [after]} if equal else after)
+    if not clauses:
+        # Son sayfadan sonrası: hiçbir şey eşleşmesin
+        return {"_id": {"$exists": False}}
+    return {"$or": clauses} if len(clauses) > 1 else clauses[0]
+
+
+def merge_filters(query: dict, extra: dict) -> dict:
+    """Mevcut sorguyu bozmadan ($or çakışmasını önleyerek) ek koşul ekle"""
+    if not query:
+        return extra
+    return {"$and": [query, extra]}
+
+
+async def paginate(
+    collection,
+    query: dict,
+    sort_keys: List[Tuple[str, int]],
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    projection: Optional[dict] = None,
+) -> Tuple[list, Optional[str]]:
+    """
+    Bir sayfa doküman ve bir sonraki sayfanın cursor'ını döndür.
+
+    cursor verilirse keyset sayfalama yapılır ve skip yok sayılır; verilmezse
+    geriye dönük uyumluluk için skip uygulanır. Sonraki sayfa yoksa cursor None'dır.
+    limit en az 1'e çekilir, negatif skip yok sayılır.
+    """
+    limit = max(limit, 1)
+    if cursor:
+        query = merge_filters(query, keyset_filter(sort_keys, decode_cursor(cursor, sort_keys)))
+        skip = 0
+
+    find = collection.find(query, projection) if projection else collection.find(query)
+    find = find.sort(sort_keys)
+    if skip > 0:
+        find = find.skip(skip)
+    docs = await find.limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_keys)
+    return docs, next_cursor
+
+
+async def cached_count(collection, query: dict) -> int:
+    """count_documents sonucunu kısa süre cache'le (sayfa başına tam sayım yerine yaklaşık toplam)"""
+    digest = hashlib.sha1(json_util.dumps(query, sort_keys=True).encode("utf-8")).hexdigest()
+    key = (collection.name, digest)
+    total = _count_cache.get(key)
+    if total is None:
+        total = await collection.count_documents(query)
+        _count_cache[key] = total
+    return total
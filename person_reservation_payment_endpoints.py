@@ -9,6 +9,7 @@ from pydantic import BaseModel
 
 from auth import get_current_user
 from iyzico_service import IyzicoService
+from user_calendar import refresh_user_calendar
 from notification_endpoints import create_notification_helper
 
 # Setup
@@ -745,6 +746,7 @@ async def add_calendar_items_for_reservation(db, reservation: dict):
             "created_at": datetime.utcnow().isoformat()
         }
         await db.calendar_items.insert_one(calendar_item_seller)
+        await refresh_user_calendar(db, reservation_ids=[reservation_id])
         
         logger.info(f"📅 Calendar items created for reservation {reservation_id} - Buyer: {buyer_id}, Seller: {seller_id}")
         
@@ -1,16 +1,381 @@
 """
 Push Notification Service
 Handles sending push notifications via Expo Push Notification API
+
+Gönderimler ExpoPushDispatcher üzerinden yapılır: mesajlar bir kuyrukta toplanıp
+Expo'nun 100'lük batch'lerine birleştirilir, paylaşılan (pooled) bir httpx
+client ile sınırlı eşzamanlılıkla gönderilir, 429/5xx hatalarında backoff ile
+tekrar denenir. Ticket'lar için receipt'ler periyodik olarak sorgulanır ve
+DeviceNotRegistered dönen token'lar veritabanından temizlenir.
+
+Yerel test için: uvicorn expo_stub_server:app --port 8099 ve
+EXPO_PUSH_URL=http://localhost:8099/--/api/v2/push/send
+EXPO_RECEIPTS_URL=http://localhost:8099/--/api/v2/push/getReceipts
 """
-import os
-import requests
+import asyncio
 import logging
-from typing import List, Dict, Optional
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
 from models import NotificationType, NotificationRelatedType
 
-EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+EXPO_PUSH_URL = os.environ.get("EXPO_PUSH_URL", "https://exp.host/--/api/v2/push/send")
+EXPO_RECEIPTS_URL = os.environ.get("EXPO_RECEIPTS_URL", "https://exp.host/--/api/v2/push/getReceipts")
+EXPO_ACCESS_TOKEN = os.environ.get("EXPO_ACCESS_TOKEN")
+
+# Expo limitleri: send isteği başına 100 mesaj, getReceipts isteği başına 1000 id
+EXPO_BATCH_SIZE = 100
+EXPO_RECEIPT_BATCH_SIZE = 1000
+
 logger = logging.getLogger(__name__)
 
+
+class PushDeliveryError(Exception):
+    """Expo isteği başarısız oldu (retryable=True ise tekrar denenebilir)"""
+
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def _is_valid_token(token: Optional[str]) -> bool:
+    # Accept both ExponentPushToken and expo push token formats
+    return bool(token) and (token.startswith("ExponentPushToken") or token.startswith("Expo"))
+
+
+class ExpoPushDispatcher:
+    """
+    Uygulama event loop'unda çalışan push gönderim kuyruğu.
+
+    start(db) lifespan içinde çağrılır. Başka bir event loop'tan (ör. thread
+    tabanlı scheduler job'ları) yapılan send() çağrıları uygulama loop'una
+    aktarılır; dispatcher başlatılmamışsa (scriptler) doğrudan gönderilir.
+    """
+
+    def __init__(
+        self,
+        push_url: str = EXPO_PUSH_URL,
+        receipts_url: str = EXPO_RECEIPTS_URL,
+        max_concurrency: int = int(os.environ.get("PUSH_MAX_CONCURRENCY", "4")),
+        linger: float = float(os.environ.get("PUSH_BATCH_LINGER_MS", "20")) / 1000,
+        max_retries: int = int(os.environ.get("PUSH_MAX_RETRIES", "3")),
+        backoff_base: float = 0.5,
+        receipt_delay: float = 15 * 60,
+        receipt_poll_interval: float = 5 * 60,
+        receipt_ttl: float = 24 * 60 * 60,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.push_url = push_url
+        self.receipts_url = receipts_url
+        self.max_concurrency = max_concurrency
+        self.linger = linger
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.receipt_delay = receipt_delay
+        self.receipt_poll_interval = receipt_poll_interval
+        self.receipt_ttl = receipt_ttl
+        self.transport = transport
+        self.db = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._receipt_task: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+        # ticket_id → (token, gönderim zamanı)
+        self._pending_receipts: Dict[str, Tuple[str, float]] = {}
+        self._stats = {"sent": 0, "failed": 0, "batches": 0, "retries": 0, "pruned_tokens": 0}
+
+    # ---------- lifecycle ----------
+
+    def _new_client(self) -> httpx.AsyncClient:
+        headers = {
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Content-Type": "application/json",
+        }
+        if EXPO_ACCESS_TOKEN:
+            headers["Authorization"] = f"Bearer {EXPO_ACCESS_TOKEN}"
+        return httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=self.max_concurrency * 2,
+                                max_keepalive_connections=self.max_concurrency),
+            transport=self.transport,
+        )
+
+    def start(self, db=None):
+        """Kuyruk worker'ını ve receipt poller'ı mevcut event loop üzerinde başlat"""
+        self.db = db
+        if self._worker and not self._worker.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._client = self._new_client()
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._worker = asyncio.create_task(self._run())
+        self._receipt_task = asyncio.create_task(self._run_receipts())
+
+    async def stop(self):
+        """Kuyruktaki mesajları gönder, görevleri durdur ve client'ı kapat"""
+        if not self._worker:
+            return
+        await self._queue.join()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        for task in (self._worker, self._receipt_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._worker = self._receipt_task = None
+        await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def metrics(self) -> dict:
+        return {
+            **self._stats,
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "in_flight_batches": len(self._in_flight),
+            "pending_receipts": len(self._pending_receipts),
+        }
+
+    # ---------- gönderim ----------
+
+    async def send(self, messages: List[dict]) -> List[dict]:
+        """Mesajları gönder ve her biri için Expo ticket'ını (aynı sırada) döndür"""
+        if not messages:
+            return []
+        if not self.running:
+            return await self._send_direct(messages)
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if current is not self._loop:
+            # Başka loop/thread'den çağrı: uygulama loop'undaki kuyruğa aktar
+            future = asyncio.run_coroutine_threadsafe(self._enqueue(messages), self._loop)
+            return await asyncio.wrap_future(future)
+        return await self._enqueue(messages)
+
+    async def _enqueue(self, messages: List[dict]) -> List[dict]:
+        futures = []
+        for message in messages:
+            future = self._loop.create_future()
+            futures.append(future)
+            self._queue.put_nowait((message, future))
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return [
+            r if not isinstance(r, Exception) else {"status": "error", "message": str(r)}
+            for r in results
+        ]
+
+    async def _send_direct(self, messages: List[dict]) -> List[dict]:
+        """Dispatcher çalışmıyorken (scriptler) geçici client ile batch'ler halinde gönder"""
+        tickets = []
+        async with self._new_client() as client:
+            for i in range(0, len(messages), EXPO_BATCH_SIZE):
+                batch = messages[i:i + EXPO_BATCH_SIZE]
+                try:
+                    tickets.extend(await self._post_with_retry(client, batch))
+                except PushDeliveryError as e:
+                    tickets.extend({"status": "error", "message": str(e)} for _ in batch)
+        return tickets
+
+    async def _run(self):
+        """Kuyruktan mesajları 100'lük batch'lere topla ve eşzamanlılık sınırıyla gönder"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.linger
+            while len(batch) < EXPO_BATCH_SIZE:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0 and self._queue.empty():
+                    break
+                try:
+                    batch.append(self._queue.get_nowait() if remaining <= 0
+                                 else await asyncio.wait_for(self._queue.get(), remaining))
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+
+            # Semaphore dolunca kuyruk birikir (backpressure)
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._deliver(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _deliver(self, batch: List[Tuple[dict, asyncio.Future]]):
+        try:
+            messages = [message for message, _ in batch]
+            try:
+                tickets = await self._post_with_retry(self._client, messages)
+            except Exception as e:
+                self._stats["failed"] += len(batch)
+                logger.error(f"Push notification batch failed ({len(batch)} messages): {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            dead_tokens = []
+            for (message, future), ticket in zip(batch, tickets):
+                if self._track_ticket(message.get("to"), ticket):
+                    dead_tokens.append(message.get("to"))
+                if not future.done():
+                    future.set_result(ticket)
+            if dead_tokens:
+                await self.prune_tokens(dead_tokens)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+            self._semaphore.release()
+
+    async def _post_with_retry(self, client: httpx.AsyncClient, messages: List[dict]) -> List[dict]:
+        """Tek batch'i gönder; 429/5xx/ağ hatalarında üstel backoff + jitter ile tekrar dene"""
+        attempt = 0
+        while True:
+            try:
+                return await self._post(client, messages)
+            except PushDeliveryError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                delay = e.retry_after or self.backoff_base * (2 ** attempt)
+                delay += random.uniform(0, self.backoff_base)
+                attempt += 1
+                self._stats["retries"] += 1
+                logger.warning(f"⚠️ Push batch retry {attempt}/{self.max_retries} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def _post(self, client: httpx.AsyncClient, messages: List[dict]) -> List[dict]:
+        try:
+            response = await client.post(self.push_url, json=messages)
+        except httpx.HTTPError as e:
+            raise PushDeliveryError(f"Expo request error: {e}", retryable=True)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("Retry-After")
+            raise PushDeliveryError(
+                f"Expo responded {response.status_code}",
+                retryable=True,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        if response.status_code != 200:
+            raise PushDeliveryError(f"Failed to send notification: {response.status_code} - {response.text}")
+
+        tickets = response.json().get("data") or []
+        if len(tickets) != len(messages):
+            raise PushDeliveryError(f"Expo returned {len(tickets)} tickets for {len(messages)} messages")
+        self._stats["batches"] += 1
+        self._stats["sent"] += sum(1 for t in tickets if t.get("status") == "ok")
+        self._stats["failed"] += sum(1 for t in tickets if t.get("status") != "ok")
+        return tickets
+
+    def _track_ticket(self, token: str, ticket: dict) -> bool:
+        """Ticket'ı receipt takibine al; token kalıcı olarak geçersizse True döndür"""
+        if ticket.get("status") == "ok":
+            if ticket.get("id"):
+                self._pending_receipts[ticket["id"]] = (token, time.monotonic())
+            return False
+        error = (ticket.get("details") or {}).get("error")
+        logger.warning(f"Push ticket error for {str(token)[:25]}...: {error or ticket.get('message')}")
+        return error == "DeviceNotRegistered"
+
+    # ---------- receipt'ler ----------
+
+    async def _run_receipts(self):
+        while True:
+            await asyncio.sleep(self.receipt_poll_interval)
+            try:
+                await self.check_receipts()
+            except Exception as e:
+                logger.error(f"❌ Push receipt check failed: {e}")
+
+    async def check_receipts(self, min_age: Optional[float] = None) -> dict:
+        """
+        Olgunlaşmış ticket'ların receipt'lerini sorgula, DeviceNotRegistered
+        token'ları temizle. Henüz hazır olmayan receipt'ler receipt_ttl dolana kadar bekletilir.
+        """
+        min_age = self.receipt_delay if min_age is None else min_age
+        now = time.monotonic()
+        due = [tid for tid, (_, sent_at) in self._pending_receipts.items() if now - sent_at >= min_age]
+        summary = {"checked": 0, "ok": 0, "errors": 0, "pruned": 0}
+        if not due:
+            return summary
+
+        client = self._client or self._new_client()
+        dead_tokens = []
+        try:
+            for i in range(0, len(due), EXPO_RECEIPT_BATCH_SIZE):
+                ids = due[i:i + EXPO_RECEIPT_BATCH_SIZE]
+                try:
+                    response = await client.post(self.receipts_url, json={"ids": ids})
+                    response.raise_for_status()
+                    receipts = response.json().get("data") or {}
+                except httpx.HTTPError as e:
+                    logger.warning(f"⚠️ Push receipt request failed: {e}")
+                    continue
+
+                for ticket_id in ids:
+                    receipt = receipts.get(ticket_id)
+                    token, sent_at = self._pending_receipts[ticket_id]
+                    if receipt is None:
+                        if now - sent_at > self.receipt_ttl:
+                            self._pending_receipts.pop(ticket_id, None)
+                        continue
+                    self._pending_receipts.pop(ticket_id, None)
+                    summary["checked"] += 1
+                    if receipt.get("status") == "ok":
+                        summary["ok"] += 1
+                        continue
+                    summary["errors"] += 1
+                    error = (receipt.get("details") or {}).get("error")
+                    logger.warning(f"Push receipt error for {str(token)[:25]}...: {error or receipt.get('message')}")
+                    if error == "DeviceNotRegistered":
+                        dead_tokens.append(token)
+        finally:
+            if client is not self._client:
+                await client.aclose()
+
+        if dead_tokens:
+            summary["pruned"] = await self.prune_tokens(dead_tokens)
+        return summary
+
+    async def prune_tokens(self, tokens: List[str]) -> int:
+        """Artık kayıtlı olmayan cihaz token'larını kullanıcılardan ve push_tokens'dan sil"""
+        tokens = list({t for t in tokens if t})
+        if not tokens or self.db is None:
+            return 0
+        try:
+            await self.db.users.update_many({"push_token": {"$in": tokens}}, {"$unset": {"push_token": ""}})
+            await self.db.users.update_many({"expoPushToken": {"$in": tokens}}, {"$unset": {"expoPushToken": ""}})
+            await self.db.users.update_many(
+                {"push_tokens": {"$in": tokens}}, {"$pull": {"push_tokens": {"$in": tokens}}}
+            )
+            await self.db.push_tokens.delete_many({"expo_push_token": {"$in": tokens}})
+        except Exception as e:
+            logger.error(f"❌ Push token prune failed: {e}")
+            return 0
+        self._stats["pruned_tokens"] += len(tokens)
+        logger.info(f"🧹 Pruned {len(tokens)} unregistered push tokens")
+        return len(tokens)
+
+
+# Uygulama genelinde tek dispatcher (server.py lifespan'de start/stop edilir)
+push_dispatcher = ExpoPushDispatcher()
+
+
 class PushNotificationService:
     
     def __init__(self):
@@ -20,6 +385,24 @@ class PushNotificationService:
         """Database referansını ayarla"""
         self.db = database
     
+    async def _load_push_tokens(self, user_ids: List[str]) -> List[str]:
+        """Kullanıcıların push token'larını tek users + tek push_tokens sorgusuyla topla"""
+        tokens = []
+        users = await self.db.users.find(
+            {"id": {"$in": user_ids}},
+            {"_id": 0, "push_token": 1, "expoPushToken": 1}
+        ).to_list(length=None)
+        for user in users:
+            token = user.get("push_token") or user.get("expoPushToken")
+            if token:
+                tokens.append(token)
+        registered = await self.db.push_tokens.find(
+            {"user_id": {"$in": user_ids}},
+            {"_id": 0, "expo_push_token": 1}
+        ).to_list(length=None)
+        tokens.extend(doc["expo_push_token"] for doc in registered if doc.get("expo_push_token"))
+        return list(dict.fromkeys(tokens))
+    
     async def send_notification(
         self,
         user_id: str,
@@ -32,25 +415,19 @@ class PushNotificationService:
         Send push notification to a single user by user_id
         This method looks up the user's push token from the database
         """
-        if not self.db:
+        if self.db is None:
             logger.warning("Database not set for PushNotificationService")
             return {"success": False, "error": "Database not configured"}
         
         try:
-            # Get user's push token from database
-            user = await self.db.users.find_one({"id": user_id})
-            if not user:
-                logger.warning(f"User not found for push notification: {user_id}")
-                return {"success": False, "error": "User not found"}
-            
-            push_token = user.get("push_token") or user.get("expoPushToken")
-            if not push_token:
+            push_tokens = await self._load_push_tokens([user_id])
+            if not push_tokens:
                 logger.debug(f"No push token for user: {user_id}")
                 return {"success": False, "error": "No push token for user"}
             
             # Send the notification
             return await self.send_push_notification(
-                push_tokens=[push_token],
+                push_tokens=push_tokens,
                 title=title,
                 body=body,
                 data=data,
@@ -78,8 +455,7 @@ class PushNotificationService:
         for token in push_tokens:
             if not token:
                 continue
-            # Accept both ExponentPushToken and expo push token formats
-            if not (token.startswith("ExponentPushToken") or token.startswith("Expo")):
+            if not _is_valid_token(token):
                 logger.warning(f"Invalid push token format: {token[:20]}...")
                 continue
                 
@@ -97,29 +473,21 @@ class PushNotificationService:
             return {"success": False, "error": "No valid push tokens"}
         
         try:
-            response = requests.post(
-                EXPO_PUSH_URL,
-                json=messages,
-                headers={
-                    "Accept": "application/json",
-                    "Content-Type": "application/json",
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"✅ Push notification sent successfully to {len(messages)} devices")
-                return {"success": True, "data": response.json()}
-            else:
-                logger.error(f"Push notification failed: {response.status_code} - {response.text}")
-                return {
-                    "success": False,
-                    "error": f"Failed to send notification: {response.status_code}",
-                    "details": response.text
-                }
+            tickets = await push_dispatcher.send(messages)
         except Exception as e:
             logger.error(f"Push notification exception: {e}")
             return {"success": False, "error": str(e)}
+        
+        delivered = sum(1 for t in tickets if t.get("status") == "ok")
+        if not delivered:
+            return {
+                "success": False,
+                "error": "Failed to send notification",
+                "details": tickets
+            }
+        logger.info(f"✅ Push notification sent successfully to {delivered}/{len(messages)} devices")
+        # Expo yanıt formatı korunur: {"data": [ticket, ...]}
+        return {"success": True, "data": {"data": tickets}}
     
     async def send_to_multiple_users(
         self,
@@ -132,19 +500,12 @@ class PushNotificationService:
         """
         Send push notification to multiple users by their IDs
         """
-        if not self.db:
+        if self.db is None:
             logger.warning("Database not set for PushNotificationService")
             return {"success": False, "error": "Database not configured"}
         
         try:
-            # Get all users' push tokens
-            users = await self.db.users.find({"id": {"$in": user_ids}}).to_list(length=None)
-            push_tokens = []
-            
-            for user in users:
-                token = user.get("push_token") or user.get("expoPushToken")
-                if token:
-                    push_tokens.append(token)
+            push_tokens = await self._load_push_tokens(user_ids)
             
             if not push_tokens:
                 return {"success": False, "error": "No push tokens found for users"}
@@ -0,0 +1,118 @@
+"""
+User Rating Aggregates
+Kullanıcı dokümanında denormalize tutulan puan özetleri:
+
+    {"rating_sum": 42, "review_count": 10, "rating_distribution": {"1": 0, ..., "5": 6}}
+
+Değerlendirme ekleyen/silen endpoint'ler apply_review_rating() ile bu alanları
+atomik $inc ile günceller; liste ve profil endpoint'leri ortalamayı reviews
+koleksiyonunu taramadan bu alanlardan okur. Mevcut veriler ve olası sapmalar için:
+
+    python backfill_rating_aggregates.py
+"""
+import logging
+from typing import Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+RATING_BUCKETS = ("1", "2", "3", "4", "5")
+
+# Değerlendirilen kullanıcı: yeni kayıtlarda target_user_id, eskilerde reviewed_user_id,
+# /reviews (genel) endpoint'inde target_type == "user" ise target_id
+TARGET_USER_EXPR = {"$ifNull": ["$target_user_id", {"$ifNull": ["$reviewed_user_id", {
+    "$cond": [{"$eq": ["$target_type", "user"]}, "$target_id", None]
+}]}]}
+
+
+def review_target_user(review: dict) -> Optional[str]:
+    """Değerlendirmenin ait olduğu kullanıcı (kullanıcı değerlendirmesi değilse None)"""
+    user_id = review.get("target_user_id") or review.get("reviewed_user_id")
+    if not user_id and review.get("target_type") == "user":
+        user_id = review.get("target_id")
+    return user_id
+
+
+def rating_bucket(rating) -> str:
+    return str(min(max(int(round(rating)), 1), 5))
+
+
+def rating_fields(user: dict) -> dict:
+    """Kullanıcı dokümanındaki toplamlardan API'nin döndürdüğü alanları üret"""
+    count = max(user.get("review_count") or 0, 0)
+    rating_sum = user.get("rating_sum") or 0
+    distribution = user.get("rating_distribution") or {}
+    return {
+        "average_rating": round(rating_sum / count, 1) if count else 0,
+        "review_count": count,
+        "rating_distribution": {b: max(distribution.get(b, 0), 0) for b in RATING_BUCKETS},
+    }
+
+
+def attach_rating_fields(user: dict) -> dict:
+    user.update(rating_fields(user))
+    user.pop("rating_sum", None)
+    return user
+
+
+async def apply_review_rating(db, review: dict, sign: int = 1) -> Optional[dict]:
+    """
+    Eklenen (sign=1) veya silinen (sign=-1) değerlendirmeyi hedef kullanıcının
+    toplamlarına yansıt. Güncel rating_fields() sonucunu döndürür.
+    """
+    user_id = review_target_user(review)
+    rating = review.get("rating")
+    if not user_id or isinstance(rating, bool) or not isinstance(rating, (int, float)):
+        return None
+    user = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$inc": {
+            "rating_sum": sign * rating,
+            "review_count": sign,
+            f"rating_distribution.{rating_bucket(rating)}": sign,
+        }},
+        projection={"_id": 0, "rating_sum": 1, "review_count": 1, "rating_distribution": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return rating_fields(user) if user else None
+
+
+async def recompute_rating_aggregates(db) -> dict:
+    """Tüm kullanıcıların toplamlarını reviews koleksiyonundan yeniden hesapla"""
+    rows = await db.reviews.aggregate([
+        {"$match": {"rating": {"$type": "number"}}},
+        {"$project": {"_id": 0, "user_id": TARGET_USER_EXPR, "rating": 1}},
+        {"$match": {"user_id": {"$ne": None}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "rating": "$rating"},
+            "count": {"$sum": 1},
+            "sum": {"$sum": "$rating"},
+        }},
+    ]).to_list(None)
+
+    aggregates = {}
+    for row in rows:
+        user_id = row["_id"]["user_id"]
+        entry = aggregates.setdefault(user_id, {
+            "rating_sum": 0, "review_count": 0, "rating_distribution": {b: 0 for b in RATING_BUCKETS}
+        })
+        entry["rating_sum"] += row["sum"]
+        entry["review_count"] += row["count"]
+        entry["rating_distribution"][rating_bucket(row["_id"]["rating"])] += row["count"]
+
+    writes = [UpdateOne({"id": user_id}, {"$set": entry}) for user_id, entry in aggregates.items()]
+    # Değerlendirmesi kalmamış kullanıcıların toplamlarını sıfırla
+    empty = {"rating_sum": 0, "review_count": 0, "rating_distribution": {b: 0 for b in RATING_BUCKETS}}
+    stale = await db.users.distinct("id", {
+        "id": {"$nin": list(aggregates)},
+        "$or": [{"review_count": {"$ne": 0}}, {"rating_sum": {"$ne": 0}}],
+    })
+    writes += [UpdateOne({"id": user_id}, {"$set": empty}) for user_id in stale]
+
+    updated = 0
+    for i in range(0, len(writes), 1000):
+        result = await db.users.bulk_write(writes[i:i + 1000], ordered=False)
+        updated += result.modified_count
+    logger.info(f"⭐ Rating aggregates recomputed: {len(aggregates)} rated users, {updated} documents updated")
+    return {"rated_users": len(aggregates), "updated": updated}
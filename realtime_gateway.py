@@ -0,0 +1,142 @@
+"""
+Realtime Gateway
+Socket.IO sunucusu: yeni direkt/grup mesajlarını, okunmamış sayaç değişimlerini ve
+bildirimleri kullanıcı odalarına (user:<id>) push eder; istemcilerin
+/messages/unread-counts vb. endpoint'leri sürekli poll etmesine gerek kalmaz.
+
+Bağlantı: istemci Socket.IO handshake'inde JWT gönderir
+    io(API_URL, {path: "/socket.io", auth: {token: "<access_token>"}})
+
+Pub/sub backend'i REALTIME_PUBSUB_URL ile seçilir:
+    (boş)        → process içi (tek worker)
+    redis://...  → Redis pub/sub (birden fazla worker/replica)
+    amqp://...   → RabbitMQ
+Backend, bir worker'da publish edilen olayın diğer worker'lara bağlı
+istemcilere de ulaşmasını sağlar.
+"""
+import logging
+import os
+from typing import Iterable
+
+import socketio
+from fastapi.encoders import jsonable_encoder
+
+from auth import decode_token
+from unread_counters import group_member_ids
+
+logger = logging.getLogger(__name__)
+
+# Olay adları (istemci tarafı bu isimleri dinler)
+EVENT_MESSAGE_NEW = "message:new"
+EVENT_GROUP_MESSAGE_NEW = "group_message:new"
+EVENT_UNREAD_DELTA = "unread:delta"
+EVENT_NOTIFICATION_NEW = "notification:new"
+
+
+def _build_client_manager():
+    """REALTIME_PUBSUB_URL'e göre Socket.IO client manager (pub/sub backend) oluştur"""
+    url = os.environ.get("REALTIME_PUBSUB_URL", "").strip()
+    if not url:
+        return None  # process içi AsyncManager
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return socketio.AsyncRedisManager(url)
+    if url.startswith(("amqp://", "amqps://")):
+        return socketio.AsyncAioPikaManager(url)
+    logger.warning(f"⚠️ Unsupported REALTIME_PUBSUB_URL scheme, using in-process pub/sub: {url.split('://')[0]}")
+    return None
+
+
+def user_room(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    cors_allowed_origins="*",
+    client_manager=_build_client_manager(),
+)
+
+
+@sio.event
+async def connect(sid, environ, auth):
+    """JWT ile kimlik doğrula ve kullanıcıyı kendi odasına al"""
+    token = (auth or {}).get("token") if isinstance(auth, dict) else None
+    if not token:
+        raise socketio.exceptions.ConnectionRefusedError("authentication required")
+    try:
+        payload = decode_token(token)
+    except Exception:
+        raise socketio.exceptions.ConnectionRefusedError("invalid token")
+
+    user_id = payload.get("sub")
+    if not user_id:
+        raise socketio.exceptions.ConnectionRefusedError("invalid token")
+
+    await sio.save_session(sid, {"user_id": user_id})
+    await sio.enter_room(sid, user_room(user_id))
+    logger.info(f"🔌 Realtime connected: user {user_id} (sid {sid})")
+
+
+@sio.event
+async def disconnect(sid):
+    logger.info(f"🔌 Realtime disconnected: sid {sid}")
+
+
+async def publish_to_users(user_ids: Iterable[str], event: str, data: dict):
+    """
+    Olayı kullanıcı odalarına yayınla.
+
+    Gerçek zamanlı iletim best-effort'tur: hata isteği bozmaz, istemci
+    yeniden bağlandığında REST endpoint'lerinden senkronize olur.
+    """
+    rooms = [user_room(user_id) for user_id in user_ids if user_id]
+    if not rooms:
+        return
+    try:
+        await sio.emit(event, jsonable_encoder(data), to=rooms)
+    except Exception as e:
+        logger.warning(f"⚠️ Realtime publish failed ({event}): {e}")
+
+
+async def publish_to_user(user_id: str, event: str, data: dict):
+    await publish_to_users([user_id], event, data)
+
+
+async def publish_direct_message(message: dict):
+    """
+    Yeni direkt mesajı alıcıya (ve göndericinin diğer cihazlarına) ilet.
+    Sayaç artışı yalnızca okunmamış mesajlarda gönderilir (increment_direct ile aynı koşul).
+    """
+    payload = {k: v for k, v in message.items() if k != "_id"}
+    await publish_to_users([message.get("receiver_id"), message.get("sender_id")], EVENT_MESSAGE_NEW, payload)
+    if message.get("is_read"):
+        return
+    await publish_to_user(
+        message.get("receiver_id"), EVENT_UNREAD_DELTA,
+        {"type": "direct", "peer_id": message.get("sender_id"), "delta": 1}
+    )
+
+
+async def publish_group_message(message: dict, group: dict):
+    """Yeni grup mesajını tüm üyelere ilet, gönderen dışındakilere sayaç artışı gönder"""
+    member_ids = group_member_ids(group)
+    payload = {k: v for k, v in message.items() if k != "_id"}
+    await publish_to_users(member_ids, EVENT_GROUP_MESSAGE_NEW, payload)
+    await publish_to_users(
+        [m for m in member_ids if m != message.get("sender_id")], EVENT_UNREAD_DELTA,
+        {"type": "group", "group_id": message.get("group_id"), "delta": 1}
+    )
+
+
+async def publish_unread_cleared(user_id: str, peer_id: str = None, group_id: str = None):
+    """Okundu işaretlemesini kullanıcının diğer cihazlarına bildir"""
+    if group_id:
+        data = {"type": "group", "group_id": group_id, "cleared": True}
+    else:
+        data = {"type": "direct", "peer_id": peer_id, "cleared": True}
+    await publish_to_user(user_id, EVENT_UNREAD_DELTA, data)
+
+
+async def publish_notification(notification: dict):
+    payload = {k: v for k, v in notification.items() if k != "_id"}
+    await publish_to_user(notification.get("user_id"), EVENT_NOTIFICATION_NEW, payload)
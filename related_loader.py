@@ -0,0 +1,112 @@
+"""
+Related Entity Loader
+Liste endpoint'lerinde (related_type, related_id) referanslarını toplu çözer.
+
+Referanslar tipe göre gruplanır ve her tip için tek bir projeksiyonlu $in sorgusu
+atılır; N kayıt için N find_one yerine en fazla "tip sayısı" kadar sorgu yapılır.
+Yeni tipler register_related_type() ile eklenir.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# TYPE → {"collection", "key", "projection", "format"}
+RELATED_SOURCES: Dict[str, dict] = {}
+
+
+def register_related_type(related_type: str, collection: str, projection: dict,
+                          formatter: Callable[[dict], dict], key: str = "id"):
+    """Bir related_type'ın hangi koleksiyondan ve hangi alanlarla okunacağını tanımla"""
+    RELATED_SOURCES[related_type.upper()] = {
+        "collection": collection,
+        "key": key,
+        "projection": {"_id": 0, key: 1, **projection},
+        "format": formatter,
+    }
+
+
+register_related_type(
+    "EVENT", "events",
+    {"title": 1, "start_date": 1, "sport": 1, "city": 1},
+    lambda event: {
+        "name": event.get("title"),
+        "date": event.get("start_date"),
+        "sport": event.get("sport"),
+        "city": event.get("city")
+    }
+)
+register_related_type(
+    "RESERVATION", "reservations",
+    {"type": 1, "date": 1, "sport": 1, "city": 1, "total_price": 1},
+    lambda reservation: {
+        "name": f"{reservation.get('type', '')} Rezervasyonu",
+        "date": reservation.get("date"),
+        "sport": reservation.get("sport"),
+        "city": reservation.get("city"),
+        "total_price": reservation.get("total_price")
+    }
+)
+register_related_type(
+    "MESSAGE", "messages",
+    {"created_at": 1},
+    lambda message: {
+        "name": "Yeni Mesaj",
+        "date": message.get("created_at")
+    }
+)
+register_related_type(
+    "FACILITY", "facilities",
+    {"name": 1, "city": 1, "status": 1},
+    lambda facility: {
+        "name": facility.get("name"),
+        "city": facility.get("city"),
+        "status": facility.get("status", "pending")
+    }
+)
+
+
+async def _load_type(db, related_type: str, ids: List[str]) -> Dict[Tuple[str, str], dict]:
+    source = RELATED_SOURCES[related_type]
+    try:
+        docs = await db[source["collection"]].find(
+            {source["key"]: {"$in": ids}}, source["projection"]
+        ).to_list(len(ids))
+    except Exception as e:
+        logger.error(f"Error fetching related {related_type} entities: {e}")
+        return {}
+    return {(related_type, doc[source["key"]]): doc for doc in docs}
+
+
+async def load_related(db, refs: Iterable[Tuple[Optional[str], Optional[str]]]) -> Dict[Tuple[str, str], dict]:
+    """
+    (related_type, related_id) çiftlerini çöz; (TYPE, id) → ham doküman döndür.
+    Tip büyük/küçük harf duyarsızdır; bilinmeyen tipler ve boş referanslar atlanır.
+    """
+    grouped: Dict[str, set] = {}
+    for related_type, related_id in refs:
+        if not related_type or not related_id:
+            continue
+        related_type = related_type.upper()
+        if related_type in RELATED_SOURCES:
+            grouped.setdefault(related_type, set()).add(related_id)
+
+    results = await asyncio.gather(*(
+        _load_type(db, related_type, list(ids)) for related_type, ids in grouped.items()
+    ))
+    loaded: Dict[Tuple[str, str], dict] = {}
+    for result in results:
+        loaded.update(result)
+    return loaded
+
+
+async def attach_related_details(db, items: List[dict], type_field: str = "related_type",
+                                 id_field: str = "related_id", target: str = "related_details"):
+    """Her öğeye referans verdiği varlığın özetini (veya None) `target` alanına ekle"""
+    loaded = await load_related(db, ((item.get(type_field), item.get(id_field)) for item in items))
+    for item in items:
+        related_type = (item.get(type_field) or "").upper()
+        doc = loaded.get((related_type, item.get(id_field)))
+        item[target] = RELATED_SOURCES[related_type]["format"](doc) if doc else None
+    return items
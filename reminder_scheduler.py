@@ -5,9 +5,12 @@ Sends notifications 24 hours and 1 hour before events/reservations start
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, timedelta, timezone
 import logging
-from typing import List, Dict
+import uuid
+from typing import List, Dict, Optional, Tuple
 import asyncio
+from pymongo.errors import BulkWriteError
 from push_notification_service import PushNotificationService
+from job_lock import run_exclusive
 
 logger = logging.getLogger(__name__)
 
@@ -17,232 +20,343 @@ push_service = None
 # Global scheduler instance
 scheduler = None
 
-async def check_and_send_reminders(db):
+# Hatırlatma pencereleri: (tip, başlangıca kalan min saat, max saat) - 30 dk tolerans
+REMINDER_WINDOWS = [("24h", 23.5, 24.5), ("1h", 0.5, 1.5)]
+
+# Gönderilmiş hatırlatmalar: _id = "<kind>:<ref_id>:<user_id>:<reminder_type>"
+# Duplicate key hatası = daha önce gönderilmiş (notifications.find_one yerine)
+SENT_REMINDERS = "sent_reminders"
+
+
+def _as_utc(value) -> Optional[datetime]:
+    """datetime (naive = UTC) veya ISO string'i timezone-aware UTC datetime'a çevir"""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return None
+
+
+def _reminder_type(start: datetime, now: datetime) -> Optional[Tuple[str, float]]:
+    """Başlangıç bir hatırlatma penceresindeyse (tip, kalan saat) döndür"""
+    if start <= now:
+        return None
+    hours_until = (start - now).total_seconds() / 3600
+    for reminder_type, low, high in REMINDER_WINDOWS:
+        if low <= hours_until <= high:
+            return reminder_type, hours_until
+    return None
+
+
+def _window_bounds(now: datetime) -> Tuple[datetime, datetime]:
+    """Tüm pencereleri kapsayan [en erken, en geç] başlangıç aralığı"""
+    return (now + timedelta(hours=min(w[1] for w in REMINDER_WINDOWS)),
+            now + timedelta(hours=max(w[2] for w in REMINDER_WINDOWS)))
+
+
+def datetime_range_query(field: str, low: datetime, high: datetime) -> dict:
     """
-    Check for upcoming events and reservations and send notifications
-    Runs every 5 minutes
+    Zaman aralığı sorgusu: alan hem BSON date (naive UTC) hem ISO string olarak
+    saklanabildiği için iki tipe de ayrı aralık uygulanır (Mongo aralıkları tip bazlıdır).
+    String'lerde olası timezone offset'leri için aralık genişletilir; kesin kontrol Python'da.
     """
+    low_naive, high_naive = low.replace(tzinfo=None), high.replace(tzinfo=None)
+    slack = timedelta(hours=14)
+    return {"$or": [
+        {field: {"$gte": low_naive, "$lte": high_naive}},
+        {field: {"$gte": (low_naive - slack).isoformat(), "$lte": (high_naive + slack).isoformat()}},
+    ]}
+
+
+def reservation_day_query(low: datetime, high: datetime) -> dict:
+    """date alanı "YYYY-MM-DD..." string: gün bazında aday aralık, kesin kontrol reservation_start ile"""
+    return {"date": {"$gte": (low - timedelta(days=1)).strftime("%Y-%m-%d"),
+                     "$lt": (high + timedelta(days=1)).strftime("%Y-%m-%d") + "\uffff"}}
+
+
+def reservation_start(reservation: dict) -> Optional[datetime]:
+    """Rezervasyonun başlangıcı: date alanının günü + start_time alanının saati (UTC)"""
+    reservation_date = _as_utc(reservation.get("date"))
+    start_time = _as_utc(reservation.get("start_time"))
+    if not reservation_date or not start_time:
+        return None
+    return datetime.combine(reservation_date.date(), start_time.time(), tzinfo=timezone.utc)
+
+
+def _start_range_query(field: str, now: datetime) -> dict:
+    """Tüm hatırlatma pencerelerini kapsayan başlangıç aralığı sorgusu"""
+    return datetime_range_query(field, *_window_bounds(now))
+
+
+async def _claim_reminders(db, keys: List[str], now: datetime) -> set:
+    """Hatırlatma anahtarlarını toplu kaydet; yeni eklenenleri (daha önce gönderilmemiş) döndür"""
+    if not keys:
+        return set()
     try:
-        logger.info("🔔 Running reminder check...")
-        now = datetime.now(timezone.utc)
-        
-        # Get all active users
-        users = await db.users.find({}).to_list(length=None)
-        
-        for user in users:
-            user_id = user.get("id")
-            if not user_id:
-                continue
-                
-            await send_user_reminders(db, user_id, now)
-            
-        logger.info("✅ Reminder check completed")
-    except Exception as e:
-        logger.error(f"❌ Error in reminder check: {str(e)}")
+        await db[SENT_REMINDERS].insert_many(
+            [{"_id": key, "created_at": now} for key in keys], ordered=False
+        )
+        return set(keys)
+    except BulkWriteError as e:
+        duplicates = {err["op"]["_id"] for err in e.details.get("writeErrors", []) if err.get("code") == 11000}
+        others = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+        if others:
+            logger.error(f"❌ Reminder claim errors: {others[:3]}")
+            duplicates.update(err["op"]["_id"] for err in others)
+        return set(keys) - duplicates
 
-async def send_user_reminders(db, user_id: str, now: datetime):
-    """Send reminders for a specific user"""
+
+async def _release_reminders(db, keys: List[str]):
+    """Bildirimi yazılamayan hatırlatma anahtarlarını sil; bir sonraki kontrolde tekrar denensin"""
+    if not keys:
+        return
     try:
-        # Get user's event participations
-        participations = await db.participations.find({
-            "user_id": user_id,
-            "status": "approved"
-        }).to_list(1000)
-        
-        for participation in participations:
-            event = await db.events.find_one({"id": participation["event_id"]})
-            if event and event.get("start_date"):
-                await check_event_reminder(db, user_id, event, now)
-        
-        # Get user's reservations
-        reservations = await db.reservations.find({
-            "user_id": user_id,
-            "status": "confirmed"
-        }).to_list(1000)
-        
-        # Get reservations TO user
-        user = await db.users.find_one({"id": user_id})
-        if user:
-            user_type = user.get("user_type")
-            if user_type in ["player", "coach", "referee", "venue_owner"]:
-                reservations_to_me = await db.reservations.find({
-                    "$or": [
-                        {"player_id": user_id},
-                        {"coach_id": user_id},
-                        {"referee_id": user_id},
-                        {"venue_id": user_id}
-                    ],
-                    "status": "confirmed"
-                }).to_list(1000)
-                reservations.extend(reservations_to_me)
-        
-        for reservation in reservations:
-            await check_reservation_reminder(db, user_id, reservation, now)
-            
+        await db[SENT_REMINDERS].delete_many({"_id": {"$in": keys}})
     except Exception as e:
-        logger.error(f"Error sending reminders for user {user_id}: {str(e)}")
+        logger.error(f"❌ Reminder release error: {str(e)}")
+
 
-async def check_event_reminder(db, user_id: str, event: Dict, now: datetime):
-    """Check if event needs reminder and send notification"""
+async def _insert_reminder_notifications(db, claimed: List[Tuple[str, dict]]):
+    """Bildirimleri yaz; yazılamayanların sent_reminders kaydını geri al"""
     try:
-        event_time = datetime.fromisoformat(event["start_date"].replace('Z', '+00:00'))
-        
-        # Skip past events
-        if event_time <= now:
-            return
-        
-        hours_until = (event_time - now).total_seconds() / 3600
-        
-        # Check if we should send reminder
-        reminder_type = None
-        if 23.5 <= hours_until <= 24.5:  # 24 hour window (30 min tolerance)
-            reminder_type = "24h"
-        elif 0.5 <= hours_until <= 1.5:  # 1 hour window (30 min tolerance)
-            reminder_type = "1h"
-        else:
-            return  # Not in reminder window
-        
-        # Check if notification already sent
-        notification_exists = await db.notifications.find_one({
-            "user_id": user_id,
-            "type": f"event_reminder_{reminder_type}",
-            "data.event_id": event["id"]
-        })
-        
-        if notification_exists:
-            return  # Already sent
-        
-        # Create notification
-        notification_id = str(datetime.now().timestamp())
-        
-        title = f"🔔 Etkinlik Hatırlatması"
-        if reminder_type == "24h":
-            message = f"'{event['title']}' etkinliğinin başlamasına 24 saat kaldı!"
-        else:  # 1h
-            message = f"'{event['title']}' etkinliğinin başlamasına 1 saat kaldı! Hazırlıklı olun."
-        
-        notification = {
-            "id": notification_id,
-            "user_id": user_id,
-            "type": f"event_reminder_{reminder_type}",
-            "title": title,
-            "message": message,
-            "read": False,
-            "created_at": now,
-            "data": {
-                "event_id": event["id"],
-                "event_title": event["title"],
-                "start_date": event["start_date"],
-                "hours_until": round(hours_until, 1),
-                "reminder_type": reminder_type
-            }
+        await db.notifications.insert_many([n for _, n in claimed], ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        await _release_reminders(db, [key for i, (key, _) in enumerate(claimed) if i in failed])
+        raise
+    except Exception:
+        # Hangilerinin yazıldığı bilinmiyor: hepsini serbest bırak (kayıp yerine olası tekrar)
+        await _release_reminders(db, [key for key, _ in claimed])
+        raise
+
+
+async def find_event_reminders(db, now: datetime) -> List[dict]:
+    """Penceredeki etkinlikler ve onaylı katılımcıları (tek aggregation)"""
+    events = await db.events.aggregate([
+        {"$match": _start_range_query("start_date", now)},
+        {"$project": {"_id": 0, "id": 1, "title": 1, "start_date": 1}},
+        {"$lookup": {
+            "from": "participations",
+            "let": {"event_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$event_id", "$$event_id"]}, "status": "approved"}},
+                {"$project": {"_id": 0, "user_id": 1}}
+            ],
+            "as": "participants"
+        }},
+        {"$match": {"participants.0": {"$exists": True}}}
+    ]).to_list(None)
+
+    candidates = []
+    for event in events:
+        start = _as_utc(event.get("start_date"))
+        window = _reminder_type(start, now) if start else None
+        if not window:
+            continue
+        reminder_type, hours_until = window
+        user_ids = {p["user_id"] for p in event["participants"] if p.get("user_id")}
+        candidates.extend(
+            {"kind": "event", "ref": event, "user_id": user_id,
+             "reminder_type": reminder_type, "hours_until": hours_until}
+            for user_id in user_ids
+        )
+    return candidates
+
+
+async def find_reservation_reminders(db, now: datetime) -> List[dict]:
+    """Penceredeki onaylı rezervasyonlar ve hatırlatma alacak kullanıcılar"""
+    reservations = await db.reservations.find(
+        {"status": "confirmed", **reservation_day_query(*_window_bounds(now))},
+        {"_id": 0, "id": 1, "date": 1, "start_time": 1, "user_id": 1, "venue_id": 1,
+         "player_id": 1, "coach_id": 1, "referee_id": 1}
+    ).to_list(None)
+
+    in_window = []
+    for reservation in reservations:
+        start = reservation_start(reservation)
+        if not start:
+            continue
+        window = _reminder_type(start, now)
+        if window:
+            in_window.append((reservation, window))
+
+    # Rezervasyonu "alan" taraflar yalnızca ilgili kullanıcı türündeyse bildirim alır
+    role_ids = {
+        reservation.get(field)
+        for reservation, _ in in_window
+        for field in ("player_id", "coach_id", "referee_id", "venue_id")
+        if reservation.get(field)
+    }
+    provider_ids = set()
+    if role_ids:
+        providers = await db.users.find(
+            {"id": {"$in": list(role_ids)}, "user_type": {"$in": ["player", "coach", "referee", "venue_owner"]}},
+            {"_id": 0, "id": 1}
+        ).to_list(None)
+        provider_ids = {u["id"] for u in providers}
+
+    candidates = []
+    for reservation, (reminder_type, hours_until) in in_window:
+        user_ids = {reservation.get("user_id")}
+        user_ids.update(
+            reservation.get(field) for field in ("player_id", "coach_id", "referee_id", "venue_id")
+            if reservation.get(field) in provider_ids
+        )
+        candidates.extend(
+            {"kind": "reservation", "ref": reservation, "user_id": user_id,
+             "reminder_type": reminder_type, "hours_until": hours_until}
+            for user_id in user_ids if user_id
+        )
+    return candidates
+
+
+def _event_notification(candidate: dict, now: datetime) -> dict:
+    event, reminder_type = candidate["ref"], candidate["reminder_type"]
+    if reminder_type == "24h":
+        message = f"'{event['title']}' etkinliğinin başlamasına 24 saat kaldı!"
+    else:  # 1h
+        message = f"'{event['title']}' etkinliğinin başlamasına 1 saat kaldı! Hazırlıklı olun."
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": candidate["user_id"],
+        "type": f"event_reminder_{reminder_type}",
+        "title": "🔔 Etkinlik Hatırlatması",
+        "message": message,
+        "read": False,
+        "created_at": now,
+        "data": {
+            "event_id": event["id"],
+            "event_title": event["title"],
+            "start_date": event["start_date"],
+            "hours_until": round(candidate["hours_until"], 1),
+            "reminder_type": reminder_type
         }
-        
-        await db.notifications.insert_one(notification)
-        logger.info(f"📅 Sent {reminder_type} reminder for event '{event['title']}' to user {user_id[:20]}")
-        
-        # Send push notification
-        if push_service:
-            user = await db.users.find_one({"id": user_id})
-            if user and user.get("push_tokens"):
-                try:
-                    await PushNotificationService.send_push_notification(
-                        push_tokens=user["push_tokens"],
-                        title=title,
-                        body=message,
-                        data={
-                            "type": "event_reminder",
-                            "event_id": event["id"],
-                            "reminder_type": reminder_type
-                        }
-                    )
-                    logger.info(f"📲 Push sent to user {user_id[:20]}")
-                except Exception as push_error:
-                    logger.error(f"Push notification error: {str(push_error)}")
-        
-    except Exception as e:
-        logger.error(f"Error checking event reminder: {str(e)}")
+    }
+
+
+def _reservation_notification(candidate: dict, venue_name: str, now: datetime) -> dict:
+    reservation, reminder_type = candidate["ref"], candidate["reminder_type"]
+    if reminder_type == "24h":
+        message = f"'{venue_name}' rezervasyonunuzun başlamasına 24 saat kaldı!"
+    else:  # 1h
+        message = f"'{venue_name}' rezervasyonunuzun başlamasına 1 saat kaldı! Hazırlıklı olun."
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": candidate["user_id"],
+        "type": f"reservation_reminder_{reminder_type}",
+        "title": "🔔 Rezervasyon Hatırlatması",
+        "message": message,
+        "read": False,
+        "created_at": now,
+        "data": {
+            "reservation_id": reservation["id"],
+            "venue_name": venue_name,
+            "start_date": reservation["date"],
+            "start_time": reservation["start_time"],
+            "hours_until": round(candidate["hours_until"], 1),
+            "reminder_type": reminder_type
+        }
+    }
+
+
+async def _send_event_pushes(db, notifications: List[dict]):
+    """Etkinlik hatırlatmalarını (etkinlik, tip) başına tek push çağrısıyla gönder"""
+    user_ids = list({n["user_id"] for n in notifications})
+    users = await db.users.find(
+        {"id": {"$in": user_ids}, "push_tokens.0": {"$exists": True}},
+        {"_id": 0, "id": 1, "push_tokens": 1}
+    ).to_list(None)
+    tokens_by_user = {u["id"]: u["push_tokens"] for u in users}
 
-async def check_reservation_reminder(db, user_id: str, reservation: Dict, now: datetime):
-    """Check if reservation needs reminder and send notification"""
+    groups: Dict[Tuple[str, str], dict] = {}
+    for notification in notifications:
+        tokens = tokens_by_user.get(notification["user_id"])
+        if not tokens:
+            continue
+        key = (notification["data"]["event_id"], notification["data"]["reminder_type"])
+        group = groups.setdefault(key, {"notification": notification, "tokens": []})
+        group["tokens"].extend(tokens)
+
+    for (event_id, reminder_type), group in groups.items():
+        try:
+            await PushNotificationService.send_push_notification(
+                push_tokens=group["tokens"],
+                title=group["notification"]["title"],
+                body=group["notification"]["message"],
+                data={
+                    "type": "event_reminder",
+                    "event_id": event_id,
+                    "reminder_type": reminder_type
+                }
+            )
+        except Exception as push_error:
+            logger.error(f"Push notification error: {str(push_error)}")
+
+
+async def check_and_send_reminders(db):
+    """
+    Check for upcoming events and reservations and send notifications
+    Runs every 5 minutes
+
+    Kullanıcı bazlı döngü yerine yalnızca 24s/1s penceresine düşen etkinlik ve
+    rezervasyonlar sorgulanır; tekrar gönderim sent_reminders unique _id ile engellenir.
+    Bildirimi yazılamayan anahtarlar geri silinir, bir sonraki kontrolde yeniden denenir.
+    """
     try:
-        if not reservation.get("date") or not reservation.get("start_time"):
-            return
-        
-        # Combine date and start_time
-        reservation_date = datetime.fromisoformat(reservation["date"].replace('Z', '+00:00'))
-        start_time = datetime.fromisoformat(reservation["start_time"].replace('Z', '+00:00'))
-        
-        reservation_datetime = datetime.combine(
-            reservation_date.date(),
-            start_time.time(),
-            tzinfo=timezone.utc
-        )
-        
-        # Skip past reservations
-        if reservation_datetime <= now:
-            return
-        
-        hours_until = (reservation_datetime - now).total_seconds() / 3600
+        logger.info("🔔 Running reminder check...")
+        now = datetime.now(timezone.utc)
         
-        # Check if we should send reminder
-        reminder_type = None
-        if 23.5 <= hours_until <= 24.5:  # 24 hour window
-            reminder_type = "24h"
-        elif 0.5 <= hours_until <= 1.5:  # 1 hour window
-            reminder_type = "1h"
-        else:
+        candidates = await find_event_reminders(db, now)
+        candidates.extend(await find_reservation_reminders(db, now))
+        if not candidates:
+            logger.info("✅ Reminder check completed (no reminders due)")
             return
         
-        # Check if notification already sent
-        notification_exists = await db.notifications.find_one({
-            "user_id": user_id,
-            "type": f"reservation_reminder_{reminder_type}",
-            "data.reservation_id": reservation["id"]
-        })
-        
-        if notification_exists:
+        keys = {
+            f"{c['kind']}:{c['ref']['id']}:{c['user_id']}:{c['reminder_type']}": c
+            for c in candidates
+        }
+        claimed = await _claim_reminders(db, list(keys), now)
+        due = [(key, candidate) for key, candidate in keys.items() if key in claimed]
+        if not due:
+            logger.info("✅ Reminder check completed (all reminders already sent)")
             return
         
-        # Get venue name
-        venue_name = "Yer"
-        if reservation.get("venue_id"):
-            venue = await db.venues.find_one({"id": reservation["venue_id"]})
-            if venue:
-                venue_name = venue.get("name", venue_name)
-        
-        # Create notification
-        notification_id = str(datetime.now().timestamp())
-        
-        title = f"🔔 Rezervasyon Hatırlatması"
-        if reminder_type == "24h":
-            message = f"'{venue_name}' rezervasyonunuzun başlamasına 24 saat kaldı!"
-        else:  # 1h
-            message = f"'{venue_name}' rezervasyonunuzun başlamasına 1 saat kaldı! Hazırlıklı olun."
-        
-        notification = {
-            "id": notification_id,
-            "user_id": user_id,
-            "type": f"reservation_reminder_{reminder_type}",
-            "title": title,
-            "message": message,
-            "read": False,
-            "created_at": now,
-            "data": {
-                "reservation_id": reservation["id"],
-                "venue_name": venue_name,
-                "start_date": reservation["date"],
-                "start_time": reservation["start_time"],
-                "hours_until": round(hours_until, 1),
-                "reminder_type": reminder_type
-            }
-        }
+        venue_ids = list({c["ref"].get("venue_id") for _, c in due if c["kind"] == "reservation" and c["ref"].get("venue_id")})
+        venue_names = {}
+        if venue_ids:
+            venues = await db.venues.find({"id": {"$in": venue_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+            venue_names = {v["id"]: v.get("name", "Yer") for v in venues}
         
-        await db.notifications.insert_one(notification)
-        logger.info(f"📅 Sent {reminder_type} reminder for reservation at '{venue_name}' to user {user_id[:20]}")
+        notifications = [
+            (key, _event_notification(c, now) if c["kind"] == "event"
+             else _reservation_notification(c, venue_names.get(c["ref"].get("venue_id"), "Yer"), now))
+            for key, c in due
+        ]
+        await _insert_reminder_notifications(db, notifications)
+        event_notifications = [n for key, n in notifications if key.startswith("event:")]
+        reservation_notifications = [n for key, n in notifications if key.startswith("reservation:")]
+        logger.info(
+            f"📅 Sent {len(event_notifications)} event and "
+            f"{len(reservation_notifications)} reservation reminders"
+        )
         
+        # Send push notification
+        if push_service and event_notifications:
+            await _send_event_pushes(db, event_notifications)
+            
+        logger.info("✅ Reminder check completed")
     except Exception as e:
-        logger.error(f"Error checking reservation reminder: {str(e)}")
+        logger.error(f"❌ Error in reminder check: {str(e)}")
+
+async def run_reminder_check(db):
+    """Hatırlatma kontrolünü worker'lar arasında tek seferde çalıştır (lease kilidi)"""
+    await run_exclusive(db, "reminder_check", lambda: check_and_send_reminders(db),
+                        ttl=60, min_interval=4 * 60)
 
 def start_reminder_scheduler(db):
     """Start the reminder scheduler"""
@@ -256,7 +370,7 @@ def start_reminder_scheduler(db):
     
     # Run reminder check every 5 minutes
     scheduler.add_job(
-        check_and_send_reminders,
+        run_reminder_check,
         'interval',
         minutes=5,
         args=[db],
@@ -9,6 +9,8 @@ from pydantic import BaseModel
 
 from auth import get_current_user
 from iyzico_service import IyzicoService
+from user_calendar import refresh_user_calendar
+from field_availability import claim_reservation, confirm_reservation_hold, release_reservation
 from workflow_endpoints import trigger_workflow
 
 # Setup
@@ -93,29 +95,7 @@ async def initialize_reservation_payment(
                 logger.error(f"❌ Facility structure: {facility}")
                 raise HTTPException(status_code=404, detail="Saha bulunamadı")
         
-        # 2. Müsaitlik kontrolü (son kez)
-        reservations = await db.reservations.find({
-            "field_id": payment_request.field_id,
-            "date": payment_request.date,
-            "status": {"$in": ["pending", "confirmed"]}
-        }).to_list(100)
-        
-        reserved_hours = set()
-        for reservation in reservations:
-            time_slots = reservation.get("time_slots", [])
-            for slot in time_slots:
-                try:
-                    hour = int(slot.split(":")[0])
-                    reserved_hours.add(hour)
-                except:
-                    continue
-        
-        requested_hours = [int(slot.split(":")[0]) for slot in payment_request.time_slots]
-        if any(hour in reserved_hours for hour in requested_hours):
-            raise HTTPException(
-                status_code=400,
-                detail="Seçtiğiniz saatlerden bazıları artık müsait değil. Lütfen sayfayı yenileyin."
-            )
+        # 2. Müsaitlik: saatler 4. adımda rezervasyon eklenmeden önce atomik olarak ayrılır
         
         # 3. Fiyat hesapla - DİNAMİK FİYATLANDIRMA V2
         from datetime import datetime
@@ -211,7 +191,18 @@ async def initialize_reservation_payment(
             "updated_at": datetime.utcnow()
         }
         
-        await db.reservations.insert_one(reservation)
+        # Saatleri ayır: aynı saate gelen eşzamanlı isteklerden yalnızca biri geçer.
+        # Ödeme tamamlanmazsa tutma PAYMENT_HOLD_MINUTES sonunda scheduler ile bırakılır.
+        if not await claim_reservation(db, reservation):
+            raise HTTPException(
+                status_code=400,
+                detail="Seçtiğiniz saatlerden bazıları artık müsait değil. Lütfen sayfayı yenileyin."
+            )
+        try:
+            await db.reservations.insert_one(reservation)
+        except Exception:
+            await release_reservation(db, reservation)
+            raise
         logger.info(f"✅ Geçici rezervasyon oluşturuldu: {reservation_id}")
         
         # 5. İyzico checkout başlat
@@ -271,6 +262,7 @@ async def initialize_reservation_payment(
         except Exception as e:
             # İyzico hatası, rezervasyonu sil
             await db.reservations.delete_one({"id": reservation_id})
+            await release_reservation(db, reservation)
             logger.error(f"❌ İyzico hatası: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Ödeme başlatılamadı: {str(e)}")
     
@@ -312,23 +304,20 @@ async def payment_callback(request: Request, token: str = None):
             if not reservation_id:
                 raise HTTPException(status_code=400, detail="Rezervasyon ID bulunamadı")
             
-            # Rezervasyonu güncelle
-            reservation = await db.reservations.find_one({"id": reservation_id})
+            # Rezervasyonu güncelle (polling önce onayladıysa saatlere tekrar dokunma)
+            reservation = await mark_reservation_paid(reservation_id, payment_result)
             if not reservation:
-                raise HTTPException(status_code=404, detail="Rezervasyon bulunamadı")
-            
-            await db.reservations.update_one(
-                {"id": reservation_id},
-                {
-                    "$set": {
-                        "status": "confirmed",
-                        "payment_status": "completed",
-                        "payment_id": payment_result.get("paymentId"),
-                        "paid_at": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+                reservation = await db.reservations.find_one({"id": reservation_id})
+                if not reservation:
+                    raise HTTPException(status_code=404, detail="Rezervasyon bulunamadı")
+                if reservation.get("status") != "confirmed":
+                    logger.error(f"⚠️ Ödeme alındı ama rezervasyon {reservation_id} durumu: {reservation.get('status')}")
+                    from fastapi.responses import RedirectResponse
+                    frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
+                    return RedirectResponse(
+                        url=f"{frontend_url}/reservations/payment-error?message=Rezervasyon artık geçerli değil",
+                        status_code=303
+                    )
             
             logger.info(f"✅ Rezervasyon onaylandı: {reservation_id}")
             
@@ -397,6 +386,7 @@ async def payment_callback(request: Request, token: str = None):
                 "created_at": datetime.utcnow()
             }
             await db.calendar_items.insert_one(owner_calendar_item)
+            await refresh_user_calendar(db, reservation_ids=[reservation_id])
             logger.info(f"📅 Tesis sahibi ajandasına eklendi: {facility.get('owner_id') if facility else 'N/A'} (Müşteri: {customer_name})")
             
             # 3. TESİS SAHİBİNE BİLDİRİM GÖNDER (Detaylı)
@@ -554,33 +544,22 @@ async def check_payment_status(
                 
                 if payment_result.get("status") == "success":
                     # Ödeme başarılı, rezervasyonu onayla
-                    await db.reservations.update_one(
-                        {"id": reservation_id},
-                        {
-                            "$set": {
-                                "status": "confirmed",
-                                "payment_status": "completed",
-                                "payment_id": payment_result.get("paymentId"),
-                                "paid_at": datetime.utcnow(),
-                                "updated_at": datetime.utcnow()
-                            }
-                        }
-                    )
-                    
-                    logger.info(f"✅ Rezervasyon onaylandı (polling check): {reservation_id}")
+                    confirmed = await mark_reservation_paid(reservation_id, payment_result)
                     
                     # Güncellenmiş rezervasyonu al
                     reservation = await db.reservations.find_one({"id": reservation_id})
                     
-                    # Bildirimleri gönder
-                    await send_reservation_notifications(reservation)
+                    if confirmed:
+                        logger.info(f"✅ Rezervasyon onaylandı (polling check): {reservation_id}")
+                        # Bildirimleri gönder
+                        await send_reservation_notifications(reservation)
                     
                     return {
-                        "success": True,
-                        "status": "confirmed",
-                        "payment_status": "completed",
+                        "success": reservation["status"] == "confirmed",
+                        "status": reservation["status"],
+                        "payment_status": reservation["payment_status"],
                         "payment_id": payment_result.get("paymentId"),
-                        "message": "Ödeme başarılı, rezervasyon onaylandı"
+                        "message": "Ödeme başarılı, rezervasyon onaylandı" if reservation["status"] == "confirmed" else "Rezervasyon artık geçerli değil"
                     }
                 else:
                     # Ödeme başarısız
@@ -620,6 +599,29 @@ async def check_payment_status(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def mark_reservation_paid(reservation_id: str, payment_result: dict):
+    """
+    Ödemesi alınan rezervasyonu onayla ve saatlerini kesinleştir.
+    Durum koşullu değiştirilir: callback ve polling aynı anda gelse de yalnızca biri
+    onaylar; bu çağrı onayladıysa güncelleme öncesi doküman, değilse None döner.
+    """
+    previous = await db.reservations.find_one_and_update(
+        {"id": reservation_id, "status": {"$in": ["payment_pending", "payment_expired"]}},
+        {
+            "$set": {
+                "status": "confirmed",
+                "payment_status": "completed",
+                "payment_id": payment_result.get("paymentId"),
+                "paid_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            }
+        }
+    )
+    if previous:
+        await confirm_reservation_hold(db, previous)
+    return previous
+
+
 async def send_reservation_notifications(reservation: dict):
     """Rezervasyon bildirimleri gönder (3 taraf: kullanıcı, tesis sahibi, admin)"""
     try:
@@ -16,6 +16,7 @@ from models import (
     NotificationRelatedType
 )
 from auth import get_current_user
+from rating_aggregates import apply_review_rating
 
 logger = logging.getLogger(__name__)
 
@@ -88,6 +89,7 @@ async def create_review(
     }
     
     await db.reviews.insert_one(review)
+    await apply_review_rating(db, review)
     
     # Get reviewer info for notification
     reviewer = await db.users.find_one({"id": current_user_id})
@@ -392,6 +394,7 @@ async def create_participant_review(
     }
     
     await db.reviews.insert_one(review)
+    await apply_review_rating(db, review)
     
     # Send notification
     reviewer = await db.users.find_one({"id": current_user_id})
@@ -422,7 +425,9 @@ async def delete_review(
     if not review:
         raise HTTPException(status_code=404, detail="Yorum bulunamadı veya silme yetkiniz yok")
     
-    await db.reviews.delete_one({"id": review_id})
+    result = await db.reviews.delete_one({"id": review_id})
+    if result.deleted_count:
+        await apply_review_rating(db, review, sign=-1)
     
     return {"message": "Yorum silindi"}
 
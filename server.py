@@ -4,6 +4,7 @@ from pydantic import BaseModel
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import os
 import logging
 from pathlib import Path
@@ -34,12 +35,15 @@ from oauth_models import SessionData, UserSession, PaymentTransaction, StripeChe
 from auth import (
     get_password_hash, verify_password, create_access_token, 
     get_current_user, get_current_user_optional, decode_token,
+    invalidate_principal, get_hash_executor_metrics,
     SECRET_KEY, ALGORITHM
 )
 from payment_service import payment_service
 # Stripe integration - using stripe library directly
 import stripe
-from push_notification_service import PushNotificationService
+from push_notification_service import PushNotificationService, push_dispatcher
+from bulk_broadcast import resume_broadcasts, stop_broadcasts
+from match_reminders import match_reminder_wheel, sync_upcoming_match_reminders
 from background_scheduler import EventReminderScheduler
 from notification_endpoints import notification_router, create_notification_helper
 from support_endpoints import support_router
@@ -70,11 +74,31 @@ from auth_endpoints import router as auth_router, set_database as set_auth_db
 from user_endpoints import router as user_router, set_database as set_user_db
 from report_endpoints import router as report_router, set_database as set_report_db
 from map_endpoints import router as map_router, set_database as set_map_db
-from message_endpoints import router as message_router, set_database as set_message_db
+from message_endpoints import (
+    router as message_router, set_database as set_message_db, load_inbox,
+    conversation_key, conversation_filter, load_message_page, fill_sender_names
+)
 from admin_endpoints import admin_router, set_database as set_admin_db
 from commission_endpoints import router as commission_router, set_db as set_commission_db
-from geliver_endpoints import router as geliver_router, set_db as set_geliver_db
+from geliver_endpoints import router as geliver_router, set_db as set_geliver_db, close_geliver_client
 from legal_endpoints import router as legal_router
+from db_indexes import ensure_indexes
+from access_recorder import event_access_recorder
+from leaderboard import load_leaderboard
+from rating_aggregates import apply_review_rating, attach_rating_fields
+from calendar_reminders import load_upcoming_reminders
+from user_calendar import refresh_user_calendar, list_calendar, count_unread_calendar, set_calendar_read, check_user_calendar
+from field_availability import claim_hours, release_hours, release_reservation, slot_hours
+from pagination import paginate
+from event_serializers import event_list_response, EVENT_SUMMARY_PROJECTION
+from unread_counters import (
+    increment_direct, increment_group, clear_direct, clear_group, read_group, get_unread_counters,
+    discount_deleted_message
+)
+import socketio
+from realtime_gateway import (
+    sio, publish_direct_message, publish_group_message, publish_unread_cleared, publish_notification
+)
 
 
 ROOT_DIR = Path(__file__).parent
@@ -149,9 +173,31 @@ async def lifespan(app: FastAPI):
     
     # Push notification service'e db referansı ver
     push_service.set_db(db)
+    # Expo push kuyruğu (batch gönderim + receipt kontrolü) uygulama loop'unda çalışır
+    push_dispatcher.start(db)
+    # Yarıda kalmış admin toplu bildirimlerini devam ettir
+    await resume_broadcasts(db)
+    # Maç hatırlatmaları: yakın maçların kayıtlarını kur, timer wheel'i başlat
+    try:
+        await sync_upcoming_match_reminders(db)
+    except Exception as e:
+        logger.error(f"❌ Match reminder sync failed: {e}")
+    match_reminder_wheel.start(db)
 
     logger.info("✅ Database references set for all modules")
 
+    # Index registry - INDEX_REGISTRY_MODE: apply (varsayılan) | report | off
+    index_mode = os.environ.get("INDEX_REGISTRY_MODE", "apply").lower()
+    if index_mode != "off":
+        try:
+            index_report = await ensure_indexes(db, dry_run=(index_mode == "report"))
+            app.state.index_report = index_report
+        except Exception as e:
+            logger.error(f"❌ Index registry could not be applied: {e}")
+
+    # Etkinlik son erişim zamanları bellekte biriktirilip toplu yazılır
+    event_access_recorder.start(db)
+
     # Scheduler'ı db hazır olduktan sonra başlat
     # (Eski kod: modül seviyesinde db=None ile oluşturuluyordu → MongoDB fatal write hatası)
     global scheduler
@@ -171,6 +217,11 @@ async def lifespan(app: FastAPI):
     if scheduler:
         scheduler.stop()
         logger.info("✅ Scheduler stopped")
+    await event_access_recorder.stop()
+    await stop_broadcasts()
+    await match_reminder_wheel.stop()
+    await push_dispatcher.stop()
+    await close_geliver_client()
     if client:
         client.close()
         logger.info("✅ MongoDB connection closed")
@@ -184,15 +235,8 @@ async def root_health_check():
     """Health check endpoint for Kubernetes liveness/readiness probes"""
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
-# Socket.IO for real-time messaging - Will be integrated later
-# Placeholder for now
-# sio = socketio.AsyncServer(
-#     async_mode='asgi',
-#     cors_allowed_origins='*',
-#     logger=True,
-#     engineio_logger=True
-# )
-# socket_app = socketio.ASGIApp(sio, app)
+# Socket.IO for real-time messaging: realtime_gateway.py
+# sio, dosya sonunda socket_app = socketio.ASGIApp(sio, app) ile FastAPI'nin yanına mount edilir
 
 # Create API router
 api_router = APIRouter()
@@ -222,6 +266,7 @@ async def create_notification(
         
         # Save to database
         await db.notifications.insert_one(notification_data)
+        await publish_notification(notification_data)
         
         # Send push notification
         try:
@@ -361,23 +406,16 @@ async def update_profile(
     else:
         user_id = current_user_id
     
-    # Check if user exists first
-    existing_user = await db.users.find_one({"id": user_id})
-    print(f"🔧 User found: {existing_user is not None}")
-    if not existing_user:
-        raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
-    
-    result = await db.users.update_one(
+    # Update and get the updated user in one query
+    user = await db.users.find_one_and_update(
         {"id": user_id},
-        {"$set": update_dict}
+        {"$set": update_dict},
+        return_document=ReturnDocument.AFTER
     )
-    
-    print(f"🔧 Update result - matched: {result.matched_count}, modified: {result.modified_count}")
-    
-    # Get updated user
-    user = await db.users.find_one({"id": user_id})
+    print(f"🔧 User found: {user is not None}")
     if not user:
-        raise HTTPException(status_code=404, detail="User not found after update")
+        raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
+    invalidate_principal(user_id)
     
     # MongoDB'den _id'yi çıkar ve password alanlarını temizle
     user_data = {k: v for k, v in user.items() if k not in ["_id", "password_hash", "hashed_password"]}
@@ -524,10 +562,17 @@ async def get_events(
     organizer: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
     include_past: bool = True,  # Geçmiş etkinlikleri dahil et (varsayılan: evet)
+    view: str = "full",  # full | summary (liste ekranı için hafif özet)
     current_user_id: Optional[str] = Depends(get_current_user_optional)
 ):
-    """Get all events with optional filters"""
+    """Get all events with optional filters
+
+    Sayfalama: cursor verilirse keyset sayfalama yapılır (skip yok sayılır).
+    Sonraki sayfanın cursor'ı X-Next-Cursor header'ında döner.
+    view=summary ise sadece liste alanları (EventSummary) projection ile okunur.
+    """
     print(f"🔍 GET /events called - current_user_id: {current_user_id}")
     query = {}
     
@@ -580,33 +625,25 @@ async def get_events(
     
     # Sıralama: organizer=me ise last_accessed'e göre (en son erişilen en üstte), değilse start_date'e göre
     if organizer == "me":
+        # Biriken son erişim zamanlarını yaz ki sıralama güncel olsun
+        await event_access_recorder.flush()
         # last_accessed yoksa created_at'e göre sırala
-        events = await db.events.find(query).sort([("last_accessed", -1), ("created_at", -1)]).skip(skip).limit(limit).to_list(limit)
+        sort_keys = [("last_accessed", -1), ("created_at", -1), ("id", -1)]
     else:
-        events = await db.events.find(query).sort("start_date", 1).skip(skip).limit(limit).to_list(limit)
+        sort_keys = [("start_date", 1), ("id", 1)]
+    summary = view == "summary"
+    events, next_cursor = await paginate(
+        db.events, query, sort_keys, limit, cursor=cursor, skip=skip,
+        projection=EVENT_SUMMARY_PROJECTION if summary else None
+    )
     
     print(f"🔍 Found {len(events)} events")
     
-    if events:
-        print(f"🔍 First event participants: {events[0].get('participants', [])}")
-    
-    # Remove MongoDB _id field before validation
-    # Also fix participants field - ensure it's a list of strings, not dicts
-    for event in events:
-        event.pop('_id', None)
-        
-        # Fix participants field if it contains dicts instead of strings
-        participants = event.get('participants', [])
-        if participants:
-            # Check if ANY participant is a dict (not just the first one)
-            has_dict = any(isinstance(p, dict) for p in participants)
-            if has_dict:
-                # Extract just the IDs from the dict format
-                event['participants'] = [p.get('id') if isinstance(p, dict) else p for p in participants]
-                print(f"🔧 Fixed participants for event {event.get('title')}: {event['participants']}")
-    
-    print(f"🔍 Returning {len(events)} events")
-    return [Event(**event) for event in events]
+    # Doğrulama + JSON tek geçişte (participants dict düzeltmesi dahil)
+    response = event_list_response(events, summary=summary)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
 
 @api_router.get("/events/{event_id}", response_model=Event)
 async def get_event(event_id: str):
@@ -632,12 +669,8 @@ async def get_event(event_id: str):
             logging.info(f"🔍 Sample event ID: '{sample.get('id')}' (len: {len(sample.get('id', ''))})")
         raise HTTPException(status_code=404, detail="Event not found")
     
-    # Son erişim zamanını güncelle (etkinlik yönetimi sıralaması için)
-    from datetime import datetime
-    await db.events.update_one(
-        {"id": event_id},
-        {"$set": {"last_accessed": datetime.utcnow()}}
-    )
+    # Son erişim zamanını kaydet (etkinlik yönetimi sıralaması için) - toplu flush edilir
+    event_access_recorder.touch(event.get("id", event_id))
     
     # Remove MongoDB _id field
     event.pop('_id', None)
@@ -1400,7 +1433,7 @@ async def get_sports_with_counts():
 
 
 @api_router.post("/events/search", response_model=List[Event])
-async def search_events(search: SearchRequest):
+async def search_events(search: SearchRequest, view: str = "full"):
     """Advanced event search"""
     query = {"is_active": True}
     
@@ -1417,8 +1450,9 @@ async def search_events(search: SearchRequest):
     if search.date_to:
         query["end_date"] = {"$lte": search.date_to}
     
-    events = await db.events.find(query).limit(50).to_list(50)
-    return [Event(**event) for event in events]
+    projection = EVENT_SUMMARY_PROJECTION if view == "summary" else None
+    events = await db.events.find(query, projection).limit(50).to_list(50)
+    return event_list_response(events, summary=view == "summary")
 
 # ==================== VENUE ROUTES ====================
 
@@ -1477,16 +1511,27 @@ async def get_venue(venue_id: str):
 
 # ==================== USER ROUTES ====================
 
+# Liste endpoint'lerinde dönmeyecek hassas alanlar
+PUBLIC_USER_PROJECTION = {"_id": 0, "hashed_password": 0, "password_hash": 0}
+
 @api_router.get("/users")
 async def get_users(
+    response: Response,
     user_type: Optional[str] = None,
     city: Optional[str] = None,
     sport: Optional[str] = None,
     wants_to_earn: Optional[bool] = None,
     search: Optional[str] = None,
-    include_all: Optional[bool] = None
+    include_all: Optional[bool] = None,
+    skip: int = 0,
+    limit: int = 1000,
+    cursor: Optional[str] = None
 ):
-    """Get users with optional filters (for coach/referee/player listing)"""
+    """Get users with optional filters (for coach/referee/player listing)
+
+    Puan ortalaması kullanıcı dokümanındaki toplamlardan okunur (reviews taranmaz).
+    Sonraki sayfanın cursor'ı X-Next-Cursor header'ında döner.
+    """
     try:
         # is_verified kontrolü kaldırıldı - tüm kullanıcılar listelenebilir
         query = {}
@@ -1519,49 +1564,17 @@ async def get_users(
         if "user_type" not in query and not include_all and wants_to_earn is None:
             query["user_type"] = {"$in": ["coach", "referee", "player"]}
         
-        users = await db.users.find(query).to_list(1000)
-        
-        # Get user IDs for batch review lookup
-        user_ids = [u.get("id") for u in users if u.get("id")]
-        
-        # Batch get all reviews for these users (limited to prevent memory issues)
-        all_reviews = await db.reviews.find({
-            "$or": [
-                {"target_user_id": {"$in": user_ids}},
-                {"reviewed_user_id": {"$in": user_ids}}
-            ]
-        }).to_list(10000)
-        
-        # Group reviews by user
-        reviews_by_user = {}
-        for review in all_reviews:
-            user_id = review.get("target_user_id") or review.get("reviewed_user_id")
-            if user_id:
-                if user_id not in reviews_by_user:
-                    reviews_by_user[user_id] = []
-                reviews_by_user[user_id].append(review)
-        
-        # Remove sensitive data and add ratings
-        result = []
-        for user in users:
-            user.pop("hashed_password", None)
-            user.pop("password_hash", None)
-            user.pop("_id", None)
-            
-            # Add average rating
-            user_id = user.get("id")
-            user_reviews = reviews_by_user.get(user_id, [])
-            if user_reviews:
-                total_rating = sum(r.get("rating", 0) for r in user_reviews)
-                user["average_rating"] = round(total_rating / len(user_reviews), 1)
-                user["review_count"] = len(user_reviews)
-            else:
-                user["average_rating"] = 0
-                user["review_count"] = 0
-            
-            result.append(user)
+        # Remove sensitive data (projection) and add ratings
+        users, next_cursor = await paginate(
+            db.users, query, [("id", 1)], min(max(limit, 1), 1000), cursor=cursor, skip=skip,
+            projection=PUBLIC_USER_PROJECTION
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
-        return result
+        return [attach_rating_fields(user) for user in users]
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Get users error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1580,23 +1593,8 @@ async def get_user_public(user_id: str):
         user.pop("password_hash", None)
         user.pop("_id", None)
         
-        # Add average rating from reviews
-        reviews = await db.reviews.find({
-            "$or": [
-                {"target_user_id": user_id},
-                {"reviewed_user_id": user_id}
-            ]
-        }).to_list(None)
-        
-        if reviews:
-            total_rating = sum(r.get("rating", 0) for r in reviews)
-            user["average_rating"] = round(total_rating / len(reviews), 1)
-            user["review_count"] = len(reviews)
-        else:
-            user["average_rating"] = 0
-            user["review_count"] = 0
-        
-        return user
+        # Add average rating from denormalized aggregates
+        return attach_rating_fields(user)
     except HTTPException:
         raise
     except Exception as e:
@@ -1660,11 +1658,6 @@ async def update_user_profile(
             print(f"❌ User ID mismatch! URL: '{user_id}' vs Token: '{current_user_id}'")
             raise HTTPException(status_code=403, detail=f"Can only update own profile")
         
-        # Get existing user
-        existing_user = await db.users.find_one({"id": user_id})
-        if not existing_user:
-            raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
-        
         # Remove fields that shouldn't be updated via this endpoint
         protected_fields = ["id", "email", "phone", "hashed_password", "password_hash", "_id", "created_at"]
         for field in protected_fields:
@@ -1673,21 +1666,19 @@ async def update_user_profile(
         # Add updated timestamp
         profile_data["updated_at"] = datetime.now(timezone.utc).isoformat()
         
-        # Update user
-        result = await db.users.update_one(
+        # Update user and get the updated document in one query
+        updated_user = await db.users.find_one_and_update(
             {"id": user_id},
-            {"$set": profile_data}
+            {"$set": profile_data},
+            return_document=ReturnDocument.AFTER
         )
+        if not updated_user:
+            raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
+        invalidate_principal(user_id)
         
-        if result.modified_count == 0:
-            logging.warning(f"No changes made to user {user_id}")
-        
-        # Get updated user
-        updated_user = await db.users.find_one({"id": user_id})
-        if updated_user:
-            updated_user.pop("hashed_password", None)
-            updated_user.pop("password_hash", None)
-            updated_user.pop("_id", None)
+        updated_user.pop("hashed_password", None)
+        updated_user.pop("password_hash", None)
+        updated_user.pop("_id", None)
         
         logging.info(f"✅ User profile updated: {user_id}")
         return updated_user
@@ -1703,10 +1694,12 @@ async def update_user_profile(
 
 @api_router.get("/coaches")
 async def get_coaches(
+    response: Response,
     sport: Optional[str] = None,
     city: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
     """Get all coaches with optional filters and average ratings"""
     query = {"user_type": "coach", "is_active": True}
@@ -1715,32 +1708,15 @@ async def get_coaches(
     if city:
         query["coach_profile.cities"] = city
     
-    coaches = await db.users.find(query).skip(skip).limit(limit).to_list(limit)
-    
-    # Add average rating for each coach
-    result = []
-    for coach in coaches:
-        coach_data = {k: v for k, v in coach.items() if k != "hashed_password"}
-        
-        # Get reviews for this coach
-        reviews = await db.reviews.find({
-            "$or": [
-                {"target_user_id": coach.get("id")},
-                {"reviewed_user_id": coach.get("id")}
-            ]
-        }).to_list(None)
-        
-        if reviews:
-            total_rating = sum(r.get("rating", 0) for r in reviews)
-            coach_data["average_rating"] = round(total_rating / len(reviews), 1)
-            coach_data["review_count"] = len(reviews)
-        else:
-            coach_data["average_rating"] = 0
-            coach_data["review_count"] = 0
-        
-        result.append(coach_data)
+    coaches, next_cursor = await paginate(
+        db.users, query, [("id", 1)], min(max(limit, 1), 1000), cursor=cursor, skip=skip,
+        projection=PUBLIC_USER_PROJECTION
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    return result
+    # Add average rating for each coach (denormalized aggregates)
+    return [attach_rating_fields(coach) for coach in coaches]
 
 # ==================== PARTICIPATION ROUTES ====================
 
@@ -2021,6 +1997,7 @@ async def join_event(
                 logging.info(f"✅ Calendar item created for organizer: {organizer_id}")
     except Exception as e:
         logging.error(f"Error creating participant notification/calendar: {str(e)}")
+    await refresh_user_calendar(db, event_ids=[event_id], user_ids=[actual_user_id, event.get("organizer_id")])
     
     # ✅ CRITICAL: Add user to group chat
     try:
@@ -2583,10 +2560,10 @@ async def get_event_participants(event_id: str, current_user_id: str = Depends(g
     }
 
 @api_router.get("/my-events", response_model=List[Event])
-async def get_my_events(current_user_id: str = Depends(get_current_user)):
+async def get_my_events(view: str = "full", current_user_id: str = Depends(get_current_user)):
     """Get events user has joined or is organizer of"""
     # Katılımcı olduğu etkinlikler
-    participations = await db.participations.find({"user_id": current_user_id}).to_list(1000)
+    participations = await db.participations.find({"user_id": current_user_id}, {"event_id": 1}).to_list(1000)
     event_ids = [p["event_id"] for p in participations]
     
     # Organizatör, yönetici veya asistan olduğu etkinlikler
@@ -2598,15 +2575,16 @@ async def get_my_events(current_user_id: str = Depends(get_current_user)):
             {"managers": current_user_id},
             {"assistants": current_user_id}
         ]
-    }).to_list(1000)
+    }, {"id": 1}).to_list(1000)
     
     organizer_event_ids = [e["id"] for e in organizer_events]
     
     # Tüm event ID'lerini birleştir (unique)
     all_event_ids = list(set(event_ids + organizer_event_ids))
     
-    events = await db.events.find({"id": {"$in": all_event_ids}}).to_list(1000)
-    return [Event(**event) for event in events]
+    projection = EVENT_SUMMARY_PROJECTION if view == "summary" else None
+    events = await db.events.find({"id": {"$in": all_event_ids}}, projection).to_list(1000)
+    return event_list_response(events, summary=view == "summary")
 
 @api_router.get("/my-tickets")
 async def get_my_tickets(current_user_id: str = Depends(get_current_user)):
@@ -2840,23 +2818,27 @@ async def create_review(review: ReviewBase, current_user_id: str = Depends(get_c
     target_type = review.target_type
     target_id = review.target_id
     
-    reviews = await db.reviews.find({
-        "target_id": target_id,
-        "target_type": target_type
-    }).to_list(1000)
-    
-    avg_rating = sum(r["rating"] for r in reviews) / len(reviews)
-    
     if target_type == "venue":
+        reviews = await db.reviews.find({
+            "target_id": target_id,
+            "target_type": target_type
+        }, {"_id": 0, "rating": 1}).to_list(1000)
+        avg_rating = sum(r["rating"] for r in reviews) / len(reviews)
         await db.venues.update_one(
             {"id": target_id},
             {"$set": {"rating": avg_rating, "review_count": len(reviews)}}
         )
     elif target_type == "user":
-        await db.users.update_one(
-            {"id": target_id},
-            {"$set": {"coach_profile.rating": avg_rating, "coach_profile.review_count": len(reviews)}}
-        )
+        # Kullanıcı toplamları $inc ile güncellenir, reviews taranmaz
+        summary = await apply_review_rating(db, review_dict)
+        if summary:
+            await db.users.update_one(
+                {"id": target_id},
+                {"$set": {
+                    "coach_profile.rating": summary["average_rating"],
+                    "coach_profile.review_count": summary["review_count"]
+                }}
+            )
     
     return Review(**review_dict)
 
@@ -2910,160 +2892,62 @@ async def get_messages(current_user: dict = Depends(get_current_user)):
 async def get_unread_message_counts(current_user: dict = Depends(get_current_user)):
     """Get unread message counts for individual and group chats"""
     current_user_id = current_user.get("id")
-    logging.info(f"🔵 Getting unread counts for user: {current_user_id}")
-    
-    # Individual messages - count unread messages from each sender
-    pipeline = [
-        {
-            "$match": {
-                "receiver_id": current_user_id,
-                "is_read": False
-            }
-        },
-        {
-            "$group": {
-                "_id": "$sender_id",
-                "count": {"$sum": 1}
-            }
-        }
-    ]
-    
-    individual_unread = await db.messages.aggregate(pipeline).to_list(None)
-    total_individual = sum(item["count"] for item in individual_unread)
-    
-    logging.info(f"🔵 Individual unread messages: {total_individual}")
-    logging.info(f"🔵 Individual unread breakdown: {individual_unread}")
-    
-    # Group messages - count unread messages in all groups user is member of
-    user_groups = await db.group_chats.find({
-        "member_ids": current_user_id  # Changed from members array with user_id
-    }).to_list(None)
-    
-    logging.info(f"🔵 User is member of {len(user_groups)} groups")
-    
-    group_ids = [group["id"] for group in user_groups]
     
-    # Count unread group messages
-    group_unread_count = await db.group_messages.count_documents({
-        "group_id": {"$in": group_ids},
-        "sender_id": {"$ne": current_user_id},  # Not sent by me
-        "read_by": {"$ne": current_user_id}  # Not read by me
-    })
-    
-    logging.info(f"🔵 Group unread messages: {group_unread_count}")
+    # Materialize sayaçlar: tek primary-key okuması (bkz. unread_counters.py)
+    counters = await get_unread_counters(db, current_user_id)
     
-    result = {
-        "individual_unread": total_individual,
-        "group_unread": group_unread_count,
-        "total_unread": total_individual + group_unread_count
+    return {
+        "individual_unread": counters["individual_unread"],
+        "group_unread": counters["group_unread"],
+        "total_unread": counters["individual_unread"] + counters["group_unread"]
     }
-    
-    logging.info(f"🟢 Returning unread counts: {result}")
-    
-    return result
 
 @api_router.get("/messages/conversations-with-unread")
 async def get_conversations_with_unread(current_user: dict = Depends(get_current_user)):
     """Get list of conversations with unread message counts per conversation"""
     current_user_id = current_user.get("id")
-    print(f"🔍 DEBUG: conversations-with-unread endpoint called for user: {current_user_id}")
     
     try:
-        # Simple test first
-        print(f"🔍 DEBUG: Starting conversations-with-unread processing")
-        
-        # Get user info for debugging
-        user_info = await db.users.find_one({"id": current_user_id})
-        if user_info:
-            print(f"👤 DEBUG: Current user: {user_info.get('full_name', 'Unknown')} ({user_info.get('email', 'Unknown')})")
-        
-        # First check total messages in database
-        total_messages = await db.messages.count_documents({})
-        print(f"📊 DEBUG: Total messages in database: {total_messages}")
-        
-        # Check messages for this user
-        user_messages = await db.messages.count_documents({
-            "$or": [
-                {"sender_id": current_user_id},
-                {"receiver_id": current_user_id}
-            ]
-        })
-        print(f"📬 DEBUG: Messages involving user {current_user_id}: {user_messages}")
-        
-        # Check unread messages for this user
-        unread_count = await db.messages.count_documents({
-            "receiver_id": current_user_id,
-            "is_read": False
-        })
-        print(f"📨 DEBUG: Unread messages for this user: {unread_count}")
-        
-        # Pipeline to get unread counts per sender
-        pipeline = [
-            {
-                "$match": {
-                    "receiver_id": current_user_id,
-                    "is_read": False
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$sender_id",
-                    "unread_count": {"$sum": 1}
-                }
-            }
-        ]
-        
-        print(f"🔍 DEBUG: Running aggregation pipeline")
-        unread_by_sender = await db.messages.aggregate(pipeline).to_list(None)
-        print(f"🔍 DEBUG: Aggregation result: {unread_by_sender}")
-        
-        # Convert to dictionary for easy lookup and get sender names
-        unread_dict = {}
-        for item in unread_by_sender:
-            sender_id = item["_id"]
-            count = item["unread_count"]
-            unread_dict[sender_id] = count
-            
-            # Get sender name for debugging
-            sender_info = await db.users.find_one({"id": sender_id})
-            if sender_info:
-                print(f"  └─ DEBUG: {count} okunmamış mesaj: {sender_info.get('full_name', 'Unknown')} ({sender_id})")
-        
-        print(f"✅ DEBUG: Final unread counts by sender for {current_user_id}: {unread_dict}")
-        result = {"unread_by_user": unread_dict}
-        print(f"✅ DEBUG: Returning result: {result}")
-        
-        return result
+        counters = await get_unread_counters(db, current_user_id)
+        return {"unread_by_user": counters["direct"]}
     except Exception as e:
-        print(f"❌ DEBUG ERROR in conversations-with-unread: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        error_result = {"unread_by_user": {}}
-        print(f"❌ DEBUG: Returning error result: {error_result}")
-        return error_result
+        logging.error(f"Error in conversations-with-unread: {str(e)}")
+        return {"unread_by_user": {}}
+
+@api_router.get("/messages/inbox")
+async def get_message_inbox(
+    skip: int = 0,
+    limit: int = 50,
+    current_user: dict = Depends(get_current_user)
+):
+    """Konuşma listesi: her konuşmanın son mesajı, okunmamış sayısı ve karşı taraf profili"""
+    current_user_id = current_user.get("id")
+    return await load_inbox(db, current_user_id, skip=skip, limit=limit)
 
 @api_router.get("/messages/{other_user_id}", response_model=List[Message])
-async def get_conversation(other_user_id: str, current_user: dict = Depends(get_current_user)):
-    """Get conversation between two users (excluding messages deleted by current user)"""
+async def get_conversation(
+    other_user_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 1000,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get conversation between two users (excluding messages deleted by current user)
+
+    Sayfalama: before=<mesaj id> daha eski, after=<mesaj id> daha yeni mesajları getirir.
+    Varsayılan olarak en yeni `limit` mesaj eskiden yeniye sıralı döner.
+    """
     current_user_id = current_user.get("id")
     
-    # Silinen mesajları hariç tut
-    messages = await db.messages.find({
-        "$and": [
-            {
-                "$or": [
-                    {"sender_id": current_user_id, "receiver_id": other_user_id},
-                    {"sender_id": other_user_id, "receiver_id": current_user_id}
-                ]
-            },
-            {
-                "$or": [
-                    {"deleted_for": {"$exists": False}},
-                    {"deleted_for": {"$nin": [current_user_id]}}
-                ]
-            }
-        ]
-    }).sort("sent_at", 1).to_list(1000)
+    # Silinen mesajları hariç tut - conversation_key tek eşitlik sorgusu
+    messages = await load_message_page(
+        db.messages,
+        {
+            **await conversation_filter(db, current_user_id, other_user_id),
+            "deleted_for": {"$ne": current_user_id}
+        },
+        limit, before=before, after=after
+    )
     
     # Fix sender_id and receiver_id if they are dicts
     for msg in messages:
@@ -3088,6 +2972,8 @@ async def mark_messages_as_read(other_user_id: str, current_user: dict = Depends
             "$set": {"is_read": True}
         }
     )
+    await clear_direct(db, current_user_id, other_user_id, result.modified_count)
+    await publish_unread_cleared(current_user_id, peer_id=other_user_id)
     logging.info(f"✅ Marked {result.modified_count} messages as read from {other_user_id} to {current_user_id}")
     return {"success": True, "marked_count": result.modified_count}
 
@@ -3100,12 +2986,7 @@ async def hide_conversation(other_user_id: str, current_user: dict = Depends(get
     
     # Add current user to deleted_for array for all messages in this conversation
     result = await db.messages.update_many(
-        {
-            "$or": [
-                {"sender_id": current_user_id, "receiver_id": other_user_id},
-                {"sender_id": other_user_id, "receiver_id": current_user_id}
-            ]
-        },
+        await conversation_filter(db, current_user_id, other_user_id),
         {
             "$addToSet": {"deleted_for": current_user_id}
         }
@@ -3184,26 +3065,8 @@ async def get_unread_counts_per_group(current_user: dict = Depends(get_current_u
     """Get unread message counts for each group the user is a member of"""
     current_user_id = current_user.get("id")
     
-    # Get all groups user is member of
-    user_groups = await db.group_chats.find({
-        "member_ids": current_user_id
-    }).to_list(None)
-    
-    group_ids = [group["id"] for group in user_groups]
-    
-    # Count unread messages per group
-    unread_by_group = {}
-    for group_id in group_ids:
-        count = await db.group_messages.count_documents({
-            "group_id": group_id,
-            "sender_id": {"$ne": current_user_id},
-            "read_by": {"$ne": current_user_id}
-        })
-        if count > 0:
-            unread_by_group[group_id] = count
-    
-    logging.info(f"🔵 Unread counts by group for user {current_user_id}: {unread_by_group}")
-    return {"unread_by_group": unread_by_group}
+    counters = await get_unread_counters(db, current_user_id)
+    return {"unread_by_group": counters["groups"]}
 
 @api_router.get("/group-chats/{group_id}", response_model=GroupChat)
 async def get_group_chat(
@@ -3343,6 +3206,8 @@ async def send_group_message(
     }
     
     await db.group_messages.insert_one(message)
+    await increment_group(db, group, current_user_id)
+    await publish_group_message(message, group)
     
     # NOTE: Group message notifications disabled - users check unread count badge instead
     # # Send notifications to all group members except sender
@@ -3366,9 +3231,12 @@ async def send_group_message(
 @api_router.get("/group-chats/{group_id}/messages", response_model=List[GroupMessage])
 async def get_group_messages(
     group_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 1000,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all messages in a group"""
+    """Get messages in a group (before/after mesaj id ile sayfalama)"""
     current_user_id = current_user.get("id")
     
     # Check if user is member
@@ -3379,23 +3247,12 @@ async def get_group_messages(
     if current_user_id not in group.get("member_ids", []):
         raise HTTPException(status_code=403, detail="Bu gruba erişim yetkiniz yok")
     
-    messages = await db.group_messages.find({
-        "group_id": group_id
-    }).sort("sent_at", 1).to_list(1000)
+    messages = await load_message_page(
+        db.group_messages, {"group_id": group_id}, limit, before=before, after=after
+    )
     
-    # Populate sender names
-    print(f"🔵 Populating sender names for {len(messages)} messages")
-    for msg in messages:
-        sender_id = msg.get("sender_id")
-        current_name = msg.get("sender_name")
-        print(f"🔵 Message sender_id: {sender_id}, current_name: {current_name}")
-        
-        if sender_id and not current_name:
-            user = await db.users.find_one({"id": sender_id})
-            print(f"🔵 Found user: {user.get('full_name') if user else 'None'}")
-            if user:
-                msg["sender_name"] = user.get("full_name", "Bilinmeyen")
-                print(f"🔵 Set sender_name to: {msg['sender_name']}")
+    # Eksik gönderen adlarını tek sorguda doldur
+    await fill_sender_names(messages)
     
     print(f"🔵 Returning {len(messages)} messages")
     return [GroupMessage(**msg) for msg in messages]
@@ -3428,6 +3285,8 @@ async def mark_group_messages_as_read(
         }
     )
     
+    await read_group(db, current_user_id, group_id, result.modified_count)
+    await publish_unread_cleared(current_user_id, group_id=group_id)
     logging.info(f"✅ Marked {result.modified_count} group messages as read in group {group_id} for user {current_user_id}")
     return {"success": True, "marked_count": result.modified_count}
 
@@ -3539,6 +3398,7 @@ async def remove_group_member(
             }
         }
     )
+    await clear_group(db, [user_id], group_id)
     
     # Send notification to removed user
     removed_user = await db.users.find_one({"id": user_id})
@@ -3610,6 +3470,7 @@ async def remove_group_member(
             }
         }
     )
+    await clear_group(db, [member_id], group_id)
     
     return {"message": "Üye gruptan çıkarıldı"}
 
@@ -3732,6 +3593,8 @@ async def send_bulk_message_to_members(
     }
     
     await db.group_messages.insert_one(message)
+    await increment_group(db, group_chat, current_user_id)
+    await publish_group_message(message, group_chat)
     
     # Badge zaten mesajlar sekmesinde görünüyor, ayrıca bildirim oluşturmaya gerek yok
     
@@ -4433,13 +4296,19 @@ async def get_user_payments(
 
 @api_router.get("/rankings", response_model=List[Ranking])
 async def get_rankings(
+    response: Response,
     sport: Optional[str] = None,
     city: Optional[str] = None,
     gender: Optional[Gender] = None,
     age_group: Optional[str] = None,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
-    """Get rankings/leaderboard"""
+    """Get rankings/leaderboard
+
+    Puanlar tek aggregation ile hesaplanır; eşit puanlılar aynı sırayı alır.
+    Sonraki sayfanın cursor'ı X-Next-Cursor header'ında döner.
+    """
     query = {}
     if sport:
         query["sport"] = sport
@@ -4450,51 +4319,26 @@ async def get_rankings(
     if age_group:
         query["age_group"] = age_group
     
-    # Get users with their stats
-    users = await db.users.find(query).limit(limit).to_list(limit)
+    rows, next_cursor = await load_leaderboard(db, query, min(max(limit, 1), 200), cursor=cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    rankings = []
-    for user in users:
-        # Calculate user stats
-        events_organized = await db.events.count_documents({"organizer_id": user["id"]})
-        participations = await db.participations.count_documents({"user_id": user["id"]})
-        
-        # Calculate points from matches
-        matches = await db.matches.find({
-            "$or": [
-                {"participant1_id": user["id"]},
-                {"participant2_id": user["id"]}
-            ],
-            "status": "completed"
-        }).to_list(1000)
-        
-        total_points = 0
-        wins = 0
-        for match in matches:
-            if match.get("winner_id") == user["id"]:
-                total_points += 3
-                wins += 1
-        
-        ranking = Ranking(
+    now = datetime.utcnow()
+    return [
+        Ranking(
             id=str(uuid.uuid4()),
-            user_id=user["id"],
-            sport=user.get("sport", sport or ""),
-            city=user.get("city", ""),
-            points=total_points,
-            wins=wins,
-            matches_played=len(matches),
-            rank=0  # Will be set after sorting
+            user_id=row["user_id"],
+            sport=row.get("sport") or sport or "",
+            city=row.get("city") or "",
+            points=row["points"],
+            wins=row["wins"],
+            losses=row["losses"],
+            matches_played=row["matches_played"],
+            rank=row["rank"],
+            updated_at=now
         )
-        rankings.append(ranking)
-    
-    # Sort by points (descending)
-    rankings.sort(key=lambda x: x.points, reverse=True)
-    
-    # Set ranks
-    for i, ranking in enumerate(rankings, 1):
-        ranking.rank = i
-    
-    return rankings
+        for row in rows
+    ]
 
 # ==================== SOCKET.IO EVENTS ====================
 # Socket.IO will be integrated when real-time messaging is implemented
@@ -4548,9 +4392,13 @@ async def send_message_rest(message: MessageBase, current_user: dict = Depends(g
     message_dict = message.dict()
     message_dict["id"] = str(uuid.uuid4())
     message_dict["sender_id"] = current_user_id
+    message_dict["conversation_key"] = conversation_key(current_user_id, message.receiver_id)
     message_dict["sent_at"] = datetime.utcnow()
     
     await db.messages.insert_one(message_dict)
+    if not message_dict.get("is_read"):
+        await increment_direct(db, message.receiver_id, current_user_id)
+    await publish_direct_message(message_dict)
     
     # NOTE: Message notifications disabled - users check unread count badge instead
     # # Create notification for receiver
@@ -4906,6 +4754,17 @@ async def stripe_webhook(request: Request):
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
+@api_router.get("/health/metrics")
+async def runtime_metrics():
+    """Worker-level runtime metrics (executor queues, background jobs)"""
+    return {
+        "password_hashing": get_hash_executor_metrics(),
+        "push_dispatcher": push_dispatcher.metrics(),
+        "scheduler_jobs": scheduler.job_metrics() if scheduler else {},
+        "match_reminder_wheel": match_reminder_wheel.metrics(),
+        "timestamp": datetime.utcnow()
+    }
+
 # ==================== VERIFICATION ROUTES ====================
 # NOTE: Verification endpoint'leri auth_endpoints.py modülüne taşındı
 # /auth/send-verification -> auth_endpoints.py
@@ -4970,6 +4829,7 @@ async def update_user_admin(
         {"id": user_id},
         {"$set": update_fields}
     )
+    invalidate_principal(user_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail="No changes made")
@@ -5120,6 +4980,7 @@ async def delete_event_admin(
     # Also delete related data
     await db.participations.delete_many({"event_id": event_id})
     await db.tickets.delete_many({"event_id": event_id})
+    await refresh_user_calendar(db, event_ids=[event_id])
     
     return {"message": "Event deleted successfully"}
 
@@ -5323,6 +5184,7 @@ async def update_user_role(
         {"id": user_id},
         {"$set": {"user_type": new_user_type}}
     )
+    invalidate_principal(user_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
@@ -5351,6 +5213,7 @@ async def delete_user(
     
     # Delete user
     result = await db.users.delete_one({"id": user_id})
+    invalidate_principal(user_id)
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
@@ -5397,6 +5260,7 @@ async def update_user_permissions(
         {"id": user_id},
         {"$set": update_data}
     )
+    invalidate_principal(user_id)
     
     return {"message": "Permissions updated successfully"}
 
@@ -5418,6 +5282,7 @@ async def suspend_user(
         {"id": user_id},
         {"$set": {"is_active": False, "suspended": True}}
     )
+    invalidate_principal(user_id)
     
     return {"message": "User suspended successfully"}
 
@@ -5431,6 +5296,7 @@ async def activate_user(
         {"id": user_id},
         {"$set": {"is_active": True, "suspended": False}}
     )
+    invalidate_principal(user_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
@@ -6149,207 +6015,29 @@ async def get_pending_reservations(
 async def get_upcoming_reminders(
     current_user_id: str = Depends(get_current_user)
 ):
-    """Get upcoming events and reservations for reminder badges (24h and 1h)"""
+    """Get upcoming events and reservations for reminder badges (24h and 1h)
+
+    Kullanıcının katılım/rezervasyon sayısından bağımsız sabit sayıda sorgu yapar.
+    """
+    # CRITICAL: current_user bazen dict olabilir, id'yi extract et
+    if isinstance(current_user_id, dict):
+        current_user_id = current_user_id.get("id")
+    
     try:
         now = datetime.now(timezone.utc)
-        within_24h_time = now + timedelta(hours=24)
-        within_1h_time = now + timedelta(hours=1)
-        
-        within_24h = []
-        within_1h = []
-        
-        # Get user's event participations
-        participations = await db.participations.find({
-            "user_id": current_user_id,
-            "status": "approved"
-        }).to_list(1000)
-        
-        for participation in participations:
-            event = await db.events.find_one({"id": participation["event_id"]})
-            if event and event.get("start_date"):
-                event_time = datetime.fromisoformat(event["start_date"].replace('Z', '+00:00'))
-                
-                # Check if event is in the future
-                if event_time > now:
-                    hours_until = (event_time - now).total_seconds() / 3600
-                    
-                    if hours_until <= 1:
-                        within_1h.append({
-                            "id": event["id"],
-                            "title": event.get("title", "Etkinlik"),
-                            "type": "event",
-                            "date": event["start_date"],
-                            "hours_until": round(hours_until, 1),
-                            "location": event.get("city"),
-                        })
-                    elif hours_until <= 24:
-                        within_24h.append({
-                            "id": event["id"],
-                            "title": event.get("title", "Etkinlik"),
-                            "type": "event",
-                            "date": event["start_date"],
-                            "hours_until": round(hours_until, 1),
-                            "location": event.get("city"),
-                        })
-        
-        # Get user's reservations (both made and received)
-        current_user = await db.users.find_one({"id": current_user_id})
         
-        # Reservations made BY user
-        reservations = await db.reservations.find({
-            "user_id": current_user_id,
-            "status": "confirmed"
-        }).to_list(1000)
-        
-        # Reservations made TO user
-        if current_user:
-            user_type = current_user.get("user_type")
-            if user_type in ["player", "coach", "referee", "venue_owner"]:
-                reservations_to_me = await db.reservations.find({
-                    "$or": [
-                        {"player_id": current_user_id},
-                        {"coach_id": current_user_id},
-                        {"referee_id": current_user_id},
-                        {"venue_id": current_user_id}
-                    ],
-                    "status": "confirmed"
-                }).to_list(1000)
-                reservations.extend(reservations_to_me)
-        
-        for reservation in reservations:
-            if reservation.get("date") and reservation.get("start_time"):
-                # Combine date and start_time
-                reservation_date = datetime.fromisoformat(reservation["date"].replace('Z', '+00:00'))
-                start_time = datetime.fromisoformat(reservation["start_time"].replace('Z', '+00:00'))
-                
-                # Create full datetime
-                reservation_datetime = datetime.combine(
-                    reservation_date.date(),
-                    start_time.time(),
-                    tzinfo=timezone.utc
-                )
-                
-                # Check if reservation is in the future
-                if reservation_datetime > now:
-                    hours_until = (reservation_datetime - now).total_seconds() / 3600
-                    
-                    # Get venue name if exists
-                    venue_name = None
-                    if reservation.get("venue_id"):
-                        venue = await db.venues.find_one({"id": reservation["venue_id"]})
-                        if venue:
-                            venue_name = venue.get("name")
-                    
-                    reservation_item = {
-                        "id": reservation["id"],
-                        "title": f"Rezervasyon - {venue_name or 'Yer'}",
-                        "type": "reservation",
-                        "date": reservation["date"],
-                        "start_time": reservation["start_time"],
-                        "hours_until": round(hours_until, 1),
-                        "venue_name": venue_name,
-                    }
-                    
-                    if hours_until <= 1:
-                        within_1h.append(reservation_item)
-                    elif hours_until <= 24:
-                        within_24h.append(reservation_item)
+        participations = await db.participations.find(
+            {"user_id": current_user_id, "status": "approved"}, {"_id": 0, "event_id": 1, "status": 1}
+        ).to_list(None)
         
+        within_24h, within_1h = await load_upcoming_reminders(db, current_user_id, now, participations)
         total_count = len(within_24h) + len(within_1h)
         
         logging.info(f"📅 Calendar reminders for user {current_user_id}: 24h={len(within_24h)}, 1h={len(within_1h)}, total={total_count}")
         
-        # Calendar items için okunmamış sayısını ekle
-        # CRITICAL: current_user bazen dict olabilir, id'yi extract et
-        user_id_for_query = current_user_id
-        if isinstance(current_user_id, dict):
-            user_id_for_query = current_user_id.get("id")
-        
-        logging.info(f"📅 Querying calendar items for user: {user_id_for_query}")
-        
-        # ✅ CRITICAL: Orphaned items'ları da filtrelememiz gerekiyor
-        # Sadece geçerli rezervasyonu olan okunmamış item'ları sayalım
-        valid_unread_count = 0  # ✅ Önce tanımla (exception durumu için)
-        
+        # ✅ Orphaned item'lar hariç okunmamış takvim öğesi sayısı (user_calendar projeksiyonu)
         try:
-            unread_calendar_items_cursor = db.calendar_items.find({
-                "user_id": user_id_for_query,
-                "is_read": False
-            })
-            
-            unread_calendar_items_list = await unread_calendar_items_cursor.to_list(length=1000)
-            
-            # Reservation veya Event olan item'ları filtrele
-            orphaned_ids = []  # Temizlenecek orphaned item'lar
-            
-            for item in unread_calendar_items_list:
-                item_type = item.get("type")
-                item_id = item.get("id", "unknown")
-                
-                logging.info(f"📅 Checking calendar item: {item_id}, type={item_type}")
-                
-                if item_type == "event":
-                    # Event tipi - participation'ın hala var olup olmadığını kontrol et
-                    event_id = item.get("event_id")
-                    logging.info(f"📅 Event item {item_id}: event_id={event_id}")
-                    if event_id:
-                        participation = await db.participations.find_one({
-                            "event_id": event_id,
-                            "user_id": user_id_for_query
-                        })
-                        if participation:
-                            logging.info(f"📅 Event item {item_id}: participation FOUND, status={participation.get('status')}")
-                            valid_unread_count += 1
-                        else:
-                            # Participation silinmiş - orphaned item
-                            orphaned_ids.append(item.get("_id"))
-                            logging.warning(f"⚠️ Orphaned calendar item - no participation: {item_id}")
-                    else:
-                        # event_id yok - muhtemelen orphaned
-                        orphaned_ids.append(item.get("_id"))
-                        logging.warning(f"⚠️ Event calendar item without event_id: {item_id}")
-                elif item_type == "match":
-                    # Match tipi - event_id varsa participation kontrolü yap
-                    event_id = item.get("event_id")
-                    if event_id:
-                        participation = await db.participations.find_one({
-                            "event_id": event_id,
-                            "user_id": user_id_for_query
-                        })
-                        if participation:
-                            valid_unread_count += 1
-                        else:
-                            # Match için participation yok - orphaned
-                            orphaned_ids.append(item.get("_id"))
-                            logging.warning(f"⚠️ Orphaned match calendar item - no participation: {item.get('id')}")
-                    else:
-                        # event_id yok - orphaned
-                        orphaned_ids.append(item.get("_id"))
-                        logging.warning(f"⚠️ Match calendar item without event_id: {item.get('id')}")
-                else:
-                    # Reservation tipi - rezervasyonun var olup olmadığını kontrol et
-                    reservation_id = item.get("reservation_id")
-                    if reservation_id:
-                        reservation = await db.reservations.find_one({"id": reservation_id})
-                        if reservation:
-                            valid_unread_count += 1
-                        else:
-                            orphaned_ids.append(item.get("_id"))
-                            logging.warning(f"⚠️ Orphaned calendar item (badge count) - no reservation: {item.get('id')}")
-                    else:
-                        # reservation_id yok ama type da event değil - orphaned olabilir
-                        orphaned_ids.append(item.get("_id"))
-                        logging.warning(f"⚠️ Calendar item without reservation_id or event type: {item.get('id')}")
-            
-            # Orphaned item'ları otomatik olarak okundu işaretle
-            if orphaned_ids:
-                await db.calendar_items.update_many(
-                    {"_id": {"$in": orphaned_ids}},
-                    {"$set": {"is_read": True}}
-                )
-                logging.info(f"🧹 Auto-marked {len(orphaned_ids)} orphaned calendar items as read")
-            
-            logging.info(f"📅 Calendar unread items: {valid_unread_count} (filtered from {len(unread_calendar_items_list)} total)")
+            valid_unread_count = await count_unread_calendar(db, current_user_id)
         except Exception as count_error:
             logging.error(f"❌ Error counting unread calendar items: {str(count_error)}")
             valid_unread_count = 0
@@ -6373,202 +6061,22 @@ async def get_upcoming_reminders(
 
 @api_router.get("/calendar/items")
 async def get_calendar_items(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Get all calendar items for the current user
     Includes: person reservations (coach, referee, player)
+
+    user_calendar projeksiyonundan tek sorgu ile okunur; start/end verilirse
+    öğeler başlangıç zamanına göre filtrelenir.
     """
     try:
         user_id = current_user.get("id")
         
-        logging.info(f"📅 Fetching calendar items for user: {user_id}")
-        
-        # Calendar items'ları al (ödeme sonrası eklenen rezervasyonlar)
-        calendar_items_cursor = db.calendar_items.find({
-            "user_id": user_id
-        }).sort("created_at", -1)  # En yeni önce
-        
-        calendar_items = await calendar_items_cursor.to_list(length=1000)
-        
-        logging.info(f"📅 Found {len(calendar_items)} calendar items")
-        
-        # Format ve enrich et
-        result_items = []
-        for item in calendar_items:
-            item_type = item.get("type")
-            
-            # Event tipi item'lar için reservation kontrolü yapmadan direkt ekle
-            if item_type == "event":
-                # Event'in gerçek ID'sini bul
-                event_id = item.get("event_id")
-                
-                # Event bilgilerini al (isteğe bağlı - zenginleştirmek için)
-                event = None
-                if event_id:
-                    event = await db.events.find_one({"id": event_id})
-                
-                formatted_item = {
-                    "id": item.get("id"),  # Calendar item ID
-                    "type": item_type,
-                    "title": item.get("title"),
-                    "date": item.get("date"),
-                    "start_time": item.get("start_time"),
-                    "end_time": item.get("end_time"),
-                    "location": item.get("location"),
-                    "description": item.get("description"),
-                    "is_read": item.get("is_read", False),
-                    "created_at": item.get("created_at"),
-                    "event_id": event_id,  # ✅ CRITICAL: Event ID'sini ekle
-                }
-                
-                # Event bilgisi varsa, ek detaylar ekle
-                if event:
-                    formatted_item["event_title"] = event.get("title")
-                    formatted_item["event_city"] = event.get("city")
-                
-                result_items.append(formatted_item)
-                logging.info(f"✅ Added event calendar item: {item.get('title')} (event_id: {event_id})")
-                continue
-            
-            # Reservation tipi item'lar için detayları al
-            # TİPLER: "reservation" (facility rezervasyonu), "reservation_out" (kişi rezervasyonu - giden), "reservation_in" (kişi rezervasyonu - gelen)
-            reservation_id = item.get("reservation_id")
-            reservation = None
-            if reservation_id:
-                reservation = await db.reservations.find_one({"id": reservation_id})
-            
-            logging.info(f"🔍 Processing calendar item: type={item_type}, title={item.get('title')[:30]}, has_reservation={reservation is not None}")
-            
-            # ✅ FACILITY RESERVATION: Eğer type "reservation" ise (facility_fields rezervasyonu), direkt ekle
-            if item_type == "reservation":
-                logging.info(f"  ➡️ Processing as FACILITY RESERVATION")
-                
-                # Tarih formatlarını düzenle - frontend için ISO string
-                date_str = item.get("date")
-                start_time_str = item.get("start_time")
-                end_time_str = item.get("end_time")
-                
-                # Eğer sadece tarih varsa (YYYY-MM-DD), ISO formatına çevir
-                if date_str and isinstance(date_str, str) and len(date_str) == 10:
-                    date_str = f"{date_str}T00:00:00"
-                
-                # Eğer sadece saat varsa (HH:MM), bugünün tarihiyle birleştir
-                if start_time_str and isinstance(start_time_str, str) and len(start_time_str) <= 5:
-                    start_time_str = f"{item.get('date')}T{start_time_str}:00"
-                if end_time_str and isinstance(end_time_str, str) and len(end_time_str) <= 5:
-                    end_time_str = f"{item.get('date')}T{end_time_str}:00"
-                
-                formatted_item = {
-                    "id": item.get("id"),
-                    "type": "facility_reservation",  # Frontend için belirgin tip
-                    "title": item.get("title"),
-                    "date": date_str,
-                    "start_time": start_time_str,
-                    "end_time": end_time_str,
-                    "location": item.get("location"),
-                    "description": item.get("description"),
-                    "is_read": item.get("is_read", False),
-                    "created_at": item.get("created_at"),
-                    "reservation_id": reservation_id,
-                    # ✅ Müşteri bilgilerini ekle (tesis sahibi için)
-                    "customer_name": item.get("customer_name"),
-                    "customer_phone": item.get("customer_phone"),
-                    "customer_id": item.get("customer_id"),
-                }
-                
-                # Reservation detaylarını ekle (eğer varsa)
-                if reservation:
-                    formatted_item["reservation_status"] = reservation.get("status")
-                    formatted_item["payment_status"] = reservation.get("payment_status")
-                    formatted_item["total_price"] = reservation.get("total_price")
-                    formatted_item["facility_id"] = reservation.get("facility_id")
-                    formatted_item["field_id"] = reservation.get("field_id")
-                    
-                    # Eğer calendar item'da müşteri bilgisi yoksa, reservation'dan al
-                    if not formatted_item.get("customer_name") and reservation.get("user_id"):
-                        customer = await db.users.find_one({"id": reservation.get("user_id")})
-                        if customer:
-                            formatted_item["customer_name"] = customer.get("full_name", "")
-                            formatted_item["customer_phone"] = customer.get("phone", "") or customer.get("phone_number", "")
-                            formatted_item["customer_id"] = reservation.get("user_id")
-                    
-                    logging.info(f"  ✅ Added reservation details: status={reservation.get('status')}, customer={formatted_item.get('customer_name')}")
-                else:
-                    logging.warning(f"  ⚠️ No reservation found for reservation_id={reservation_id}")
-                
-                result_items.append(formatted_item)
-                logging.info(f"✅ Added facility reservation calendar item: {item.get('title')}")
-                continue
-            
-            # ✅ CRITICAL: Eğer reservation yoksa (orphaned item), skip et (sadece person reservation için)
-            if not reservation:
-                logging.warning(f"⚠️ Orphaned calendar item found - no reservation: {item.get('id')}")
-                continue
-            
-            # User bilgilerini al (karşı taraf için)
-            other_user = None
-            if reservation:
-                # Eğer giden rezervasyon ise (reservation_out), karşı tarafı bul
-                if item.get("type") == "reservation_out":
-                    # Coach, referee, veya player ID'sini bul
-                    res_type = reservation.get("type") or reservation.get("reservation_type")
-                    if res_type:
-                        other_user_id = reservation.get(f"{res_type}_id")
-                        if other_user_id:
-                            other_user = await db.users.find_one({"id": other_user_id})
-                # Eğer gelen rezervasyon ise (reservation_in), talep edeni bul
-                elif item.get("type") == "reservation_in":
-                    requester_id = reservation.get("user_id")
-                    if isinstance(requester_id, dict):
-                        requester_id = requester_id.get("id")
-                    if requester_id:
-                        other_user = await db.users.find_one({"id": requester_id})
-            
-            formatted_item = {
-                "id": item.get("id"),
-                "type": item.get("type"),
-                "title": item.get("title"),
-                "date": item.get("date"),
-                "hour": item.get("hour"),
-                "is_read": item.get("is_read", False),
-                "created_at": item.get("created_at"),
-                "reservation_id": reservation_id,
-            }
-            
-            # Reservation detaylarını ekle
-            if reservation:
-                formatted_item["reservation_status"] = reservation.get("status")
-                formatted_item["payment_status"] = reservation.get("payment_status")
-                formatted_item["total_price"] = reservation.get("total_price")
-            
-            # Karşı taraf bilgilerini ekle
-            if other_user:
-                formatted_item["other_user"] = {
-                    "id": other_user.get("id"),
-                    "full_name": other_user.get("full_name"),
-                    "phone": other_user.get("phone"),
-                    "user_type": other_user.get("user_type")
-                }
-            
-            # MongoDB _id'yi kaldır
-            formatted_item.pop("_id", None)
-            
-            result_items.append(formatted_item)
-        
-        logging.info(f"📅 Returning {len(result_items)} formatted calendar items")
-        
-        # ✅ DEBUG: Log is_read values
-        for item in result_items[:3]:  # İlk 3 item
-            logging.info(f"📅 DEBUG Item: id={item.get('id')[:8]}..., is_read={item.get('is_read')}, title={item.get('title')}")
-        
-        # ✅ CRITICAL DEBUG: Eğer boş liste döndürüyorsa nedenini logla
-        if len(result_items) == 0 and len(calendar_items) > 0:
-            logging.error(f"❌ CRITICAL: {len(calendar_items)} calendar items bulundu ama hepsi filtrelendi!")
-            for item in calendar_items[:3]:
-                res_id = item.get("reservation_id")
-                res = await db.reservations.find_one({"id": res_id}) if res_id else None
-                logging.error(f"   Calendar Item: {item.get('id')[:15]}... | Res ID: {res_id[:15] if res_id else 'None'}... | Res Exists: {res is not None} | Res Type: {res.get('type') if res else 'N/A'}")
+        result_items = await list_calendar(db, user_id, start=start, end=end)
+        logging.info(f"📅 Returning {len(result_items)} calendar items for user: {user_id}")
         
         return {
             "success": True,
@@ -6578,8 +6086,6 @@ async def get_calendar_items(
         
     except Exception as e:
         logging.error(f"❌ Error fetching calendar items: {str(e)}")
-        import traceback
-        logging.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -6611,6 +6117,7 @@ async def mark_calendar_item_read(
             {"id": item_id},
             {"$set": {"is_read": True}}
         )
+        await set_calendar_read(db, {"_id": item_id})
         
         logging.info(f"✅ Update result: matched={result.matched_count}, modified={result.modified_count}")
         
@@ -6637,6 +6144,7 @@ async def mark_all_calendar_items_read(
             {"user_id": user_id, "is_read": False},
             {"$set": {"is_read": True}}
         )
+        await set_calendar_read(db, {"user_id": user_id, "is_read": False})
         
         logging.info(f"📅 Marked {result.modified_count} calendar items as read")
         
@@ -6654,92 +6162,37 @@ async def mark_all_calendar_items_read(
 async def cleanup_orphaned_calendar_items(
     current_user: dict = Depends(get_current_user)
 ):
-    """Cleanup orphaned calendar items (mark as read) for current user"""
+    """Cleanup orphaned calendar items (mark as read) for current user
+
+    Kullanıcının user_calendar projeksiyonunu bütünlük kontrolü ile onarır,
+    ardından orphaned okunmamış öğeleri okundu işaretler.
+    """
     try:
         user_id = current_user.get("id")
         
         logging.info(f"🧹 Cleaning up orphaned calendar items for user: {user_id}")
+        report = await check_user_calendar(db, user_id=user_id, repair=True)
         
-        # Kullanıcının tüm okunmamış calendar item'larını bul
-        unread_items = await db.calendar_items.find({
-            "user_id": user_id,
-            "is_read": False
-        }).to_list(length=1000)
-        
-        orphaned_count = 0
-        cleaned_ids = []
-        
-        for item in unread_items:
-            item_type = item.get("type")
-            item_id = item.get("id")
-            is_orphaned = False
-            
-            if item_type == "event":
-                # Event için participation kontrol et
-                event_id = item.get("event_id")
-                if event_id:
-                    participation = await db.participations.find_one({
-                        "event_id": event_id,
-                        "user_id": user_id
-                    })
-                    if not participation:
-                        # Event var mı kontrol et
-                        event = await db.events.find_one({"id": event_id})
-                        if not event:
-                            is_orphaned = True
-                            logging.info(f"🧹 Orphaned event calendar item (no event): {item_id}")
-                        else:
-                            # Event var ama participation yok - belki eski katılım
-                            is_orphaned = True
-                            logging.info(f"🧹 Orphaned event calendar item (no participation): {item_id}")
-                else:
-                    # event_id yok
-                    is_orphaned = True
-                    logging.info(f"🧹 Orphaned event calendar item (no event_id): {item_id}")
-                    
-            elif item_type == "match":
-                # Match için event ve participation kontrol et
-                event_id = item.get("event_id")
-                if event_id:
-                    participation = await db.participations.find_one({
-                        "event_id": event_id,
-                        "user_id": user_id
-                    })
-                    if not participation:
-                        is_orphaned = True
-                        logging.info(f"🧹 Orphaned match calendar item: {item_id}")
-                else:
-                    is_orphaned = True
-                    
-            else:
-                # Reservation tipi
-                reservation_id = item.get("reservation_id")
-                if reservation_id:
-                    reservation = await db.reservations.find_one({"id": reservation_id})
-                    if not reservation:
-                        is_orphaned = True
-                        logging.info(f"🧹 Orphaned reservation calendar item: {item_id}")
-                else:
-                    is_orphaned = True
-                    logging.info(f"🧹 Calendar item without reservation_id: {item_id}")
-            
-            if is_orphaned:
-                orphaned_count += 1
-                cleaned_ids.append(item.get("_id"))
+        orphaned = await db.user_calendar.find(
+            {"user_id": user_id, "is_read": False, "orphaned": True}, {"_id": 1}
+        ).to_list(None)
+        orphaned_ids = [doc["_id"] for doc in orphaned]
         
         # Orphaned item'ları okundu işaretle
-        if cleaned_ids:
+        if orphaned_ids:
             result = await db.calendar_items.update_many(
-                {"_id": {"$in": cleaned_ids}},
+                {"id": {"$in": orphaned_ids}},
                 {"$set": {"is_read": True}}
             )
+            await set_calendar_read(db, {"_id": {"$in": orphaned_ids}})
             logging.info(f"🧹 Marked {result.modified_count} orphaned calendar items as read")
         
         return {
             "success": True,
-            "message": f"{orphaned_count} orphaned calendar item temizlendi",
-            "orphaned_count": orphaned_count,
-            "total_unread_checked": len(unread_items)
+            "message": f"{len(orphaned_ids)} orphaned calendar item temizlendi",
+            "orphaned_count": len(orphaned_ids),
+            "total_unread_checked": await db.user_calendar.count_documents({"user_id": user_id, "is_read": False}) + len(orphaned_ids),
+            "projection_repaired": report["repaired"]
         }
         
     except HTTPException:
@@ -6816,6 +6269,7 @@ async def cleanup_orphaned_data(
             if should_delete:
                 logging.warning(f"   ❌ Orphaned calendar item: {item.get('id', 'no-id')[:15]}... - {reason}")
                 await db.calendar_items.delete_one({"_id": item["_id"]})
+                await db.user_calendar.delete_one({"_id": item.get("id") or str(item["_id"])})
                 deleted_calendar_items += 1
         
         # 3. Orphaned Notifications Cleanup
@@ -6851,6 +6305,7 @@ async def cleanup_orphaned_data(
                (receiver_id and receiver_id not in valid_user_ids):
                 logging.warning(f"   ❌ Orphaned message: {msg.get('id', 'no-id')[:15]}...")
                 await db.messages.delete_one({"_id": msg["_id"]})
+                await discount_deleted_message(db, msg)
                 deleted_messages += 1
         
         total_deleted = (deleted_reservations + deleted_calendar_items + 
@@ -7083,6 +6538,7 @@ async def approve_reservation_request(
         except Exception as cal_error:
             logging.error(f"❌ Calendar item creation error (approve): {str(cal_error)}")
             # Hata olsa bile approve işlemi başarılı sayılsın
+        await refresh_user_calendar(db, reservation_ids=[reservation_id])
         
         return {"message": "Rezervasyon onaylandı"}
     except HTTPException:
@@ -7121,11 +6577,14 @@ async def reject_reservation_request(
         if reservation.get("status") != "pending":
             raise HTTPException(status_code=400, detail="Sadece bekleyen rezervasyonlar reddedilebilir")
         
-        # Update reservation status
-        await db.reservations.update_one(
-            {"id": reservation_id},
+        # Update reservation status (only one concurrent reject releases the hours)
+        reservation = await db.reservations.find_one_and_update(
+            {"id": reservation_id, "status": "pending"},
             {"$set": {"status": "rejected", "updated_at": datetime.utcnow()}}
         )
+        if not reservation:
+            raise HTTPException(status_code=400, detail="Sadece bekleyen rezervasyonlar reddedilebilir")
+        await release_reservation(db, reservation)
         
         # Send notification to requester
         notification_data = {
@@ -7169,9 +6628,15 @@ async def approve_reservation(
     if approved_slot not in reservation["time_slots"]:
         raise HTTPException(status_code=400, detail="Invalid time slot")
     
-    # Update reservation
-    await db.reservations.update_one(
-        {"id": reservation_id},
+    # Claim the slot atomically: only one request per venue/date/hour can be approved
+    already_held = reservation.get("status") in ("approved", "paid") and reservation.get("approved_time_slot") == approved_slot
+    if not already_held and not await claim_hours(db, reservation["venue_id"], reservation["date"], slot_hours([approved_slot])):
+        raise HTTPException(status_code=400, detail="This time slot is already booked")
+    
+    # Update reservation only if nobody changed it since it was read
+    previous = await db.reservations.find_one_and_update(
+        {"id": reservation_id, "status": reservation.get("status"),
+         "approved_time_slot": reservation.get("approved_time_slot")},
         {
             "$set": {
                 "status": "approved",
@@ -7182,6 +6647,13 @@ async def approve_reservation(
             }
         }
     )
+    if not previous:
+        if not already_held:
+            await release_hours(db, reservation["venue_id"], reservation["date"], slot_hours([approved_slot]))
+        raise HTTPException(status_code=409, detail="Reservation was updated, please retry")
+    if not already_held:
+        # Re-approval with a different slot frees the previously approved one
+        await release_reservation(db, previous)
     
     # Notify user
     notification_data = {
@@ -7214,10 +6686,13 @@ async def reject_reservation(
     if not venue or venue["owner_id"] != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.reservations.update_one(
-        {"id": reservation_id},
+    previous = await db.reservations.find_one_and_update(
+        {"id": reservation_id, "status": {"$ne": "rejected"}},
         {"$set": {"status": "rejected", "updated_at": datetime.utcnow()}}
     )
+    if not previous:
+        raise HTTPException(status_code=400, detail="Reservation already rejected")
+    await release_reservation(db, previous)
     
     # Notify user
     notification_data = {
@@ -7268,9 +6743,9 @@ async def cancel_reservation(
     if reservation.get("status") == "cancelled":
         raise HTTPException(status_code=400, detail="Rezervasyon zaten iptal edilmiş")
     
-    # Update reservation status
-    await db.reservations.update_one(
-        {"id": reservation_id},
+    # Update reservation status (only one concurrent cancel releases the hours)
+    previous = await db.reservations.find_one_and_update(
+        {"id": reservation_id, "status": {"$ne": "cancelled"}},
         {
             "$set": {
                 "status": "cancelled",
@@ -7280,6 +6755,9 @@ async def cancel_reservation(
             }
         }
     )
+    if not previous:
+        raise HTTPException(status_code=400, detail="Rezervasyon zaten iptal edilmiş")
+    await release_reservation(db, previous)
     
     # Notify reservation owner if cancelled by facility owner or admin
     if user_id != current_user_id:
@@ -7777,26 +7255,29 @@ async def delete_review_admin(
     logging.info(f"Attempting to delete review: {review_id}")
     
     # Try to find and delete the review by id field
-    result = await db.reviews.delete_one({"id": review_id})
-    logging.info(f"Delete by id result: {result.deleted_count}")
+    # (silinen doküman kullanıcının puan toplamlarından düşülür)
+    deleted = await db.reviews.find_one_and_delete({"id": review_id})
+    logging.info(f"Delete by id result: {deleted is not None}")
     
-    if result.deleted_count == 0:
+    if deleted is None:
         # Try with _id as ObjectId
         try:
             from bson import ObjectId
-            result = await db.reviews.delete_one({"_id": ObjectId(review_id)})
-            logging.info(f"Delete by _id ObjectId result: {result.deleted_count}")
+            deleted = await db.reviews.find_one_and_delete({"_id": ObjectId(review_id)})
+            logging.info(f"Delete by _id ObjectId result: {deleted is not None}")
         except Exception as e:
             logging.error(f"ObjectId conversion error: {e}")
     
-    if result.deleted_count == 0:
+    if deleted is None:
         # Try with _id as string
-        result = await db.reviews.delete_one({"_id": review_id})
-        logging.info(f"Delete by _id string result: {result.deleted_count}")
+        deleted = await db.reviews.find_one_and_delete({"_id": review_id})
+        logging.info(f"Delete by _id string result: {deleted is not None}")
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Yorum bulunamadı")
     
+    await apply_review_rating(db, deleted, sign=-1)
+    
     logging.info(f"Review {review_id} deleted by admin {current_user_id}")
     
     return {"message": "Yorum silindi", "review_id": review_id}
@@ -10453,6 +9934,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ASGI entrypoint: /socket.io isteklerini realtime gateway'e, diğer her şeyi FastAPI'ye yönlendirir
+socket_app = socketio.ASGIApp(sio, app)
+
 # Scheduler global referans (lifespan içinde initialize edilir)
 scheduler = None
 
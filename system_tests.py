@@ -14,6 +14,8 @@ import psutil
 import platform
 
 from auth import get_current_user
+from job_lock import run_exclusive
+from message_endpoints import conversation_key
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
@@ -1022,6 +1024,7 @@ class E2ETestRunner:
                 "id": str(uuid.uuid4()),
                 "sender_id": self.current_user.get("id"),
                 "receiver_id": other_user.get("id"),
+                "conversation_key": conversation_key(self.current_user.get("id"), other_user.get("id")),
                 "content": "E2E Test mesajı",
                 "read": False,
                 "created_at": datetime.utcnow(),
@@ -1813,7 +1816,12 @@ def scheduled_health_check():
     try:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        loop.run_until_complete(run_automatic_health_check())
+        # Birden fazla worker'da yalnızca biri çalıştırır (lease kilidi)
+        interval = cron_job_settings["interval_minutes"] * 60
+        loop.run_until_complete(run_exclusive(
+            db, "auto_health_check", run_automatic_health_check,
+            ttl=120, min_interval=interval * 0.8
+        ))
         loop.close()
     except Exception as e:
         logger.error(f"Scheduled health check error: {str(e)}")
@@ -0,0 +1,205 @@
+"""
+Unread Message Counters
+Kullanıcı başına materialize edilmiş okunmamış mesaj sayaçları.
+
+Her kullanıcı için `user_unread_counters` koleksiyonunda tek doküman tutulur
+(_id = user_id):
+    {"_id": user_id, "direct": {sender_id: n}, "groups": {group_id: n}, "seeded": True, "updated_at": ...}
+
+Sayaçlar mesaj gönderme / okundu işaretleme / silme yollarında atomik $inc ile
+güncellenir: okundu işaretlemede sayaç sıfırlanmaz, update_many'nin gerçekten
+değiştirdiği mesaj sayısı kadar azaltılır (arada gelen mesaj sayılmaya devam eder).
+Badge endpoint'leri tek bir primary-key okuması yapar; reconcile_unread_counters()
+periyodik olarak sayaçları mesaj koleksiyonlarından yeniden hesaplar. Henüz hesaplanmamış
+(seeded olmayan) kullanıcıların sayaçları ilk okumada kaynaktan oluşturulur.
+"""
+import logging
+from datetime import datetime
+from typing import Iterable, List
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "user_unread_counters"
+
+
+def group_member_ids(group: dict) -> List[str]:
+    """Grup üye listesini string ID listesine çevir (eski dokümanlarda dict olabilir)"""
+    result = []
+    for member in group.get("member_ids", []):
+        if isinstance(member, dict):
+            member = member.get("id") or member.get("user_id")
+        if member:
+            result.append(member)
+    return result
+
+
+async def increment_direct(db, receiver_id: str, sender_id: str, amount: int = 1):
+    """Alıcının gönderene ait okunmamış sayacını artır"""
+    if not receiver_id or not sender_id:
+        return
+    await db[COLLECTION].update_one(
+        {"_id": receiver_id},
+        {
+            "$inc": {f"direct.{sender_id}": amount},
+            "$set": {"updated_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
+
+
+async def increment_group(db, group: dict, sender_id: str, amount: int = 1):
+    """Gönderen hariç tüm grup üyelerinin grup sayacını artır"""
+    recipients = [m for m in group_member_ids(group) if m != sender_id]
+    if not recipients:
+        return
+    now = datetime.utcnow()
+    field = f"groups.{group['id']}"
+    await db[COLLECTION].bulk_write([
+        UpdateOne({"_id": user_id}, {"$inc": {field: amount}, "$set": {"updated_at": now}}, upsert=True)
+        for user_id in recipients
+    ], ordered=False)
+
+
+async def clear_direct(db, user_id: str, sender_id: str, read_count: int):
+    """Bir konuşmada read_count mesaj okundu olarak işaretlendi: sayacı o kadar azalt"""
+    if not user_id or not sender_id or read_count <= 0:
+        return
+    await db[COLLECTION].update_one(
+        {"_id": user_id},
+        {"$inc": {f"direct.{sender_id}": -read_count}, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+
+async def read_group(db, user_id: str, group_id: str, read_count: int):
+    """Kullanıcı gruptaki read_count mesajı okudu: grup sayacını o kadar azalt"""
+    if not user_id or read_count <= 0:
+        return
+    await db[COLLECTION].update_one(
+        {"_id": user_id},
+        {"$inc": {f"groups.{group_id}": -read_count}, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+
+async def discount_deleted_message(db, message: dict, group: dict = None):
+    """
+    Silinen mesaj okunmamışsa sayaçlardan düş. Direkt mesajda alıcının gönderen
+    sayacı, grup mesajında (group verilir) mesajı okumamış üyelerin grup sayacı azalır.
+    """
+    if not message:
+        return
+    now = datetime.utcnow()
+    if group is None:
+        if not message.get("is_read") and message.get("receiver_id") and message.get("sender_id"):
+            await db[COLLECTION].update_one(
+                {"_id": message.get("receiver_id")},
+                {"$inc": {f"direct.{message.get('sender_id')}": -1}, "$set": {"updated_at": now}}
+            )
+        return
+    read_by = set(message.get("read_by") or [])
+    unread = [m for m in group_member_ids(group) if m != message.get("sender_id") and m not in read_by]
+    if unread:
+        await db[COLLECTION].update_many(
+            {"_id": {"$in": unread}},
+            {"$inc": {f"groups.{group['id']}": -1}, "$set": {"updated_at": now}}
+        )
+
+
+async def clear_group(db, user_ids: Iterable[str], group_id: str):
+    """Kullanıcı gruptan çıkarıldığında grup sayacını sil"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    await db[COLLECTION].update_many(
+        {"_id": {"$in": user_ids}},
+        {"$unset": {f"groups.{group_id}": ""}, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+
+async def get_unread_counters(db, user_id: str) -> dict:
+    """Kullanıcının sayaçlarını tek okumayla getir (sıfır olanlar hariç)"""
+    doc = await db[COLLECTION].find_one({"_id": user_id}) or {}
+    if not doc.get("seeded"):
+        # İlk okuma: mevcut okunmamış mesajlardan sayaçları oluştur
+        doc = await compute_unread_counters(db, user_id)
+        await db[COLLECTION].update_one(
+            {"_id": user_id},
+            {"$set": {**doc, "seeded": True, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+    direct = {k: v for k, v in (doc.get("direct") or {}).items() if v > 0}
+    groups = {k: v for k, v in (doc.get("groups") or {}).items() if v > 0}
+    return {
+        "direct": direct,
+        "groups": groups,
+        "individual_unread": sum(direct.values()),
+        "group_unread": sum(groups.values()),
+    }
+
+
+async def compute_unread_counters(db, user_id: str) -> dict:
+    """Sayaçları mesaj koleksiyonlarından hesapla (eski badge sorgularıyla aynı mantık)"""
+    direct_rows = await db.messages.aggregate([
+        {"$match": {"receiver_id": user_id, "is_read": False}},
+        {"$group": {"_id": "$sender_id", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    direct = {row["_id"]: row["count"] for row in direct_rows if isinstance(row["_id"], str)}
+
+    groups = {}
+    user_groups = await db.group_chats.find({"member_ids": user_id}, {"id": 1}).to_list(None)
+    group_ids = [g["id"] for g in user_groups if g.get("id")]
+    if group_ids:
+        group_rows = await db.group_messages.aggregate([
+            {"$match": {
+                "group_id": {"$in": group_ids},
+                "sender_id": {"$ne": user_id},
+                "read_by": {"$ne": user_id}
+            }},
+            {"$group": {"_id": "$group_id", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        groups = {row["_id"]: row["count"] for row in group_rows}
+
+    return {"direct": direct, "groups": groups}
+
+
+async def reconcile_user_counters(db, user_id: str) -> bool:
+    """Tek kullanıcının sayaçlarını yeniden hesapla; sapma varsa düzelt ve True döndür"""
+    computed = await compute_unread_counters(db, user_id)
+    current = await db[COLLECTION].find_one({"_id": user_id}) or {}
+    current_direct = {k: v for k, v in (current.get("direct") or {}).items() if v > 0}
+    current_groups = {k: v for k, v in (current.get("groups") or {}).items() if v > 0}
+    if (current.get("seeded") and current_direct == computed["direct"]
+            and current_groups == computed["groups"]):
+        return False
+
+    await db[COLLECTION].update_one(
+        {"_id": user_id},
+        {"$set": {**computed, "seeded": True, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return True
+
+
+async def reconcile_unread_counters(db) -> dict:
+    """
+    Sayaç sapmalarını onar: sayacı olan veya okunmamış mesajı bulunan
+    tüm kullanıcılar için sayaçları yeniden hesaplar.
+    """
+    user_ids = set(await db[COLLECTION].distinct("_id"))
+    user_ids.update(await db.messages.distinct("receiver_id", {"is_read": False}))
+    for group in await db.group_chats.find({}, {"member_ids": 1}).to_list(None):
+        user_ids.update(group_member_ids(group))
+
+    repaired = 0
+    for user_id in user_ids:
+        if not isinstance(user_id, str):
+            continue
+        try:
+            if await reconcile_user_counters(db, user_id):
+                repaired += 1
+        except Exception as e:
+            logger.error(f"❌ Unread counter reconcile failed for {user_id}: {e}")
+
+    logger.info(f"🔁 Unread counters reconciled: {repaired}/{len(user_ids)} users repaired")
+    return {"checked": len(user_ids), "repaired": repaired}
@@ -0,0 +1,397 @@
+"""
+User Calendar Projection
+calendar_items + ilgili etkinlik/rezervasyon/kullanıcı bilgilerinden türetilen,
+kullanıcı başına denormalize takvim koleksiyonu (`user_calendar`).
+
+Her calendar item için bir doküman tutulur (_id = calendar item id):
+    {"_id", "user_id", "event_id", "reservation_id", "created_at", "starts_at",
+     "is_read", "listed", "orphaned", "item": {... /calendar/items yanıtındaki öğe ...}}
+
+- listed:   /calendar/items listesinde gösterilir mi
+- orphaned: katılımı / rezervasyonu silinmiş öğe (okunmamış sayısına dahil edilmez)
+
+Takvim öğesi ekleyen/silen, katılım ve rezervasyon durumunu değiştiren yollar
+refresh_user_calendar() çağırır; okuma tarafı tek index'li sorgu yapar.
+Denormalize alanlardaki sapmalar (ör. etkinlik başlığı değişikliği) periyodik
+bütünlük kontrolü ile düzeltilir. Komut satırı:
+
+    python user_calendar.py --check [--user USER_ID]     # farkları raporla
+    python user_calendar.py --rebuild [--user USER_ID]   # projeksiyonu yeniden oluştur
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import DeleteOne, ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "user_calendar"
+BATCH_SIZE = 500
+
+# Bu türlerin geçerliliği katılıma, diğerlerininki rezervasyona bağlıdır
+EVENT_ITEM_TYPES = ("event", "match")
+
+
+def _as_naive_utc(value) -> Optional[datetime]:
+    """
+    datetime veya ISO string'i naive UTC datetime'a çevir (sıralama/aralık sorguları için).
+    Mongo milisaniye sakladığından mikro saniyeler kırpılır; aksi halde --check
+    okunan dokümanı hesaplananla hiç eşleştiremez.
+    """
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _item_start(item: dict) -> Optional[datetime]:
+    """Öğenin başlangıcı: date + start_time (HH:MM) / hour, yoksa date"""
+    date = item.get("date")
+    start_time = item.get("start_time") or item.get("hour")
+    if isinstance(date, str) and len(date) >= 10 and isinstance(start_time, str) and len(start_time) <= 5:
+        return _as_naive_utc(f"{date[:10]}T{start_time}")
+    return _as_naive_utc(start_time) or _as_naive_utc(date)
+
+
+def _user_id(value) -> Optional[str]:
+    if isinstance(value, dict):
+        return value.get("id")
+    return value
+
+
+def _other_user_id(item: dict, reservation: dict) -> Optional[str]:
+    """Kişi rezervasyonunda karşı tarafın ID'si"""
+    if item.get("type") == "reservation_out":
+        # Coach, referee, veya player ID'sini bul
+        res_type = reservation.get("type") or reservation.get("reservation_type")
+        return reservation.get(f"{res_type}_id") if res_type else None
+    if item.get("type") == "reservation_in":
+        return _user_id(reservation.get("user_id"))
+    return None
+
+
+def _format_item(item: dict, event: Optional[dict], reservation: Optional[dict], users: Dict[str, dict]) -> dict:
+    """Takvim öğesini /calendar/items yanıt formatına çevir"""
+    item_type = item.get("type")
+
+    if item_type == "event":
+        formatted = {
+            "id": item.get("id"),
+            "type": item_type,
+            "title": item.get("title"),
+            "date": item.get("date"),
+            "start_time": item.get("start_time"),
+            "end_time": item.get("end_time"),
+            "location": item.get("location"),
+            "description": item.get("description"),
+            "is_read": item.get("is_read", False),
+            "created_at": item.get("created_at"),
+            "event_id": item.get("event_id"),
+        }
+        if event:
+            formatted["event_title"] = event.get("title")
+            formatted["event_city"] = event.get("city")
+        return formatted
+
+    reservation_id = item.get("reservation_id")
+    if item_type == "reservation":
+        # Facility rezervasyonu: tarih formatlarını frontend için ISO string'e çevir
+        date_str = item.get("date")
+        start_time_str = item.get("start_time")
+        end_time_str = item.get("end_time")
+        if date_str and isinstance(date_str, str) and len(date_str) == 10:
+            date_str = f"{date_str}T00:00:00"
+        if start_time_str and isinstance(start_time_str, str) and len(start_time_str) <= 5:
+            start_time_str = f"{item.get('date')}T{start_time_str}:00"
+        if end_time_str and isinstance(end_time_str, str) and len(end_time_str) <= 5:
+            end_time_str = f"{item.get('date')}T{end_time_str}:00"
+
+        formatted = {
+            "id": item.get("id"),
+            "type": "facility_reservation",  # Frontend için belirgin tip
+            "title": item.get("title"),
+            "date": date_str,
+            "start_time": start_time_str,
+            "end_time": end_time_str,
+            "location": item.get("location"),
+            "description": item.get("description"),
+            "is_read": item.get("is_read", False),
+            "created_at": item.get("created_at"),
+            "reservation_id": reservation_id,
+            "customer_name": item.get("customer_name"),
+            "customer_phone": item.get("customer_phone"),
+            "customer_id": item.get("customer_id"),
+        }
+        if reservation:
+            formatted["reservation_status"] = reservation.get("status")
+            formatted["payment_status"] = reservation.get("payment_status")
+            formatted["total_price"] = reservation.get("total_price")
+            formatted["facility_id"] = reservation.get("facility_id")
+            formatted["field_id"] = reservation.get("field_id")
+            # Takvim öğesinde müşteri bilgisi yoksa rezervasyondan al
+            customer = users.get(reservation.get("user_id"))
+            if not formatted.get("customer_name") and customer:
+                formatted["customer_name"] = customer.get("full_name", "")
+                formatted["customer_phone"] = customer.get("phone", "") or customer.get("phone_number", "")
+                formatted["customer_id"] = reservation.get("user_id")
+        return formatted
+
+    # Kişi rezervasyonu (reservation_out / reservation_in)
+    formatted = {
+        "id": item.get("id"),
+        "type": item_type,
+        "title": item.get("title"),
+        "date": item.get("date"),
+        "hour": item.get("hour"),
+        "is_read": item.get("is_read", False),
+        "created_at": item.get("created_at"),
+        "reservation_id": reservation_id,
+    }
+    if reservation:
+        formatted["reservation_status"] = reservation.get("status")
+        formatted["payment_status"] = reservation.get("payment_status")
+        formatted["total_price"] = reservation.get("total_price")
+        other_user = users.get(_other_user_id(item, reservation))
+        if other_user:
+            formatted["other_user"] = {
+                "id": other_user.get("id"),
+                "full_name": other_user.get("full_name"),
+                "phone": other_user.get("phone"),
+                "user_type": other_user.get("user_type")
+            }
+    return formatted
+
+
+async def project_calendar_items(db, items: List[dict]) -> List[dict]:
+    """Takvim öğeleri için projeksiyon dokümanlarını toplu sorgularla oluştur"""
+    if not items:
+        return []
+
+    event_ids = list({i["event_id"] for i in items if i.get("event_id")})
+    reservation_ids = list({i["reservation_id"] for i in items if i.get("reservation_id")})
+    item_user_ids = list({i["user_id"] for i in items if i.get("user_id")})
+
+    events, reservations, joined = {}, {}, set()
+    if event_ids:
+        for event in await db.events.find(
+            {"id": {"$in": event_ids}}, {"_id": 0, "id": 1, "title": 1, "city": 1}
+        ).to_list(None):
+            events[event["id"]] = event
+        for p in await db.participations.find(
+            {"event_id": {"$in": event_ids}, "user_id": {"$in": item_user_ids}},
+            {"_id": 0, "event_id": 1, "user_id": 1}
+        ).to_list(None):
+            joined.add((p["user_id"], p["event_id"]))
+    if reservation_ids:
+        for reservation in await db.reservations.find({"id": {"$in": reservation_ids}}).to_list(None):
+            reservation.pop("_id", None)
+            reservation["user_id"] = _user_id(reservation.get("user_id"))
+            reservations[reservation["id"]] = reservation
+
+    related_user_ids = set()
+    for item in items:
+        reservation = reservations.get(item.get("reservation_id"))
+        if reservation:
+            related_user_ids.add(reservation.get("user_id"))
+            related_user_ids.add(_other_user_id(item, reservation))
+    related_user_ids.discard(None)
+    users = {}
+    if related_user_ids:
+        for user in await db.users.find(
+            {"id": {"$in": list(related_user_ids)}},
+            {"_id": 0, "id": 1, "full_name": 1, "phone": 1, "phone_number": 1, "user_type": 1}
+        ).to_list(None):
+            users[user["id"]] = user
+
+    docs = []
+    for item in items:
+        item_type = item.get("type")
+        event_id = item.get("event_id")
+        reservation = reservations.get(item.get("reservation_id"))
+        if item_type in EVENT_ITEM_TYPES:
+            orphaned = not event_id or (item.get("user_id"), event_id) not in joined
+        else:
+            orphaned = reservation is None
+        docs.append({
+            "_id": item.get("id") or str(item["_id"]),
+            "user_id": item.get("user_id"),
+            "event_id": event_id,
+            "reservation_id": item.get("reservation_id"),
+            "created_at": _as_naive_utc(item.get("created_at")),
+            "starts_at": _item_start(item),
+            "is_read": bool(item.get("is_read", False)),
+            # Etkinlik ve facility rezervasyonları her zaman, kişi rezervasyonları rezervasyon varsa listelenir
+            "listed": item_type in ("event", "reservation") or reservation is not None,
+            "orphaned": orphaned,
+            "item": _format_item(item, events.get(event_id), reservation, users),
+        })
+    return docs
+
+
+def _selector(item_ids=None, user_ids=None, event_ids=None, reservation_ids=None, id_field: str = "id") -> Optional[dict]:
+    """Seçilen öğeler için sorgu (calendar_items'ta id_field="id", projeksiyonda "_id")"""
+    clauses = []
+    if item_ids:
+        clauses.append({id_field: {"$in": list(item_ids)}})
+    if event_ids:
+        clauses.append({"event_id": {"$in": list(event_ids)}})
+    if reservation_ids:
+        clauses.append({"reservation_id": {"$in": list(reservation_ids)}})
+    if user_ids:
+        # Yalnızca user_ids verildiyse kullanıcının tüm öğeleri, aksi halde kullanıcıyla sınırla
+        scope = {"user_id": {"$in": list(user_ids)}}
+        return {"$and": [scope, {"$or": clauses}]} if clauses else scope
+    return {"$or": clauses} if clauses else None
+
+
+async def refresh_user_calendar(
+    db,
+    item_ids: Iterable[str] = None,
+    user_ids: Iterable[str] = None,
+    event_ids: Iterable[str] = None,
+    reservation_ids: Iterable[str] = None,
+) -> int:
+    """
+    Seçilen takvim öğelerinin projeksiyonunu kaynaktan yeniden yaz; kaynağı
+    silinmiş öğeleri projeksiyondan kaldır. Yazılan/silinen doküman sayısını döndürür.
+    Takvim yazma yollarından sonra çağrılır; hata isteği bozmaz (bütünlük kontrolü onarır).
+    """
+    query = _selector(item_ids, user_ids, event_ids, reservation_ids)
+    if query is None:
+        return 0
+    try:
+        items = await db.calendar_items.find(query).to_list(None)
+        docs = await project_calendar_items(db, items)
+        writes = [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs]
+
+        # Projeksiyonda aynı seçiciye uyan ama calendar_items'ta artık olmayanlar
+        stale = await db[COLLECTION].find({"$and": [
+            _selector(item_ids, user_ids, event_ids, reservation_ids, id_field="_id"),
+            {"_id": {"$nin": [doc["_id"] for doc in docs]}},
+        ]}, {"_id": 1}).to_list(None)
+        writes += [DeleteOne({"_id": doc["_id"]}) for doc in stale]
+
+        if writes:
+            await db[COLLECTION].bulk_write(writes, ordered=False)
+        return len(writes)
+    except Exception as e:
+        logger.error(f"❌ User calendar refresh failed: {e}")
+        return 0
+
+
+async def set_calendar_read(db, query: dict):
+    """calendar_items üzerinde okundu işaretlemesini projeksiyona da yansıt (query: projeksiyon alanları)"""
+    await db[COLLECTION].update_many(query, {"$set": {"is_read": True, "item.is_read": True}})
+
+
+async def list_calendar(db, user_id: str, start: datetime = None, end: datetime = None, limit: int = 1000) -> List[dict]:
+    """Kullanıcının takvimi: (user_id, listed, created_at) index'i üzerinden tek sorgu"""
+    query = {"user_id": user_id, "listed": True}
+    if start or end:
+        query["starts_at"] = {k: v for k, v in (("$gte", start), ("$lt", end)) if v}
+    docs = await db[COLLECTION].find(query, {"_id": 0, "item": 1}).sort("created_at", -1).to_list(limit)
+    return [doc["item"] for doc in docs]
+
+
+async def count_unread_calendar(db, user_id: str) -> int:
+    """Orphaned öğeler hariç okunmamış takvim öğesi sayısı"""
+    return await db[COLLECTION].count_documents({"user_id": user_id, "is_read": False, "orphaned": False})
+
+
+def _comparable(doc: dict) -> dict:
+    return {k: v for k, v in doc.items() if k != "_id"}
+
+
+async def check_user_calendar(db, user_id: str = None, repair: bool = False) -> dict:
+    """
+    Projeksiyonu calendar_items'tan yeniden hesaplayıp karşılaştır.
+    repair=True ise eksik/eski dokümanları yazar, fazlaları siler.
+    """
+    scope = {"user_id": user_id} if user_id else {}
+    report = {"checked": 0, "missing": 0, "stale": 0, "extra": 0, "orphaned": 0, "repaired": 0}
+    seen = set()
+    last_id = None
+    while True:
+        query = dict(scope)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        items = await db.calendar_items.find(query).sort("_id", 1).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not items:
+            break
+        last_id = items[-1]["_id"]
+
+        expected = await project_calendar_items(db, items)
+        stored = {
+            doc["_id"]: doc for doc in await db[COLLECTION].find(
+                {"_id": {"$in": [doc["_id"] for doc in expected]}}
+            ).to_list(None)
+        }
+        writes = []
+        for doc in expected:
+            seen.add(doc["_id"])
+            report["checked"] += 1
+            report["orphaned"] += doc["orphaned"]
+            current = stored.get(doc["_id"])
+            if current is None:
+                report["missing"] += 1
+            elif _comparable(current) != _comparable(doc):
+                report["stale"] += 1
+            else:
+                continue
+            writes.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+        if repair and writes:
+            await db[COLLECTION].bulk_write(writes, ordered=False)
+            report["repaired"] += len(writes)
+
+    extra = [
+        doc["_id"] for doc in await db[COLLECTION].find(scope, {"_id": 1}).to_list(None)
+        if doc["_id"] not in seen
+    ]
+    report["extra"] = len(extra)
+    if repair and extra:
+        await db[COLLECTION].delete_many({"_id": {"$in": extra}})
+        report["repaired"] += len(extra)
+
+    logger.info(f"📅 User calendar check{' (repair)' if repair else ''}: {report}")
+    return report
+
+
+async def repair_user_calendar(db) -> dict:
+    """Periyodik bütünlük kontrolü (scheduler job'u)"""
+    return await check_user_calendar(db, repair=True)
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="User calendar projection tools")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--check", action="store_true", help="projeksiyon farklarını raporla")
+    group.add_argument("--rebuild", action="store_true", help="projeksiyonu yeniden oluştur")
+    parser.add_argument("--user", help="yalnızca bu kullanıcı")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.getenv("DB_NAME", "sports_management")]
+    try:
+        report = await check_user_calendar(db, user_id=args.user, repair=args.rebuild)
+        print(report)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
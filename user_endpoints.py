@@ -6,9 +6,10 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from typing import List, Optional
 from datetime import datetime, timezone
 import logging
+from pymongo import ReturnDocument
 
 from models import User
-from auth import get_current_user
+from auth import get_current_user, invalidate_principal
 
 logger = logging.getLogger(__name__)
 
@@ -102,18 +103,15 @@ async def update_profile(
     if not update_dict:
         raise HTTPException(status_code=400, detail="No valid fields to update")
     
-    existing_user = await db.users.find_one({"id": user_id})
-    if not existing_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    result = await db.users.update_one(
+    # Güncelle ve güncel dokümanı tek sorguda al
+    user = await db.users.find_one_and_update(
         {"id": user_id},
-        {"$set": update_dict}
+        {"$set": update_dict},
+        return_document=ReturnDocument.AFTER
     )
-    
-    user = await db.users.find_one({"id": user_id})
     if not user:
-        raise HTTPException(status_code=404, detail="User not found after update")
+        raise HTTPException(status_code=404, detail="User not found")
+    invalidate_principal(user_id)
     
     user_data = {k: v for k, v in user.items() if k not in ["_id", "password_hash", "hashed_password"]}
     return user_data
@@ -274,26 +272,24 @@ async def update_user_profile(
         if user_id != current_user_id:
             raise HTTPException(status_code=403, detail="Can only update own profile")
         
-        existing_user = await db.users.find_one({"id": user_id})
-        if not existing_user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         protected_fields = ["id", "email", "phone", "hashed_password", "password_hash", "_id", "created_at"]
         for field in protected_fields:
             profile_data.pop(field, None)
         
         profile_data["updated_at"] = datetime.now(timezone.utc).isoformat()
         
-        result = await db.users.update_one(
+        updated_user = await db.users.find_one_and_update(
             {"id": user_id},
-            {"$set": profile_data}
+            {"$set": profile_data},
+            return_document=ReturnDocument.AFTER
         )
+        if not updated_user:
+            raise HTTPException(status_code=404, detail="User not found")
+        invalidate_principal(user_id)
         
-        updated_user = await db.users.find_one({"id": user_id})
-        if updated_user:
-            updated_user.pop("hashed_password", None)
-            updated_user.pop("password_hash", None)
-            updated_user.pop("_id", None)
+        updated_user.pop("hashed_password", None)
+        updated_user.pop("password_hash", None)
+        updated_user.pop("_id", None)
         
         logger.info(f"✅ User profile updated: {user_id}")
         return updated_user
@@ -11,6 +11,8 @@ import logging
 import uuid
 
 from auth import get_current_user
+from user_calendar import refresh_user_calendar
+from field_availability import release_reservation
 
 logger = logging.getLogger(__name__)
 
@@ -1340,6 +1342,7 @@ async def execute_create_calendar_event(params: dict, context: dict) -> dict:
         }
         
         await db.calendar_items.insert_one(calendar_event)
+        await refresh_user_calendar(db, item_ids=[calendar_event["id"]])
         logger.info(f"📅 Calendar event created: {calendar_event['id']}")
         
         return {"status": "success", "calendar_event_id": calendar_event["id"]}
@@ -1577,9 +1580,9 @@ async def execute_cancel_reservation(params: dict, context: dict) -> dict:
         if not reservation:
             return {"status": "error", "message": f"Reservation not found: {reservation_id}"}
         
-        # Rezervasyonu iptal et
-        await db.reservations.update_one(
-            {"id": reservation_id},
+        # Rezervasyonu iptal et (zaten iptal edilmişse saatlere tekrar dokunma)
+        previous = await db.reservations.find_one_and_update(
+            {"id": reservation_id, "status": {"$ne": "cancelled"}},
             {
                 "$set": {
                     "status": "cancelled",
@@ -1589,6 +1592,8 @@ async def execute_cancel_reservation(params: dict, context: dict) -> dict:
                 }
             }
         )
+        if previous:
+            await release_reservation(db, previous)
         
         # Kullanıcıya bildirim gönder
         if notify_user and reservation.get("user_id"):